@@ -1,11 +1,13 @@
-from .flux_prompt_generator import FluxPromptGenerator
+from .flux_prompt_generator import FluxPromptGenerator, FluxPromptGeneratorBatch
 
 NODE_CLASS_MAPPINGS = {
-    "FluxPromptGenerator": FluxPromptGenerator
+    "FluxPromptGenerator": FluxPromptGenerator,
+    "FluxPromptGeneratorBatch": FluxPromptGeneratorBatch,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "FluxPromptGenerator": "Flux Prompt Generator"
+    "FluxPromptGenerator": "Flux Prompt Generator",
+    "FluxPromptGeneratorBatch": "Flux Prompt Generator (Batch)",
 }
 
 __all__ = ["NODE_CLASS_MAPPINGS", "NODE_DISPLAY_NAME_MAPPINGS"]
\ No newline at end of file
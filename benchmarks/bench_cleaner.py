@@ -0,0 +1,96 @@
+# benchmarks/bench_cleaner.py
+"""Differential check and micro-benchmark for PromptGenerator.clean_prompt_string.
+
+Usage: python benchmarks/bench_cleaner.py [--corpus 200000] [--seed 0] [--repeat 3]
+
+First compares clean_prompt_string with clean_prompt_string_legacy on a random
+corpus of adversarial strings (whitespace, comma and period runs, BREAK
+markers, duplicate words, weights) and exits with status 1 on the first
+mismatch. Then times both cleaners on generated prompts and adversarial input.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flux_prompt_generator as fpg
+
+# Fragments are glued without separators, so runs and word boundaries combine freely
+FRAGMENTS = [
+    " ", "  ", "\t", "\n", " ", ",", ", ", " ,", ",,", ".", "..", ". ", " .", "...",
+    "a", "A", "Z", "x", "word", "Photo", "of", "as", "a", "with", "an",
+    " of as ", " a as ", " as as ", " with with ", " of as as ", " with with with ",
+    "BREAK_CLIPG", "BREAK_CLIPL", "(soft:1.2)", "(x)", ":", "1.5", "é", "É", "\x1f", "\xa0", "\u2003",
+]
+
+
+def random_text(rng, max_fragments=24):
+    return "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, max_fragments)))
+
+
+def generated_segments(count):
+    """Raw, uncleaned segments exactly as the generator feeds them to the cleaner."""
+    generator = fpg.PromptGenerator(0)
+    spec = fpg.PromptSpec.compile({category: "random" for category in fpg.ALL_CATEGORIES if category not in ("custom", "subject")})
+    texts = []
+    for seed in range(count):
+        generator.rng.seed(seed)
+        segments = generator._assemble_segments(generator._resolve_choices(spec), spec)
+        texts.extend([segments.raw_t5xxl(), segments.raw_clip_l(), segments.raw_clip_g()])
+    return texts
+
+
+def verify(corpus_size, seed):
+    generator = fpg.PromptGenerator(0)
+    rng = random.Random(seed)
+    for index in range(corpus_size):
+        text = random_text(rng)
+        expected = generator.clean_prompt_string_legacy(text)
+        actual = generator.clean_prompt_string(text)
+        if actual != expected:
+            print(f"MISMATCH on case {index}: {text!r}")
+            print(f"  legacy: {expected!r}")
+            print(f"  new:    {actual!r}")
+            return False
+    return True
+
+
+def best_of(repeat, func, texts):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=int, default=200000, help="random strings in the differential check")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the differential corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    if not verify(args.corpus, args.seed):
+        sys.exit(1)
+    print(f"differential check: {args.corpus} random strings identical")
+
+    generator = fpg.PromptGenerator(0)
+    rng = random.Random(args.seed)
+    workloads = [
+        ("generated segments", generated_segments(5000)),
+        ("adversarial, short", [random_text(rng) for _ in range(15000)]),
+        ("adversarial, long", [random_text(rng, 400) for _ in range(500)]),
+    ]
+    for name, texts in workloads:
+        legacy = best_of(args.repeat, generator.clean_prompt_string_legacy, texts)
+        single = best_of(args.repeat, generator.clean_prompt_string, texts)
+        print(f"  {name:20s} legacy {legacy * 1e6 / len(texts):8.2f} us/str   single-pass {single * 1e6 / len(texts):8.2f} us/str   x{legacy / single:.1f}")
+
+
+if __name__ == "__main__":
+    main()
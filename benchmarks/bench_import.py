@@ -0,0 +1,62 @@
+# benchmarks/bench_import.py
+"""Measures import time and vocabulary load time in fresh interpreters.
+
+Usage: python benchmarks/bench_import.py [--runs 20] [--repo PATH]
+
+"import" is `import flux_prompt_generator`; "first use" adds building the node
+inputs, which touches every category list. Runs are done both without the
+vocabulary snapshot (cold) and with it (warm).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time
+start = time.perf_counter()
+import flux_prompt_generator
+imported = time.perf_counter()
+flux_prompt_generator.FluxPromptGenerator.INPUT_TYPES()
+used = time.perf_counter()
+print(imported - start, used - start)
+"""
+
+
+def run_once(repo):
+    output = subprocess.check_output([sys.executable, "-c", PROBE], cwd=repo, text=True)
+    return [float(value) * 1000 for value in output.split()]
+
+
+def snapshot_path(repo):
+    return os.path.join(repo, "data", ".vocabulary.snapshot")
+
+
+def measure(repo, runs, cold):
+    samples = []
+    for _ in range(runs):
+        if cold and os.path.exists(snapshot_path(repo)):
+            os.remove(snapshot_path(repo))
+        samples.append(run_once(repo))
+    return [statistics.median(column) for column in zip(*samples)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="interpreters started per measurement")
+    parser.add_argument("--repo", default=REPO, help="checkout to measure (default: this one)")
+    args = parser.parse_args()
+
+    print(f"median of {args.runs} runs, milliseconds")
+    print(f"  {'':6s} {'import':>8s} {'first use':>10s}")
+    for label, cold in (("cold", True), ("warm", False)):
+        run_once(args.repo) # Prime the OS file cache and __pycache__
+        imported, used = measure(args.repo, args.runs, cold)
+        print(f"  {label:6s} {imported:8.2f} {used:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
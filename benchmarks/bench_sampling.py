@@ -0,0 +1,61 @@
+# benchmarks/bench_sampling.py
+"""Compares the per-call random.Random batch path with the NumPy sampling engine.
+
+Usage: python benchmarks/bench_sampling.py [--count 100000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flux_prompt_generator as fpg
+from vectorized_sampler import VectorizedPromptGenerator
+
+# Every category set to random, like a dataset run
+ALL_RANDOM = {category: "random" for category in fpg.ALL_CATEGORIES if category not in ("custom", "subject")}
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000, help="prompts per batch")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    python_generator = fpg.PromptGenerator(0)
+    numpy_generator = VectorizedPromptGenerator(0)
+    seeds = range(args.count)
+    spec = fpg.PromptSpec.compile(ALL_RANDOM)
+
+    def python_sampling():
+        for seed in seeds:
+            python_generator.rng.seed(seed)
+            python_generator._resolve_choices(spec)
+
+    def numpy_sampling():
+        numpy_generator.resolve_columns(numpy_generator.draw_matrix(0, args.count), spec)
+
+    results = [
+        ("sampling only, random.Random", best_of(args.repeat, python_sampling)),
+        ("sampling only, numpy", best_of(args.repeat, numpy_sampling)),
+        ("full batch, random.Random", best_of(args.repeat, lambda: python_generator.generate_batch(seeds, **ALL_RANDOM))),
+        ("full batch, numpy", best_of(args.repeat, lambda: numpy_generator.generate_batch(seeds, **ALL_RANDOM))),
+    ]
+
+    print(f"{args.count} prompts, best of {args.repeat}")
+    for name, seconds in results:
+        print(f"  {name:32s} {seconds:8.3f} s  {args.count / seconds:12,.0f} prompts/s")
+
+
+if __name__ == "__main__":
+    main()
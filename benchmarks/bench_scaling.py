@@ -0,0 +1,63 @@
+# benchmarks/bench_scaling.py
+"""Throughput of sharded multi-process generation for 1, 2, 4, ... N workers.
+
+Usage: python benchmarks/bench_scaling.py [--count 100000] [--max-workers N] [--shard-size 2000] [--engine python]
+
+Each run is checked against the single-process output; a mismatch exits with status 1.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flux_prompt_generator as fpg
+import sharded
+
+ALL_RANDOM = {category: "random" for category in fpg.ALL_CATEGORIES if category not in ("custom", "subject")}
+
+
+def digest(rows):
+    hasher = hashlib.sha256()
+    for row in rows:
+        hasher.update(repr(row).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000, help="prompts per run")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="largest worker count")
+    parser.add_argument("--shard-size", type=int, default=2000, help="seeds per worker task")
+    parser.add_argument("--engine", choices=sharded.ENGINES, default="python")
+    args = parser.parse_args()
+
+    seeds = range(args.count)
+    generator = sharded.make_generator(args.engine, 0)
+    start = time.perf_counter()
+    prompts, t5xxl, clip_l, clip_g, batch_seeds = generator.generate_batch(seeds, **ALL_RANDOM)
+    baseline = time.perf_counter() - start
+    expected = digest(zip(batch_seeds, prompts, t5xxl, clip_l, clip_g))
+    print(f"{args.count} prompts, engine={args.engine}, shard size {args.shard_size}")
+    print(f"  {'in-process':>10s} {baseline:8.2f} s {args.count / baseline:12,.0f} prompts/s")
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    for workers in worker_counts:
+        start = time.perf_counter()
+        actual = digest(sharded.iter_sharded_rows(seeds, ALL_RANDOM, workers, args.shard_size, args.engine, 0))
+        elapsed = time.perf_counter() - start
+        if actual != expected:
+            print(f"  {workers} workers: output differs from the single-process run")
+            sys.exit(1)
+        print(f"  {workers:3d} workers {elapsed:8.2f} s {args.count / elapsed:12,.0f} prompts/s  x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
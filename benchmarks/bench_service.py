@@ -0,0 +1,141 @@
+# benchmarks/bench_service.py
+"""Load test for the prompt service: p50/p99 latency and throughput of /generate.
+
+Usage: python benchmarks/bench_service.py [--requests 20000] [--concurrency 64] [--copies 4] [--url http://127.0.0.1:8189]
+
+Without --url a service is started in this process on a free port. Every
+connection sends its requests one after the other over a kept-alive
+connection; concurrent requests are what the service coalesces. A few rows are
+first checked against FluxPromptGenerator.execute; a mismatch exits with status 1.
+
+Two scenarios run one after the other: "distinct", where every request has its
+own seed, and "duplicate", where each seed is requested by --copies
+neighbouring connections at about the same time (render workers retrying or
+sharing a seed), so identical requests are answered from one row.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flux_prompt_generator as fpg
+import service
+
+INPUTS = {category: "random" for category in fpg.ALL_CATEGORIES if category not in ("custom", "subject")}
+
+
+def start_local_service(max_batch, max_delay):
+    """Runs a service on a free port in a background thread; returns its URL."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    started = threading.Event()
+
+    def run():
+        async def main():
+            ready = asyncio.Event()
+            task = asyncio.ensure_future(service.serve("127.0.0.1", port, ready=ready, max_batch=max_batch, max_delay=max_delay))
+            await ready.wait()
+            started.set()
+            await task
+
+        asyncio.run(main())
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return f"http://127.0.0.1:{port}"
+
+
+def check_rows(url):
+    client = service.ServiceClient(url)
+    node = fpg.FluxPromptGenerator()
+    kwargs = dict({category: "disabled" for category in fpg.ALL_CATEGORIES}, custom="", subject="", **INPUTS)
+    for seed in (0, 1, 12345, 2**40):
+        row = client.generate(seed, **INPUTS)
+        expected = node.execute(seed=seed, **kwargs)[:5]
+        if (row["prompt"], row["t5xxl"], row["clip_l"], row["clip_g"], str(row["seed"])) != expected:
+            print(f"MISMATCH for seed {seed}")
+            return False
+    client.close()
+    return True
+
+
+async def connection_worker(host, port, seeds, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for seed in seeds:
+            body = json.dumps({"seed": seed, "inputs": INPUTS}).encode("utf-8")
+            start = time.perf_counter()
+            writer.write(b"POST /generate HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+            await writer.drain()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+def scenario_seeds(scenario, requests, copies):
+    """Seeds of every request, in the order they are dealt to the connections."""
+    if scenario == "distinct":
+        return list(range(requests))
+    # Request i goes to connection i % concurrency, so the copies of a seed are sent side by side
+    return [seed for seed in range(-(-requests // copies)) for _ in range(copies)][:requests]
+
+
+async def load(url, seeds, concurrency):
+    parts = urlsplit(url)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(connection_worker(parts.hostname, parts.port, seeds[i::concurrency], latencies) for i in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000, help="requests in total")
+    parser.add_argument("--concurrency", type=int, default=64, help="connections sending requests at the same time")
+    parser.add_argument("--copies", type=int, default=4, help="requests per seed in the duplicate scenario")
+    parser.add_argument("--url", default=None, help="service to test (default: start one in this process)")
+    parser.add_argument("--max-batch", type=int, default=256, help="max_batch of the local service")
+    parser.add_argument("--max-delay-ms", type=float, default=2.0, help="max_delay of the local service")
+    args = parser.parse_args()
+
+    url = args.url or start_local_service(args.max_batch, args.max_delay_ms / 1000)
+    if not check_rows(url):
+        sys.exit(1)
+    client = service.ServiceClient(url)
+    print(f"{args.requests} requests per scenario, {args.concurrency} connections, {url}")
+    for scenario in ("distinct", "duplicate"):
+        before = client.stats()
+        elapsed, latencies = asyncio.run(load(url, scenario_seeds(scenario, args.requests, args.copies), args.concurrency))
+        stats = {name: value - before[name] for name, value in client.stats().items() if name in before}
+        print(f"  {scenario}")
+        print(f"    throughput {args.requests / elapsed:10,.0f} requests/s")
+        print(f"    p50 {percentile(latencies, 0.50) * 1000:8.2f} ms   p99 {percentile(latencies, 0.99) * 1000:8.2f} ms   "
+              f"mean {statistics.mean(latencies) * 1000:8.2f} ms")
+        print(f"    {stats['batches']} batches, {stats['rows']} rows, {stats['coalesced']} coalesced requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# benchmarks/suite.py
+"""Benchmark suite for the generator with JSON baselines.
+
+Usage:
+    python benchmarks/suite.py run [--output results.json] [--only NAME ...] [--skip-large] [--repeat 3]
+    python benchmarks/suite.py compare BASELINE [RESULTS] [--threshold 0.15]
+
+"run" measures every benchmark in a fresh interpreter, so import and
+vocabulary costs are cold and peak memory (max RSS) is per benchmark. It needs
+no network and no optional dependency. Results go to stdout, or to --output.
+
+"compare" checks results (by default a new run) against a baseline, such as
+benchmarks/baselines/baseline.json, and exits with status 1 when a benchmark
+got slower, or used more memory, by more than the threshold. Refresh the
+baseline with `run --output benchmarks/baselines/baseline.json` on the machine
+the numbers are compared on.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(REPO, "benchmarks", "baselines", "baseline.json")
+FORMAT = 1
+
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+
+def all_random():
+    import flux_prompt_generator as fpg
+    return {category: "random" for category in fpg.ALL_CATEGORIES if category not in ("custom", "subject")}
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+# --- Benchmarks ---
+# Each one runs in its own interpreter and returns (seconds, units); units are
+# what the per-unit time is reported for (prompts, strings, ...).
+def bench_import(repeat):
+    # Only the first import in a process is cold, so repeat does not apply
+    start = time.perf_counter()
+    import flux_prompt_generator # noqa: F401
+    return time.perf_counter() - start, 1
+
+
+def _vocabulary_load(repeat, cold):
+    import flux_prompt_generator as fpg
+    import vocabulary
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, vocabulary.SNAPSHOT_FILE_NAME)
+        bundle_path = os.path.join(directory, vocabulary.BUNDLE_FILE_NAME) # Never built: no bundle
+
+        def load():
+            if cold and os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+            vocabulary.VocabularyRegistry(fpg.VOCABULARY.data_dir, fpg.load_json_file, snapshot_path, bundle_path).load_all()
+
+        load() # Writes the snapshot for the warm runs
+        return best_of(repeat, load), len(vocabulary.CATEGORIES)
+
+
+def bench_vocabulary_cold(repeat):
+    return _vocabulary_load(repeat, cold=True)
+
+
+def bench_vocabulary_warm(repeat):
+    return _vocabulary_load(repeat, cold=False)
+
+
+def bench_execute(repeat, count=200):
+    """Node execute calls with every input random, on distinct seeds so the result cache never hits."""
+    import flux_prompt_generator as fpg
+    node = fpg.FluxPromptGenerator()
+    kwargs = dict(all_random(), custom="", subject="")
+
+    def run():
+        fpg.RESULT_CACHE.clear()
+        for seed in range(count):
+            node.execute(seed=seed, **kwargs)
+
+    return best_of(repeat, run), count
+
+
+def _batch(repeat, count):
+    import flux_prompt_generator as fpg
+    generator = fpg.PromptGenerator(0)
+    kwargs = all_random()
+    return best_of(repeat, lambda: generator.generate_batch(range(count), **kwargs)), count
+
+
+def bench_batch_1k(repeat):
+    return _batch(repeat, 1000)
+
+
+def bench_batch_100k(repeat):
+    return _batch(repeat, 100000)
+
+
+def bench_batch_1m(repeat):
+    return _batch(1, 1000000) # One run: the list of a million prompts is the point
+
+
+def _cleaner(repeat, texts):
+    import flux_prompt_generator as fpg
+    generator = fpg.PromptGenerator(0)
+
+    def run():
+        for text in texts:
+            generator.clean_prompt_string(generator.strip_weights_for_natural_language(text))
+
+    return best_of(repeat, run), len(texts)
+
+
+def bench_cleaner_long(repeat):
+    """Generated-looking sentences glued into strings of about 20k characters."""
+    rng = random.Random(0)
+    words = ["a", "portrait", "of", "as", "with", "with", "The", "subject", "is", "standing", "Notable", "features"]
+    texts = [" ".join(rng.choice(words) + rng.choice(["", "", ",", ".", " ,", ".."]) for _ in range(3000)) for _ in range(20)]
+    return _cleaner(repeat, texts)
+
+
+def bench_cleaner_commas(repeat):
+    """Long runs of commas, periods and whitespace between short words."""
+    rng = random.Random(1)
+    separators = [",", ", ", " ,", ",,", " , , ", ".", "..", " .", "\t", "  \n "]
+    texts = ["".join(rng.choice(["x", "Word", ""]) + "".join(rng.choice(separators) for _ in range(rng.randint(1, 12)))
+                     for _ in range(200)) for _ in range(500)]
+    return _cleaner(repeat, texts)
+
+
+def bench_cleaner_parens(repeat):
+    """Nested and weighted parentheses, as written in custom and subject inputs."""
+    rng = random.Random(2)
+
+    def nested(depth):
+        if depth == 0:
+            return rng.choice(["soft light", "red dress", "x"])
+        inner = nested(depth - 1)
+        return rng.choice([f"({inner})", f"({inner}:{rng.uniform(0.5, 1.5):.1f})", f"{inner}, ({inner})"])
+
+    texts = [", ".join(nested(rng.randint(1, 6)) for _ in range(20)) for _ in range(500)]
+    return _cleaner(repeat, texts)
+
+
+BENCHMARKS = {
+    "import": bench_import,
+    "vocabulary_cold": bench_vocabulary_cold,
+    "vocabulary_warm": bench_vocabulary_warm,
+    "execute": bench_execute,
+    "batch_1k": bench_batch_1k,
+    "batch_100k": bench_batch_100k,
+    "batch_1m": bench_batch_1m,
+    "cleaner_long": bench_cleaner_long,
+    "cleaner_commas": bench_cleaner_commas,
+    "cleaner_parens": bench_cleaner_parens,
+}
+LARGE = ("batch_1m",)
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process, or None where the resource module is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # macOS reports bytes, Linux kilobytes
+
+
+def run_child(name, repeat):
+    seconds, units = BENCHMARKS[name](repeat)
+    print(json.dumps({"seconds": seconds, "units": units, "unit_us": seconds * 1e6 / units, "peak_rss": peak_rss_bytes()}))
+
+
+def rules_in_use():
+    """The rules file the generator reads, relative to the repository, or None without rules.
+
+    Prompts drawn under rules take a different path, so results with and
+    without rules are not compared with each other.
+    """
+    import flux_prompt_generator as fpg
+    if fpg.VOCABULARY.rules() is None:
+        return None
+    return os.path.relpath(fpg.VOCABULARY.rules_path, REPO).replace(os.sep, "/")
+
+
+def run_suite(names, repeat, quiet=False):
+    results = {}
+    for name in names:
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "_child", name, str(repeat)], cwd=REPO, text=True)
+        results[name] = json.loads(output.splitlines()[-1])
+        if not quiet:
+            print(f"  {name:16s} {results[name]['seconds']:9.3f} s  {results[name]['unit_us']:12.2f} us/unit", file=sys.stderr)
+    return {
+        "format": FORMAT,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "rules": rules_in_use(),
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Prints a table and returns the names of the benchmarks that regressed beyond threshold."""
+    regressions = []
+    print(f"  {'benchmark':16s} {'baseline':>12s} {'current':>12s} {'change':>8s} {'memory':>8s}")
+    for name, result in current["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            print(f"  {name:16s} {'-':>12s} {result['unit_us']:10.2f}us   (no baseline)")
+            continue
+        change = result["unit_us"] / reference["unit_us"] - 1 if reference["unit_us"] else 0.0
+        memory = None
+        if result.get("peak_rss") and reference.get("peak_rss"):
+            memory = result["peak_rss"] / reference["peak_rss"] - 1
+        flags = []
+        if change > threshold:
+            flags.append("SLOWER")
+        if memory is not None and memory > threshold:
+            flags.append("MORE MEMORY")
+        if flags:
+            regressions.append(name)
+        memory_text = f"{memory:+8.1%}" if memory is not None else f"{'-':>8s}"
+        print(f"  {name:16s} {reference['unit_us']:10.2f}us {result['unit_us']:10.2f}us {change:+8.1%} {memory_text}  {' '.join(flags)}")
+    if baseline.get("platform") != current.get("platform") or baseline.get("python") != current.get("python"):
+        print(f"Note: baseline from Python {baseline.get('python')} on {baseline.get('platform')}, "
+              f"current from Python {current.get('python')} on {current.get('platform')}")
+    if baseline.get("rules") != current.get("rules"):
+        print(f"Note: baseline with rules {baseline.get('rules')}, current with rules {current.get('rules')}; "
+              f"the generation timings measure different configurations")
+    return regressions
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as file:
+        results = json.load(file)
+    if results.get("format") != FORMAT:
+        raise SystemExit(f"{path}: unsupported results format {results.get('format')!r}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks and print or save the results")
+    run.add_argument("--output", "-o", default=None, help="write the results JSON here instead of stdout")
+    compare_parser = commands.add_parser("compare", help="compare results with a baseline")
+    compare_parser.add_argument("baseline", nargs="?", default=BASELINE, help="baseline JSON (default: benchmarks/baselines/baseline.json)")
+    compare_parser.add_argument("results", nargs="?", default=None, help="results JSON (default: run the benchmarks now)")
+    compare_parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown or memory growth")
+    for command in (run, compare_parser):
+        command.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=None, help="benchmarks to run")
+        command.add_argument("--skip-large", action="store_true", help="skip " + ", ".join(LARGE))
+        command.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    child = commands.add_parser("_child")
+    child.add_argument("name", choices=list(BENCHMARKS))
+    child.add_argument("repeat", type=int)
+    args = parser.parse_args()
+
+    if args.command == "_child":
+        run_child(args.name, args.repeat)
+        return
+
+    names = [name for name in (args.only or BENCHMARKS) if not (args.skip_large and name in LARGE)]
+    if args.command == "run":
+        results = run_suite(names, args.repeat)
+        text = json.dumps(results, indent=2) + "\n"
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as file:
+                file.write(text)
+        else:
+            sys.stdout.write(text)
+        return
+
+    baseline = load_results(args.baseline)
+    if args.results:
+        current = load_results(args.results)
+    else:
+        current = run_suite([name for name in names if name in baseline["results"]] or names, args.repeat)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"no regression beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# clip_tokens.py
+"""CLIP token counting and token-budget fitting for the clip_l and clip_g outputs.
+
+CLIP encodes at most 77 tokens, two of which are the start and end markers, so
+``CONTENT_TOKENS`` (75) is what a prompt may use before the encoder truncates it.
+
+``ClipTokenCounter`` reproduces CLIP's tokenizer: the text is lowercased and
+split into pre-tokens (letter runs, single digits, punctuation runs, and the
+``'s``-style contractions), and every pre-token is byte-pair encoded on its
+own. The token count of a string is therefore the sum of the counts of its
+pre-tokens, which are cached, so counting a prompt never re-runs BPE on a
+pre-token that was seen before. The merges table is OpenAI's
+``bpe_simple_vocab_16e6.txt.gz``, the file CLIP and open_clip ship, bundled in
+``data/`` (MIT licensed, see ``data/bpe_simple_vocab_16e6.LICENSE``);
+``FLUX_PROMPT_CLIP_BPE`` points to another copy.
+
+If the file cannot be read, ``exact`` is False and every count is an upper
+bound instead: one token per UTF-8 byte of each pre-token, since BPE starts
+from the bytes and only ever merges them. Fitted outputs then still stay
+within the budget, but lose more than they need to.
+
+``fit_groups`` trims a segment to a budget from per-item counts. A segment
+is groups of items: items are joined with ", ", and the groups with
+``group_separator``. Parts are dropped, or trimmed from their last item, in a
+fixed priority order. Nothing is re-tokenized while it searches.
+"""
+import gzip
+import html
+import os
+import re
+
+CONTEXT_TOKENS = 77
+CONTENT_TOKENS = CONTEXT_TOKENS - 2 # Start and end of text
+BPE_FILE_NAME = "bpe_simple_vocab_16e6.txt.gz"
+ENTRY_CACHE_SIZE = 200000
+
+# CLIP's pre-tokenizer, written for the re module: [^\W\d_]+ is \p{L}+, \d is \p{N},
+# and (?:[^\s\w]|_)+ is [^\s\p{L}\p{N}]+
+_PRE_TOKEN_PATTERN = r"""<\|startoftext\|>|<\|endoftext\|>|'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|(?:[^\s\w]|_)+"""
+_PRE_TOKEN = re.compile(_PRE_TOKEN_PATTERN)
+_PRE_TOKEN_ANY_CASE = re.compile(_PRE_TOKEN_PATTERN, re.IGNORECASE) # For cutting text that was not lowercased
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _bytes_to_unicode():
+    """CLIP's reversible byte -> printable character table."""
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    characters = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            characters.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, map(chr, characters)))
+
+
+def default_bpe_path():
+    return os.environ.get("FLUX_PROMPT_CLIP_BPE") or os.path.join(os.path.dirname(__file__), "data", BPE_FILE_NAME)
+
+
+class ClipTokenCounter:
+    """Counts CLIP tokens; exact with the BPE merges file, an upper bound without it (exact is False)."""
+
+    def __init__(self, bpe_path=None):
+        self.bpe_path = bpe_path or default_bpe_path()
+        self.ranks = None
+        try:
+            with gzip.open(self.bpe_path, "rt", encoding="utf-8") as file:
+                merges = file.read().split("\n")[1:49152 - 256 - 2 + 1]
+            self.ranks = {tuple(merge.split()): rank for rank, merge in enumerate(merges)}
+        except OSError:
+            pass
+        self.exact = self.ranks is not None
+        self.byte_encoder = _bytes_to_unicode()
+        self._pre_token_counts = {}
+        self._entry_counts = {} # Vocabulary entries (and other short texts) -> count
+
+    def count(self, text):
+        """Tokens of text, without the start/end markers."""
+        if not text:
+            return 0
+        counts = self._pre_token_counts
+        total = 0
+        for pre_token in _PRE_TOKEN.findall(_WHITESPACE.sub(" ", html.unescape(html.unescape(text))).strip().lower()):
+            count = counts.get(pre_token)
+            if count is None:
+                count = counts[pre_token] = self._count_pre_token(pre_token)
+            total += count
+        return total
+
+    def count_entry(self, text):
+        """count() of a short text that recurs, such as a vocabulary entry; the result is kept."""
+        count = self._entry_counts.get(text)
+        if count is None:
+            if len(self._entry_counts) >= ENTRY_CACHE_SIZE:
+                self._entry_counts.clear()
+            count = self._entry_counts[text] = self.count(text)
+        return count
+
+    def precount(self, entries):
+        """Counts every entry up front, so fitting prompts later only looks counts up."""
+        for entry in entries:
+            self.count_entry(entry)
+
+    def truncate(self, text, budget):
+        """The longest prefix of text (cut between pre-tokens) that fits in budget tokens."""
+        total = 0
+        end = 0
+        for match in _PRE_TOKEN_ANY_CASE.finditer(text):
+            total += self.count(match.group())
+            if total > budget:
+                return text[:end].rstrip(" ,")
+            end = match.end()
+        return text
+
+    def _count_pre_token(self, pre_token):
+        if self.ranks is None:
+            # Fallback upper bound: no merges, one token per byte. A per-word rate
+            # (one token per few letters) undercounts rare names such as "lyubov"
+            return len(pre_token.encode("utf-8"))
+        return len(_bpe(self.ranks, "".join(self.byte_encoder[byte] for byte in pre_token.encode("utf-8"))))
+
+
+def _bpe(ranks, token):
+    """CLIP's byte-pair encoding of one pre-token (already byte-encoded): the list of its tokens."""
+    word = tuple(token[:-1]) + (token[-1] + "</w>",)
+    if len(word) == 1:
+        return list(word)
+    while True:
+        pairs = set(zip(word, word[1:]))
+        bigram = min(pairs, key=lambda pair: ranks.get(pair, float("inf")))
+        if bigram not in ranks:
+            break
+        first, second = bigram
+        merged = []
+        i = 0
+        while i < len(word):
+            try:
+                j = word.index(first, i)
+            except ValueError:
+                merged.extend(word[i:])
+                break
+            merged.extend(word[i:j])
+            i = j
+            if word[i] == first and i < len(word) - 1 and word[i + 1] == second:
+                merged.append(first + second)
+                i += 2
+            else:
+                merged.append(word[i])
+                i += 1
+        word = tuple(merged)
+        if len(word) == 1:
+            break
+    return list(word)
+
+
+# --- Budget fitting ---
+class BudgetItem:
+    """One comma-separated term of a segment, with its token count."""
+
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text, tokens):
+        self.text = text
+        self.tokens = tokens
+
+
+def _trailing_punctuation(text):
+    match = re.search(r"(?:[^\s\w]|_)+$", text)
+    return match.group() if match else ""
+
+
+def fit_groups(groups, budget, counter, drop_order, group_separator=" ", trim=()):
+    """Trims groups ([[(part name, [BudgetItem, ...]), ...], ...]) in place to at most budget tokens.
+
+    Parts are removed in drop_order; a part named in trim first loses its items
+    one at a time, from the last. When one item is left and still too long, it
+    is cut between pre-tokens. Returns the token count of the result.
+    """
+    comma = counter.count(",")
+    separator_tokens = counter.count(group_separator)
+
+    def total():
+        tokens = 0
+        groups_used = 0
+        for group in groups:
+            items = [item for _, part_items in group for item in part_items]
+            if not items:
+                continue
+            groups_used += 1
+            tokens += sum(item.tokens for item in items) + comma * (len(items) - 1)
+            for item in items[:-1]: # ")" + "," is one pre-token, not two
+                tail = _trailing_punctuation(item.text)
+                if tail:
+                    tokens += counter.count(tail + ",") - counter.count(tail) - comma
+        return tokens + separator_tokens * max(groups_used - 1, 0)
+
+    parts = {part_name: items for group in groups for part_name, items in group}
+    tokens = total()
+    for index, name in enumerate(drop_order):
+        items = parts.get(name)
+        while items and tokens > budget:
+            if len(items) > 1 and name in trim:
+                items.pop()
+            elif any(parts.get(later) for later in drop_order[index + 1:]):
+                items.clear()
+            else: # The last part left: cut its item short rather than leave the segment empty
+                text = counter.truncate(items[0].text, items[0].tokens - (tokens - budget))
+                items[:] = [BudgetItem(text, counter.count(text))] if text else []
+            tokens = total()
+    return tokens
+
+
+def join_groups(groups, group_separator=" "):
+    """The segment text of fitted groups."""
+    texts = [", ".join(item.text for _, items in group for item in items) for group in groups]
+    return group_separator.join(text for text in texts if text)
@@ -0,0 +1,267 @@
+# coverage_stats.py
+"""Optional vocabulary coverage and distribution statistics for generation runs.
+
+``PromptGenerator(stats=CoverageStats())`` counts, for every prompt the
+generator draws or updates with ``regenerate``, what each category ended up as:
+
+- the entry it used, counted in a per-category ``array("Q")`` (a dict maps
+  the entry text to its slot, so entries are counted by text and a hot reload
+  needs no remapping);
+- otherwise why it was left out: ``disabled`` (by its input), ``empty`` (an
+  empty value was chosen), ``not_drawn`` (e.g. body_types without a default
+  tag) or ``hidden`` (facial_hair when makeup_styles is present).
+
+Which categories a prompt used is also kept as one bitmask per prompt, counted
+per distinct mask, which is all the category co-occurrence report needs. Entry
+pairs of chosen categories (``pairs=[("artist", "lighting")]``) are counted
+too. Recording is a handful of dict and array operations per category, and a
+generator without stats runs the plain methods.
+
+``snapshot()`` is plain JSON; ``merge`` adds snapshots from other shards or
+processes, in any order. ``report(lists)`` summarizes coverage and skew per
+category against the current vocabulary lists, and ``render_report`` prints it.
+"""
+import math
+from array import array
+from collections import Counter
+
+try:
+    from . import vocabulary
+except ImportError:  # Loaded as a top-level module (scripts, benchmarks)
+    import vocabulary
+
+OUTCOMES = ("disabled", "empty", "not_drawn", "hidden")
+TOP_ENTRIES = 5
+PLAN_CACHE_SIZE = 256 # PromptSpecs whose recording plan is kept; the cache starts over when full
+
+
+class CoverageStats:
+    """Per-category entry and outcome counters of the prompts a generator draws; not thread-safe.
+
+    categories defaults to every vocabulary category; pairs lists the
+    (category, category) pairs whose entries are counted together.
+    """
+
+    def __init__(self, categories=vocabulary.CATEGORIES, pairs=()):
+        self.categories = tuple(categories)
+        self.pairs = tuple(tuple(pair) for pair in pairs)
+        for pair in self.pairs:
+            if len(pair) != 2 or not set(pair) <= set(self.categories):
+                raise ValueError(f"pairs must be two of the categories, got {pair!r}")
+        self.prompts = 0
+        self._slots = {category: {} for category in self.categories} # category -> {entry: slot}
+        self._entries = {category: [] for category in self.categories} # category -> entries by slot
+        self._counts = {category: array("Q") for category in self.categories}
+        self._outcomes = {category: array("Q", bytes(8 * len(OUTCOMES))) for category in self.categories}
+        self._disabled = Counter() # Disabled categories of a spec (a tuple) -> prompts
+        self._masks = Counter() # Bitmask of the categories a prompt used -> prompts
+        self._pair_counts = {pair: Counter() for pair in self.pairs} # (entry, entry) -> prompts
+        self._paired = {category for pair in self.pairs for category in pair}
+        self._plans = {} # PromptSpec -> (disabled categories, [(category, bit, multiple, slots, counts, outcomes)]), at most PLAN_CACHE_SIZE
+
+    def instrument(self, generator):
+        """Shadows generator._draw_choices and _update (incremental regeneration) with versions that record every prompt's choices."""
+        draw_choices = generator._draw_choices
+        update = generator._update
+        record = self.record
+
+        def counted(spec):
+            choices = draw_choices(spec)
+            record(spec, choices)
+            return choices
+
+        def counted_update(previous, spec, seed):
+            result = update(previous, spec, seed)
+            record(spec, result[0])
+            return result
+
+        generator._draw_choices = counted
+        generator._update = counted_update
+
+    def _plan(self, spec):
+        if len(self._plans) >= PLAN_CACHE_SIZE:
+            self._plans.clear()
+        disabled, plan = [], []
+        for bit, category in enumerate(self.categories):
+            mode = spec.categories[category].mode
+            if mode == "disabled":
+                disabled.append(category)
+            else:
+                plan.append((category, 1 << bit, mode == "multiple",
+                             self._slots[category], self._counts[category], self._outcomes[category]))
+        self._plans[spec] = plan = (tuple(disabled), plan)
+        return plan
+
+    def _slot(self, category, entry):
+        slot = self._slots[category][entry] = len(self._entries[category])
+        self._entries[category].append(entry)
+        self._counts[category].append(0)
+        return slot
+
+    def record(self, spec, choices):
+        """Counts one prompt: spec is its PromptSpec, choices the resolved choices."""
+        plan = self._plans.get(spec) or self._plan(spec)
+        self.prompts += 1
+        if plan[0]:
+            self._disabled[plan[0]] += 1
+        mask = 0
+        hides_facial_hair = bool(choices.get("makeup_styles"))
+        paired = {} if self._paired else None
+        for category, bit, multiple, slots, counts, outcomes in plan[1]:
+            value = choices.get(category)
+            if not value:
+                outcomes[1 if value == "" else 2] += 1
+                continue
+            if hides_facial_hair and category == "facial_hair":
+                outcomes[3] += 1
+                continue
+            mask |= bit
+            if multiple: # Multiple-choice values (lighting) are several entries, joined
+                entries = value.split(", ")
+                for entry in entries:
+                    slot = slots.get(entry)
+                    counts[slot if slot is not None else self._slot(category, entry)] += 1
+            else:
+                entries = (value,)
+                slot = slots.get(value)
+                counts[slot if slot is not None else self._slot(category, value)] += 1
+            if paired is not None and category in self._paired:
+                paired[category] = entries
+        self._masks[mask] += 1
+        if paired:
+            for (first, second), counter in self._pair_counts.items():
+                for first_entry in paired.get(first, ()):
+                    for second_entry in paired.get(second, ()):
+                        counter[first_entry, second_entry] += 1
+
+    def snapshot(self):
+        """JSON-serializable counters: see merge."""
+        outcomes = {category: dict(zip(OUTCOMES, counts)) for category, counts in self._outcomes.items()}
+        for disabled, prompts in self._disabled.items():
+            for category in disabled:
+                outcomes[category]["disabled"] += prompts
+        return {
+            "categories": list(self.categories),
+            "prompts": self.prompts,
+            "entries": {category: {entry: count for entry, count in zip(self._entries[category], self._counts[category]) if count}
+                        for category in self.categories},
+            "outcomes": outcomes,
+            "masks": sorted([mask, count] for mask, count in self._masks.items()),
+            "pairs": {",".join(pair): [[first, second, count] for (first, second), count in counter.items()]
+                      for pair, counter in self._pair_counts.items()},
+        }
+
+    def reset(self):
+        self.__init__(self.categories, self.pairs)
+
+    def merge(self, snapshot):
+        """Adds the counters of a snapshot (e.g. of another shard or process) to these."""
+        self.prompts += snapshot["prompts"]
+        for category, entries in snapshot["entries"].items():
+            if category not in self._slots:
+                continue
+            slots, counts = self._slots[category], self._counts[category]
+            for entry, count in entries.items():
+                slot = slots.get(entry)
+                counts[slot if slot is not None else self._slot(category, entry)] += count
+        for category, outcomes in snapshot["outcomes"].items():
+            if category in self._outcomes:
+                for index, outcome in enumerate(OUTCOMES):
+                    self._outcomes[category][index] += outcomes.get(outcome, 0)
+        # Mask bits follow the category order of the snapshot
+        bits = [1 << self.categories.index(category) if category in self.categories else 0
+                for category in snapshot["categories"]]
+        for mask, count in snapshot["masks"]:
+            self._masks[sum(bit for index, bit in enumerate(bits) if mask >> index & 1)] += count
+        for key, pair_counts in snapshot.get("pairs", {}).items():
+            counter = self._pair_counts.get(tuple(key.split(",")))
+            if counter is not None:
+                for first, second, count in pair_counts:
+                    counter[first, second] += count
+
+    def co_occurrence(self):
+        """{category: {other category: prompts that used both}}, over the categories that were used at all."""
+        bits = [(category, 1 << bit) for bit, category in enumerate(self.categories)]
+        together = {}
+        for mask, count in self._masks.items():
+            present = [category for category, bit in bits if mask & bit]
+            for category in present:
+                row = together.setdefault(category, {})
+                for other in present:
+                    row[other] = row.get(other, 0) + count
+        return together
+
+    def report(self, lists=None):
+        """Summary per category; lists (a mapping such as VOCABULARY) adds coverage of the full lists.
+
+        Per category: used (prompts with an entry), the outcome counts,
+        distinct entries, the most used entries and max_share, the top
+        entry's share of all uses. With lists also: list_size, coverage (the
+        share of the list used at least once, covered entries in all), unlisted
+        (uses of values not in the list), evenness (entropy of the uses over the list divided by its
+        maximum, 1.0 when every entry is used equally often) and skew (top
+        count over the mean count per entry).
+        """
+        snapshot = self.snapshot()
+        categories = {}
+        for category in self.categories:
+            entries = snapshot["entries"][category]
+            uses = sum(entries.values())
+            top = sorted(entries.items(), key=lambda item: (-item[1], item[0]))[:TOP_ENTRIES]
+            summary = dict(snapshot["outcomes"][category])
+            summary.update({
+                "used": self.prompts - sum(summary.values()),
+                "distinct": len(entries),
+                "top": [[entry, count] for entry, count in top],
+                "max_share": top[0][1] / uses if uses else 0.0,
+            })
+            if lists is not None:
+                values = set(lists[category])
+                # Sorted, so that the float sums do not depend on the order the entries were first seen in
+                listed = sorted(count for entry, count in entries.items() if entry in values)
+                listed_uses = sum(listed)
+                entropy = -sum(count / listed_uses * math.log(count / listed_uses) for count in listed) if listed_uses else 0.0
+                summary.update({
+                    "list_size": len(values),
+                    "covered": len(listed),
+                    "coverage": len(listed) / len(values) if values else 0.0,
+                    "unlisted": uses - listed_uses,
+                    "evenness": entropy / math.log(len(values)) if len(values) > 1 else 1.0,
+                    "skew": max(listed) * len(values) / listed_uses if listed_uses else 0.0,
+                })
+            categories[category] = summary
+        pairs = {}
+        for key, pair_counts in snapshot["pairs"].items():
+            ordered = sorted(pair_counts, key=lambda item: (-item[2], item[0], item[1]))
+            pairs[key] = {"total": sum(item[2] for item in pair_counts), "distinct": len(pair_counts),
+                          "top": ordered[:TOP_ENTRIES]}
+        return {"prompts": self.prompts, "categories": categories, "co_occurrence": self.co_occurrence(), "pairs": pairs}
+
+
+def render_report(report):
+    """Text table of a report: one line per category that was used or suppressed, then the entry pairs."""
+    prompts = report["prompts"]
+    lines = [f"Coverage over {prompts} prompts"]
+    header = f"  {'category':<20} {'used':>7} {'coverage':>13} {'evenness':>8} {'skew':>6}  top entry"
+    lines.append(header)
+    left_out = []
+    for category, summary in report["categories"].items():
+        if summary["disabled"] == prompts:
+            continue
+        if "list_size" in summary:
+            coverage = f"{summary['covered']}/{summary['list_size']}"
+            evenness, skew = f"{summary['evenness']:.2f}", f"{summary['skew']:.1f}"
+        else:
+            coverage, evenness, skew = str(summary["distinct"]), "-", "-"
+        top = f"{summary['top'][0][0][:40]} ({summary['max_share']:.1%})" if summary["top"] else "-"
+        lines.append(f"  {category:<20} {summary['used'] / prompts if prompts else 0:>7.1%} {coverage:>13} {evenness:>8} {skew:>6}  {top}")
+        reasons = [f"{outcome} {summary[outcome]}" for outcome in OUTCOMES[1:] if summary[outcome]]
+        if reasons:
+            left_out.append(f"  {category:<20} {', '.join(reasons)}")
+    if left_out:
+        lines.append("Left out (prompts)")
+        lines.extend(left_out)
+    for key, pair in report["pairs"].items():
+        lines.append(f"Pairs {key}: {pair['distinct']} distinct of {pair['total']}")
+        lines.extend(f"  {first[:40]} + {second[:40]}: {count}" for first, second, count in pair["top"])
+    return "\n".join(lines)
@@ -0,0 +1,225 @@
+# dedup.py
+"""Streaming near-duplicate filter for generated prompts.
+
+Prompts from different seeds often share almost every sentence, because some
+categories hold near-identical entries. ``NearDuplicateFilter`` drops a prompt
+when its Jaccard similarity to a recently kept prompt reaches the threshold.
+The similarity is measured over word n-gram shingles.
+
+Candidates are found with a MinHash signature built with one-permutation
+hashing. Every shingle is hashed once. The hash picks one of ``num_hashes``
+buckets, and each bucket keeps its minimum. Empty buckets are filled from their
+right-hand neighbour (rotation densification). So a signature costs one pass
+over the shingles, not ``num_hashes`` passes. By default the bucket count is
+sized from the first prompt, to the power of two nearest its shingle count
+(16 to 128): with far more buckets than shingles, most buckets are copies and
+the estimate is poor. Signatures are split into bands for locality-sensitive
+hashing. A prompt is only compared with the kept prompts that share a whole
+band with it, at most ``BAND_SLOTS`` of the latest per band, and each of those
+is confirmed with the exact Jaccard of the stored shingle hashes. The signature
+only picks candidates, so no prompt is dropped on an estimate.
+
+Memory is bounded by ``window``. The index is kept in two generations of at
+most ``window // 2`` prompts each. When the newer generation is full, the older
+one is discarded whole. A prompt is therefore compared with between
+``window // 2`` and ``window`` of the latest kept prompts. A kept prompt
+stores its shingle hashes (8 bytes each) and one slot per band: about 2.5 KB
+for t5xxl text at threshold 0.8, 0.6 KB for clip text. Each filter also
+caches the per-position hash terms of up to ``_WORD_CACHE_SIZE`` (16384)
+distinct words, about 300 bytes per word at the default shingle size, so about
+5 MB at most. The cache starts over when full. Hashes are deterministic, so a
+run drops the same rows every time.
+"""
+import re
+import time
+import zlib
+from array import array
+
+_WORD = re.compile(r"\w+")
+_MASK64 = (1 << 64) - 1
+# Odd 64-bit multipliers for the word positions of a shingle
+_POSITION_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                         0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9)
+_WORD_CACHE_SIZE = 16384 # Distinct words cached per filter; every vocabulary list together has about 3,700
+_ROTATION_OFFSET = 1 << 58 # Above every bucket minimum (64 bits less the bucket bits)
+BAND_SLOTS = 8 # Latest kept prompts remembered per band key
+MIN_HASHES, MAX_HASHES = 16, 128 # Bounds of the bucket count sized from the first prompt
+
+
+def choose_bands(num_hashes, threshold):
+    """Rows per band for num_hashes: the largest whose LSH threshold (1/b)^(1/r) is at most threshold."""
+    best = 1
+    for rows in range(1, num_hashes + 1):
+        if num_hashes % rows == 0 and (rows / num_hashes) ** (1 / rows) <= threshold:
+            best = rows
+    return best
+
+
+def scaled_num_hashes(shingles):
+    """The power of two nearest the shingle count, within MIN_HASHES and MAX_HASHES."""
+    num_hashes = MIN_HASHES
+    while num_hashes < MAX_HASHES and num_hashes * 3 < shingles * 2:
+        num_hashes *= 2
+    return num_hashes
+
+
+class NearDuplicateFilter:
+    """Drops prompts that are near-duplicates of a recently kept prompt.
+
+    ``threshold`` is the shingle Jaccard similarity from which a prompt counts
+    as a duplicate. ``num_hashes`` defaults to ``scaled_num_hashes`` of the
+    first prompt, and ``rows_per_band`` to ``choose_bands``. ``metrics``,
+    an instrumentation.Metrics, gets a "dedup" stage timing every check and a
+    "dedup_dropped" stage counting the drops.
+    """
+
+    def __init__(self, threshold=0.8, num_hashes=None, rows_per_band=None, shingle_size=3, window=50000, metrics=None):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold!r}")
+        if num_hashes is not None and (num_hashes < 1 or num_hashes & (num_hashes - 1)):
+            raise ValueError(f"num_hashes must be a power of two, got {num_hashes!r}")
+        if not 1 <= shingle_size <= len(_POSITION_MULTIPLIERS):
+            raise ValueError(f"shingle_size must be 1-{len(_POSITION_MULTIPLIERS)}, got {shingle_size!r}")
+        self.threshold = threshold
+        self.num_hashes = None
+        self.rows_per_band = rows_per_band
+        self.shingle_size = shingle_size
+        self.window = window
+        self.metrics = metrics
+        if num_hashes is not None:
+            self._size(num_hashes)
+        self._word_terms_cache = {}
+        # Generations of (band key -> offsets of kept prompts, [shingle count, shingle hashes...] back to back), newest first
+        self._generations = [({}, array("Q")), ({}, array("Q"))]
+        self._newest_size = 0 # Prompts in the newest generation
+        self.seen = 0
+        self.dropped = 0
+
+    def _size(self, num_hashes):
+        rows_per_band = self.rows_per_band or choose_bands(num_hashes, self.threshold)
+        if num_hashes % rows_per_band:
+            raise ValueError(f"rows_per_band must divide num_hashes ({num_hashes}), got {rows_per_band!r}")
+        self.num_hashes = num_hashes
+        self.rows_per_band = rows_per_band
+        self._bucket_bits = num_hashes.bit_length() - 1
+
+    @property
+    def drop_rate(self):
+        return self.dropped / self.seen if self.seen else 0.0
+
+    def stats(self):
+        return {"seen": self.seen, "dropped": self.dropped, "kept": self.seen - self.dropped, "drop_rate": self.drop_rate}
+
+    def _word_terms(self, word):
+        """The word's hash times each position multiplier, cached per word."""
+        if len(self._word_terms_cache) >= _WORD_CACHE_SIZE:
+            self._word_terms_cache.clear()
+        word_hash = zlib.crc32(word.encode("utf-8")) + 1
+        terms = self._word_terms_cache[word] = tuple(multiplier * word_hash for multiplier in _POSITION_MULTIPLIERS[:self.shingle_size])
+        return terms
+
+    def _shingle_hashes(self, text):
+        """64-bit hashes of the word shingles of text: the sum of each word's hash times its position multiplier."""
+        cache = self._word_terms_cache
+        words = [cache.get(word) or self._word_terms(word) for word in _WORD.findall(text.lower())]
+        size = min(self.shingle_size, len(words))
+        columns = [[terms[position] for terms in words[position:]] for position in range(size)]
+        return [value & _MASK64 for value in map(sum, zip(*columns))]
+
+    def signature(self, text):
+        """The one-permutation MinHash of text, a list of num_hashes ints; None for text without words."""
+        shingles = set(self._shingle_hashes(text))
+        return self._signature(shingles) if shingles else None
+
+    def _signature(self, shingles):
+        if self.num_hashes is None:
+            self._size(scaled_num_hashes(len(shingles)))
+        num_hashes = self.num_hashes
+        bucket_mask = num_hashes - 1
+        # The low bits of a hash pick its bucket; in descending order the last hash kept per bucket is the minimum
+        minimums = {value & bucket_mask: value for value in sorted(shingles, reverse=True)}
+        bits = self._bucket_bits
+        if len(minimums) == num_hashes:
+            return [minimums[index] >> bits for index in range(num_hashes)]
+        # Rotation: an empty bucket takes the value of the next filled one (wrapping around),
+        # offset by the distance so that the copies differ from the original
+        filled = sorted(minimums)
+        signature = []
+        previous = -1
+        for index in filled:
+            value = minimums[index] >> bits
+            signature.extend([value + (index - empty) * _ROTATION_OFFSET for empty in range(previous + 1, index)])
+            signature.append(value)
+            previous = index
+        first = minimums[filled[0]] >> bits
+        signature.extend([first + (filled[0] + num_hashes - empty) * _ROTATION_OFFSET for empty in range(previous + 1, num_hashes)])
+        return signature
+
+    def _band_keys(self, signature):
+        rows = self.rows_per_band
+        return [hash((band,) + tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.num_hashes // rows)]
+
+    def check(self, text):
+        """Whether text is a near-duplicate of a kept prompt. Text that is not becomes a kept prompt."""
+        start = time.perf_counter() if self.metrics is not None else 0.0
+        self.seen += 1
+        duplicate = False
+        shingles = set(self._shingle_hashes(text))
+        if shingles:
+            keys = self._band_keys(self._signature(shingles))
+            duplicate = self._matches(keys, shingles)
+            if not duplicate:
+                self._insert(keys, shingles)
+        if duplicate:
+            self.dropped += 1
+        if self.metrics is not None:
+            self.metrics.record("dedup", time.perf_counter() - start)
+            if duplicate:
+                self.metrics.record("dedup_dropped", 0.0)
+        return duplicate
+
+    def _matches(self, keys, shingles):
+        """Whether a kept prompt that shares a band with these keys has an exact shingle Jaccard of threshold or more."""
+        threshold = self.threshold
+        size = len(shingles)
+        contains = shingles.__contains__
+        for index, kept in self._generations:
+            compared = set()
+            for key in keys:
+                for offset in index.get(key, ()):
+                    if offset in compared:
+                        continue
+                    compared.add(offset)
+                    kept_size = kept[offset]
+                    if min(size, kept_size) < threshold * max(size, kept_size):
+                        continue # Jaccard is at most the ratio of the sizes
+                    common = sum(map(contains, kept[offset + 1:offset + 1 + kept_size]))
+                    if common >= threshold * (size + kept_size - common):
+                        return True
+        return False
+
+    def _insert(self, keys, shingles):
+        index, kept = self._generations[0]
+        if self._newest_size >= max(self.window // 2, 1):
+            index, kept = {}, array("Q")
+            self._generations = [(index, kept), self._generations[0]]
+            self._newest_size = 0
+        self._newest_size += 1
+        offset = len(kept)
+        kept.append(len(shingles))
+        kept.extend(shingles)
+        for key in keys:
+            offsets = index.get(key)
+            if offsets is None:
+                index[key] = [offset]
+            else:
+                offsets.append(offset)
+                if len(offsets) > BAND_SLOTS:
+                    del offsets[0]
+
+    def filter(self, rows, key=lambda row: row):
+        """Yields the rows whose key(row) text is not a near-duplicate, as they stream past."""
+        check = self.check
+        for row in rows:
+            if not check(key(row)):
+                yield row
@@ -1,10 +1,29 @@
 # flux_prompt_generator.py
-import subprocess
 import sys
+import bisect
+import math
 import random
 import json
 import os
 import re
+import hashlib
+import http.client
+import threading
+import time
+import itertools
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType
+
+try:
+    from . import clip_tokens, instrumentation, rules, sampling, templates, vocabulary
+except ImportError:  # Loaded as a top-level module (scripts, benchmarks)
+    import clip_tokens
+    import instrumentation
+    import rules
+    import sampling
+    import templates
+    import vocabulary
 
 # --- Installation and JSON Loading (Keep as is) ---
 def install_and_import(package):
@@ -12,11 +31,19 @@ def install_and_import(package):
         __import__(package)
     except ImportError:
         print(f"Package {package} not found. Installing...")
+        import subprocess # Only needed here; keeps it out of the import path
         subprocess.check_call([sys.executable, "-m", "pip", "install", package])
     finally:
         globals()[package] = __import__(package)
 
 def load_json_file(file_name):
+    start = time.perf_counter()
+    data = _load_json_file(file_name)
+    instrumentation.VOCABULARY_LOADS.record(f"load_json_file:{file_name}", time.perf_counter() - start,
+                                            instrumentation.text_size(data))
+    return data
+
+def _load_json_file(file_name):
     # Add basic error handling for file not found
     file_path = os.path.join(os.path.dirname(__file__), "data", file_name)
     if not os.path.exists(file_path):
@@ -31,8 +58,9 @@ def load_json_file(file_name):
             # If items are dicts, the original method is better, but assumes hashable items after json.dumps
             try:
                 data = list(dict.fromkeys(data)) # Faster for simple types
-            except TypeError: # Fallback for unhashable types like dicts if json was complex
-                 data = list({json.dumps(item, sort_keys=True) for item in data})
+            except TypeError: # Fallback for unhashable types like dicts (e.g. weighted entries)
+                 # dict.fromkeys rather than a set, so the order stays the file order in every process
+                 data = list(dict.fromkeys(json.dumps(item, sort_keys=True) for item in data))
                  data = [json.loads(item) for item in data]
         elif isinstance(data, dict):
              # For now, assume lists are expected based on the sample.
@@ -49,37 +77,34 @@ def load_json_file(file_name):
         return []
 
 
-# --- Load Data (Keep as is, but consider adding error checks) ---
-ARTFORM = load_json_file("artform.json")
-ACCESSORIES = load_json_file("accessories.json")
-ADDITIONAL_DETAILS = load_json_file("additional_details.json")
-AGE_GROUP = load_json_file("age_group.json")
-ARTIST = load_json_file("artist.json")
-BACKGROUND = load_json_file("background.json")
-BODY_MARKINGS = load_json_file("body_markings.json")
-BODY_TYPES = load_json_file("body_types.json")
-CLOTHING = load_json_file("clothing.json")
-COMPOSITION = load_json_file("composition.json")
-DEFAULT_TAGS = load_json_file("default_tags.json")
-DEVICE = load_json_file("device.json")
-DIGITAL_ARTFORM = load_json_file("digital_artform.json")
-ETHNICITY = load_json_file("ethnicity.json")
-EXPRESSION = load_json_file("expression.json")
-EYE_COLORS = load_json_file("eye_colors.json")
-FACE_FEATURES = load_json_file("face_features.json")
-FACIAL_HAIR = load_json_file("facial_hair.json")
-HAIR_COLOR = load_json_file("hair_color.json")
-HAIRSTYLES = load_json_file("hairstyles.json")
-LIGHTING = load_json_file("lighting.json")
-MAKEUP_STYLES = load_json_file("makeup_styles.json")
-PHOTO_TYPE = load_json_file("photo_type.json")
-PHOTOGRAPHER = load_json_file("photographer.json")
-PHOTOGRAPHY_STYLES = load_json_file("photography_styles.json")
-PLACE = load_json_file("place.json")
-POSE = load_json_file("pose.json")
-ROLES = load_json_file("roles.json")
-SKIN_TONE = load_json_file("skin_tone.json")
-TATTOOS_SCARS = load_json_file("tattoos_scars.json")
+# --- Load Data ---
+# Category lists are loaded lazily on first access (see vocabulary.py). The old
+# module-level constants (ARTIST, BACKGROUND, ...) still resolve through __getattr__.
+# Edited data files are picked up by the nodes, checked at most every FLUX_PROMPT_RELOAD_INTERVAL
+# seconds (default 2; a negative value turns hot reload off)
+_RELOAD_INTERVAL = float(os.environ.get("FLUX_PROMPT_RELOAD_INTERVAL", "2"))
+VOCABULARY = vocabulary.VocabularyRegistry(os.path.join(os.path.dirname(__file__), "data"), load_json_file,
+                                           reload_interval=_RELOAD_INTERVAL if _RELOAD_INTERVAL >= 0 else None)
+
+def __getattr__(name):
+    if name.lower() in vocabulary.CATEGORIES and name.isupper():
+        return VOCABULARY[name.lower()]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Every node input that is tracked in the debug report
+ALL_CATEGORIES = [
+    'custom', 'subject', 'default_tags', 'body_types', 'artform', 'photography_styles',
+    'digital_artform', 'artist', 'photographer', 'roles', 'hairstyles', 'hair_color',
+    'additional_details', 'lighting', 'clothing', 'composition', 'pose', 'background',
+    'place', 'age_group', 'ethnicity', 'accessories', 'expression', 'face_features',
+    'eye_colors', 'skin_tone', 'facial_hair', 'body_markings', 'makeup_styles',
+    'tattoos_scars', 'photo_type', 'device'
+]
+
+# "legacy": one shared random.Random per prompt, the original streams
+# "counter": sampling.CounterRNG, 64-bit seeds with an independent stream per (prompt index, category)
+# "unique": the seed is a position in a keyed walk over every distinct prompt of the config (CombinationSpace)
+RNG_MODES = ("legacy", "counter", "unique")
 
 
 # --- Helper Function for Cleaner Joining ---
@@ -87,53 +112,990 @@ def smart_join(elements, separator=", "):
     """Joins non-empty elements with a separator."""
     return separator.join(filter(None, elements))
 
-# --- PromptGenerator Class (Refactored) ---
-class PromptGenerator:
-    def __init__(self, seed=None):
-        self.rng = random.Random(seed)
 
-    def _get_choice(self, input_value, default_choices):
-        """Internal helper to get a single choice, handling random/disabled."""
-        if not default_choices: # Handle empty JSON lists
-            return input_value if input_value.lower() not in ["random", "disabled"] else ""
+class PromptSegments:
+    """The t5xxl, clip_g and clip_l parts of one prompt, kept in separate buffers.
+
+    clip_g_index is the position in t5xxl where the CLIP G block sat in the
+    legacy BREAK-marked string; the raw_* methods reproduce exactly the text
+    the BREAK splitter used to produce, without building or searching it.
+    """
+
+    __slots__ = ("t5xxl", "clip_g", "clip_l", "clip_g_index", "clip_l_groups", "clip_g_groups")
+
+    def __init__(self):
+        self.t5xxl = []
+        self.clip_g = []
+        self.clip_l = []
+        self.clip_g_index = 0
+        # The CLIP blocks as clip_tokens.fit_groups groups; only built when a token budget is set
+        self.clip_l_groups = None
+        self.clip_g_groups = None
+
+    def raw_t5xxl(self):
+        # Removing a BREAK block leaves the separators on both sides of it behind
+        head = [part for part in self.t5xxl[:self.clip_g_index] if part]
+        tail = [part for part in self.t5xxl[self.clip_g_index:] if part]
+        return " ".join(head + [""] + tail + [""])
+
+    def raw_clip_g(self):
+        return smart_join(self.clip_g, separator=" ").strip()
+
+    def raw_clip_l(self):
+        return smart_join(self.clip_l, separator=" ").strip()
+
+    def to_marked_string(self):
+        """The legacy single string with BREAK_CLIPG/BREAK_CLIPL sentinels around the CLIP blocks."""
+        return smart_join(
+            self.t5xxl[:self.clip_g_index]
+            + ["BREAK_CLIPG"] + self.clip_g + ["BREAK_CLIPG"]
+            + self.t5xxl[self.clip_g_index:]
+            + ["BREAK_CLIPL"] + self.clip_l + ["BREAK_CLIPL"],
+            separator=" ",
+        )
+
+# --- Single-pass prompt cleaner ---
+# Every rule of the legacy cleaner except the duplicate-word fixes only rewrites
+# maximal runs of whitespace, commas and periods, and the rewrite of a run only
+# depends on the run itself, whether it touches either end of the string, and
+# whether an uppercase letter follows it. So one regex pass that rewrites each
+# run (memoized) gives the same result.
+#
+# Runs that never change are not matched: a lone space, and ", " / ". " followed
+# by a word. Each branch starts with a character class so sre can skip ahead
+# quickly; ASCII text uses an explicit charset equal to what \s matches there,
+# which is much cheaper than the Unicode whitespace category.
+def _separator_run_pattern(whitespace, whitespace_but_space):
+    separator = whitespace + ",."
+    return re.compile(rf'[,.](?! [^{separator}])[{separator}]*|[{whitespace}][{separator}]+|[{whitespace_but_space}]')
+
+_SEPARATOR_RUN = _separator_run_pattern(r'\s', r'^\S ')
+_ASCII_SEPARATOR_RUN = _separator_run_pattern(r' \t\n\r\x0b\x0c\x1c-\x1f', r'\t\n\r\x0b\x0c\x1c-\x1f')
+
+@lru_cache(maxsize=1024)
+def _clean_separator_run(run, at_start, at_end, before_upper):
+    """Applies the legacy comma/period/whitespace rules, in their original order, to one run."""
+    run = re.sub(r'\s*,\s*', ', ', run) # Every comma becomes ", " (this also makes ',+' a no-op)
+    if at_start:
+        run = run.lstrip(', ')
+    if at_end:
+        run = run.rstrip(', ')
+    run = re.sub(r'\s+\.', '.', run)
+    if before_upper and run.endswith('.'):
+        run += ' '
+    run = re.sub(r'\.\.+', '.', run)
+    run = re.sub(r'\s+', ' ', run)
+    if at_start:
+        run = run.lstrip()
+    if at_end:
+        run = run.rstrip()
+    return re.sub(r',(\s*,)+', ',', run)
+
+def _replace_separator_run(match):
+    text = match.string
+    end = match.end()
+    at_end = end == len(text)
+    return _clean_separator_run(match.group(), match.start() == 0, at_end, not at_end and "A" <= text[end] <= "Z")
+
+
+# --- Compiled Input Config ---
+# Artforms that read naturally without "of" before the subject
+_DESCRIPTIVE_ARTFORMS = frozenset(["illustration", "painting", "drawing", "sketch"])
+# Age groups that are nouns and need an article
+_AGE_NOUNS = frozenset(["adult", "child", "infant", "preteen", "senior", "teenager", "toddler", "young adult"])
+
+_SENTENCE_TEMPLATES = {
+    'role': "working as {}",
+    'hairstyle': "with {}",
+    'clothing': "dressed in {}",
+    'composition': "The composition follows {}",
+    'pose': "The subject is {}",
+    'face_features': "with {}",
+    'eye_color': "with {} eyes",
+    'skin_tone': "with {} skin",
+    'age_group': "appearing {}",
+    'ethnicity': "of {} descent",
+    'accessories': "wearing {}",
+    'expression': "with a {} expression",
+    'tattoos_scars': "featuring {}",
+    'hair_color': "with {} hair",
+    'body_markings': "displaying {}",
+    'facial_hair': "with {}",
+    'makeup': "styled with {} makeup"
+}
+
+
+class _Frozen:
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+class CategorySpec(_Frozen):
+    """How one category input resolves, decided once from the raw input string.
+
+    mode is "disabled", "fixed" (value holds the result), "list" (one of the
+    user's comma-separated options), "random" (one entry of the vocabulary
+    list, weighted by alias_table if given) or "multiple" (count_range
+    distinct entries, joined). With index (the category's lookup.CategoryIndex)
+    the user's values are resolved to canonical entries first, and an entry
+    that contains commas is one value rather than a list. sampler is a
+    bound method taking the RNG, or None when no draw is needed; its draws
+    match PromptGenerator._get_choice / _get_multiple_choices exactly.
+    """
+
+    __slots__ = ("name", "mode", "value", "options", "alias_table", "count_range", "sampler")
+
+    def __init__(self, name, input_value, default_choices, count_range=None, alias_table=None, index=None):
+        define = object.__setattr__
+        define(self, "name", name)
+        define(self, "options", ())
+        define(self, "alias_table", None)
+        define(self, "count_range", count_range)
+        define(self, "value", "")
+        define(self, "sampler", None)
 
         input_lower = input_value.lower()
-        if input_lower == "disabled":
-            return ""
-        elif "," in input_value: # Allow comma-separated specific choices from user
-            choices = [choice.strip() for choice in input_value.split(",")]
-            # Return one random choice from the user's list
-            return self.rng.choice(choices) if choices else ""
+        if not default_choices: # Handle empty JSON lists
+            mode = "fixed"
+            if count_range is None and input_lower not in ["random", "disabled"]:
+                define(self, "value", input_value)
+        elif input_lower == "disabled":
+            mode = "disabled"
+        elif input_lower != "random" and (index is not None or "," in input_value):
+            choices = index.resolve(input_value)[0] if index is not None else [choice.strip() for choice in input_value.split(",")]
+            if len(choices) == 1: # The whole input is one entry
+                mode = "fixed"
+                define(self, "value", choices[0] if "," in input_value else index.lookup(input_value) or input_value)
+            elif count_range is None: # One random choice from the user's list
+                mode = "list"
+                define(self, "options", tuple(choices))
+                define(self, "sampler", self._choose)
+            else: # Multiple choice input: the user's items, joined
+                mode = "fixed"
+                define(self, "value", ", ".join(filter(None, choices)))
         elif input_lower == "random":
-            return self.rng.choice(default_choices)
+            define(self, "options", default_choices)
+            define(self, "alias_table", alias_table)
+            if count_range is not None:
+                mode = "multiple"
+                define(self, "sampler", self._choose_several)
+            else:
+                mode = "random"
+                define(self, "sampler", self._choose if self.alias_table is None else self._choose_weighted)
         else:
-            # Return the specific value provided by the user
-            return input_value
+            # The specific value provided by the user
+            mode = "fixed"
+            define(self, "value", input_value)
+        define(self, "mode", mode)
+
+    def __repr__(self):
+        return f"<CategorySpec {self.name} {self.mode} {self.value if self.sampler is None else len(self.options)!r}>"
+
+    def _choose(self, rng):
+        return rng.choice(self.options)
+
+    def _choose_weighted(self, rng):
+        return self.options[self.alias_table.draw(rng)]
+
+    def _choose_several(self, rng):
+        count = rng.randint(*self.count_range)
+        # Ensure sample size doesn't exceed population size
+        actual_count = min(count, len(self.options))
+        if actual_count == 0: return ""
+        if self.alias_table is not None: # Weighted: successive weighted picks without replacement
+            return ", ".join(self.options[index] for index in self.alias_table.sample(rng, actual_count))
+        return ", ".join(rng.sample(self.options, actual_count))
+
+
+LIGHTING_COUNT_RANGE = (2, 4) # Random lighting picks 2-4 distinct terms
+RULE_TABLE_LIMIT = 1 << 16 # Unique mode lists the allowed values of ruled digits up to this many combinations
+RULE_WALK_LIMIT = 100 # Unique mode draws a banned position instead after trying it in this many passes
+
+
+class PromptSpec(_Frozen):
+    """A node config compiled once: a CategorySpec per category plus the decisions that only depend on inputs.
+
+    Build it with PromptSpec.compile(kwargs), which caches specs by config, so
+    a workflow (or a whole batch) parses its inputs once rather than per prompt.
+    rules is the rules.RuleSet of data/rules.json, or None without one, and
+    rule_bans the entries that the fixed inputs rule out before any draw.
+    templates holds the compiled templates.Template of custom and subject when
+    they use template syntax, and template_lists the (list, alias table) of
+    every category they refer to.
+    """
+
+    __slots__ = ("config", "categories", "rules", "rule_bans", "custom", "subject", "has_subject", "adds_connector",
+                 "templates", "template_lists",
+                 "debug_inputs", "debug_used", "debug_not_used", "debug_checks_photography_styles")
+
+    def __init__(self, kwargs):
+        define = object.__setattr__
+        define(self, "config", tuple(sorted((name, value) for name, value in kwargs.items() if name in ALL_CATEGORIES)))
+
+        while True:
+            categories, lists, list_tables = {}, {}, {}
+            for category in vocabulary.CATEGORIES:
+                input_value = kwargs.get(category, "disabled" if category == "artform" else "random")
+                count_range = LIGHTING_COUNT_RANGE if category == "lighting" and input_value.lower() == "random" else None
+                # The list and its alias table are read together, so a hot reload never pairs them up wrongly
+                lists[category], alias_table = list_tables[category] = VOCABULARY.category(category)
+                # User values are matched against the list; random and disabled need no index
+                index = VOCABULARY.index(category) if input_value.lower() not in ("random", "disabled") else None
+                categories[category] = CategorySpec(category, input_value, lists[category], count_range, alias_table, index)
+            # The rule bitsets index into the lists; read everything again if a reload came in between
+            compiled_rules = VOCABULARY.rules()
+            if compiled_rules is None or compiled_rules.compiled_for(lists):
+                break
+        define(self, "categories", MappingProxyType(categories))
+        define(self, "rules", compiled_rules)
+        define(self, "rule_bans", MappingProxyType(compiled_rules.fixed_bans(categories) if compiled_rules else {}))
 
-    def _get_multiple_choices(self, input_value, default_choices, min_count=1, max_count=1):
-        """Helper to get multiple choices, useful for things like lighting."""
-        if not default_choices:
-            return ""
+        subject = kwargs.get("subject", "")
+        compiled_templates, texts = {}, {}
+        for name in ("custom", "subject"):
+            texts[name] = kwargs.get(name, "")
+            template = _compile_template(texts[name])
+            if template is not None and template.dynamic:
+                compiled_templates[name] = template
+            elif template is not None: # Only escapes: the text without them
+                texts[name] = "".join(template.nodes)
+        define(self, "custom", texts["custom"])
+        define(self, "subject", texts["subject"])
+        define(self, "templates", MappingProxyType(compiled_templates))
+        define(self, "template_lists", MappingProxyType({
+            category: list_tables[category] for template in compiled_templates.values() for category in template.categories}))
+        # User provided subject takes precedence (but not if it's "random" or "disabled")
+        define(self, "has_subject", bool(subject) and subject.lower() not in ["random", "disabled"])
+        # Add "of" after the lead-in if a subject or default tag can follow (see _section_lead_in)
+        define(self, "adds_connector", bool(kwargs.get("subject")) or kwargs.get("default_tags", "disabled").lower() != "disabled")
 
-        input_lower = input_value.lower()
-        if input_lower == "disabled":
-            return ""
-        elif "," in input_value: # User provided specific items
-             # Use user's specific items directly, joined
-             return ", ".join(filter(None, [choice.strip() for choice in input_value.split(",")]))
-        elif input_lower == "random":
-            count = self.rng.randint(min_count, max_count)
-            # Ensure sample size doesn't exceed population size
-            actual_count = min(count, len(default_choices))
-            if actual_count == 0: return "" # Handle case where default_choices is empty
-            chosen = self.rng.sample(default_choices, actual_count)
-            return ", ".join(chosen)
+        # Static part of the debug report; only the photography_styles check depends on the drawn artform
+        used, not_used, all_inputs = {}, {}, {}
+        for category in ALL_CATEGORIES:
+            input_value = kwargs.get(category, "disabled")
+            all_inputs[category] = input_value
+
+            # Determine if category was actually used and provide specific reason if not
+            if not input_value or input_value == "":
+                not_used[category] = "empty (not provided)"
+            elif input_value.lower() == "disabled":
+                not_used[category] = "disabled (explicitly set)"
+            elif input_value.lower() == "random":
+                # Random means it was used (a value was selected)
+                used[category] = "random (value selected)"
+            else:
+                # Specific value was used
+                used[category] = input_value
+
+        # default_tags is ignored when subject is provided
+        if kwargs.get('subject', '') and kwargs.get('subject', '').lower() not in ['random', 'disabled']:
+            if 'default_tags' in used:
+                not_used['default_tags'] = "ignored (subject takes precedence)"
+                del used['default_tags']
+
+        photography_styles = kwargs.get('photography_styles', '')
+        define(self, "debug_checks_photography_styles",
+               bool(photography_styles) and photography_styles.lower() not in ['disabled', ''] and 'photography_styles' in used)
+        define(self, "debug_inputs", MappingProxyType(all_inputs))
+        define(self, "debug_used", MappingProxyType(used))
+        define(self, "debug_not_used", MappingProxyType(not_used))
+
+    @classmethod
+    def compile(cls, kwargs):
+        """Cached PromptSpec for a node's kwargs (non-category inputs such as seed are ignored)."""
+        return _compile_prompt_spec(tuple(sorted((name, value) for name, value in kwargs.items() if name in ALL_CATEGORIES)))
+
+
+@lru_cache(maxsize=128)
+def _compile_prompt_spec(config):
+    return PromptSpec(dict(config))
+
+
+_TEMPLATE_CATEGORIES = frozenset(vocabulary.CATEGORIES)
+
+
+def _compile_template(text):
+    """templates.Template of a custom or subject input, or None when it is plain text (used as typed).
+
+    A template that is not dynamic is still returned when its escapes change
+    the text; its one node is then the text to use.
+    """
+    if not text or not ("{" in text or "__" in text or "\\" in text):
+        return None
+    try:
+        template = templates.compile_template(text, _TEMPLATE_CATEGORIES)
+    except templates.TemplateError as e:
+        print(f"Warning: {e}; using the text as typed.")
+        return None
+    return template if template.dynamic or "".join(template.nodes) != text else None
+
+
+def validate_inputs(kwargs, suggestions=3):
+    """Values of category inputs that are not vocabulary entries: {category: [(value, [closest entries])]}.
+
+    Such values are still used as typed (free text is allowed); this is for
+    catching typos in configs. Case and spacing differences are not reported,
+    since generation resolves them to the entry.
+    """
+    problems = {}
+    for category in vocabulary.CATEGORIES:
+        input_value = kwargs.get(category)
+        if not input_value or input_value.lower() in ("random", "disabled"):
+            continue
+        index = VOCABULARY.index(category)
+        unknown = index.resolve(input_value)[1]
+        if unknown:
+            problems[category] = [(value, [entry for entry, _ in index.suggest(value, suggestions)]) for value in unknown]
+    return problems
+
+
+# --- Unique Mode: Every Distinct Prompt of a Config, Numbered ---
+def _digit_categories(digit):
+    """Names of the categories a CombinationSpace digit decodes."""
+    if isinstance(digit, _ChoiceDigit):
+        return (digit.name,)
+    if isinstance(digit, _NestedDigit):
+        return (digit.head, digit.tail)
+    if isinstance(digit, _RuledDigit):
+        return (digit.head.name, *(name for tail in digit.tails[0] for name in _digit_categories(tail)))
+    if isinstance(digit, _TableDigit):
+        return tuple(name for member in digit.digits for name in _digit_categories(member))
+    return ("lighting",)
+
+
+def _choice_options(category):
+    """Every value a CategorySpec can resolve to, duplicates removed."""
+    if category.sampler is None:
+        return [category.value]
+    return list(dict.fromkeys(category.options))
+
+
+class _ChoiceDigit:
+    __slots__ = ("name", "options", "radix")
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+        self.radix = len(options)
+
+    def decode(self, digit, choices):
+        choices[self.name] = self.options[digit]
+
+    def restrict(self, banned):
+        """This digit without the entries of banned ({category: set of entries}); "" if none is left."""
+        excluded = banned.get(self.name)
+        if not excluded:
+            return self
+        return _ChoiceDigit(self.name, _allowed_options(self.options, excluded))
+
+
+def _allowed_options(options, excluded):
+    # A category whose every entry is banned resolves to "", as in rules.ConstrainedDraw
+    return [value for value in options if value not in excluded] or [""]
+
+
+class _NestedDigit:
+    """A head category whose value decides whether a tail category shows up.
+
+    Head values that use the tail get one digit value per tail option, the
+    others a single one, so no two digit values give the same output.
+    """
+
+    __slots__ = ("head", "head_options", "tail", "tail_options", "hidden_tail", "starts", "uses_tail", "radix", "_uses_tail")
+
+    def __init__(self, head, head_options, tail, tail_options, uses_tail, hidden_tail=None):
+        self.head = head
+        self.head_options = head_options
+        self.tail = tail
+        self.tail_options = tail_options
+        self.hidden_tail = hidden_tail # Tail value when the head hides it; None leaves it out of the choices
+        self.starts = [] # First digit value of each head option
+        self._uses_tail = uses_tail
+        self.uses_tail = [uses_tail(value) for value in head_options]
+        self.radix = 0
+        for value_uses_tail in self.uses_tail:
+            self.starts.append(self.radix)
+            self.radix += len(tail_options) if value_uses_tail else 1
+
+    def decode(self, digit, choices):
+        index = bisect.bisect_right(self.starts, digit) - 1
+        choices[self.head] = self.head_options[index]
+        if self.uses_tail[index]:
+            choices[self.tail] = self.tail_options[digit - self.starts[index]]
+        elif self.hidden_tail is not None:
+            choices[self.tail] = self.hidden_tail
+
+    def restrict(self, banned):
+        head_excluded, tail_excluded = banned.get(self.head), banned.get(self.tail)
+        if not head_excluded and not tail_excluded:
+            return self
+        return _NestedDigit(
+            self.head, _allowed_options(self.head_options, head_excluded) if head_excluded else self.head_options,
+            self.tail, _allowed_options(self.tail_options, tail_excluded) if tail_excluded else self.tail_options,
+            self._uses_tail, self.hidden_tail)
+
+
+class _LightingDigit:
+    """Every ordered pick of 2-4 distinct lighting terms (the random lighting draw)."""
+
+    __slots__ = ("options", "count_range", "blocks", "radix")
+
+    def __init__(self, options, min_count=2, max_count=4):
+        self.options = options
+        self.count_range = (min_count, max_count)
+        self.blocks = [] # (count, number of ordered picks of that count)
+        self.radix = 0
+        for count in sorted({min(count, len(options)) for count in range(min_count, max_count + 1)}):
+            picks = math.perm(len(options), count)
+            self.blocks.append((count, picks))
+            self.radix += picks
+
+    def decode(self, digit, choices):
+        for count, picks in self.blocks:
+            if digit < picks:
+                break
+            digit -= picks
+        # Read the pick as a mixed-radix number: entry i chosen among the n - i remaining
+        chosen = []
+        for i in range(count):
+            digit, index = divmod(digit, len(self.options) - i)
+            for previous in sorted(chosen):
+                if index >= previous:
+                    index += 1
+            chosen.append(index)
+        choices["lighting"] = ", ".join(self.options[index] for index in chosen)
+
+    def restrict(self, banned):
+        excluded = banned.get("lighting")
+        if not excluded:
+            return self
+        return _LightingDigit([value for value in self.options if value not in excluded], *self.count_range)
+
+
+class _RuledDigit:
+    """A head category merged with the digits its entries constrain through the rules.
+
+    Like _NestedDigit: each head value gets one digit value per combination of
+    the tail options its rules allow, so banned pairs are never numbered.
+    """
+
+    __slots__ = ("head", "tails", "starts", "radix")
+
+    def __init__(self, head, tails, rule_set, drawn):
+        self.head = head # _ChoiceDigit
+        self.tails = [] # Tail digits restricted to each head option
+        self.starts = [] # First digit value of each head option
+        self.radix = 0
+        for value in head.options:
+            banned = {target: entries for target, entries in rule_set.banned_entries(head.name, value).items() if target in drawn}
+            restricted = tuple(tail.restrict(banned) for tail in tails)
+            self.tails.append(restricted)
+            self.starts.append(self.radix)
+            self.radix += math.prod(tail.radix for tail in restricted)
+
+    def decode(self, digit, choices):
+        index = bisect.bisect_right(self.starts, digit) - 1
+        self.head.decode(index, choices)
+        digit -= self.starts[index]
+        for tail in self.tails[index]:
+            digit, value = divmod(digit, tail.radix)
+            tail.decode(value, choices)
+
+
+class _TableDigit:
+    """Digits a ban links, merged into one that numbers only their allowed combinations.
+
+    allowed lists the digit values of each allowed combination, so the digit
+    costs one tuple per combination and is only built up to RULE_TABLE_LIMIT.
+    """
+
+    __slots__ = ("digits", "allowed", "radix")
+
+    def __init__(self, digits, allowed):
+        self.digits = digits
+        self.allowed = allowed # (value of each digit), one per allowed combination
+        self.radix = len(allowed)
+
+    def decode(self, digit, choices):
+        for member, value in zip(self.digits, self.allowed[digit]):
+            member.decode(value, choices)
+
+
+class CombinationSpace:
+    """Every distinct prompt of one config, numbered 0 to size - 1 as a mixed-radix number.
+
+    Each category with more than one possible value is one digit. A category
+    that can hide another is merged with it into a single digit (artform with
+    photography_styles, default_tags with body_types, makeup_styles with
+    facial_hair), and duplicate list entries count once, so different numbers
+    give different choices. photo_weight is not part of the space, and entry
+    weights do not apply: every combination comes up exactly once per pass.
+
+    With rules, entries the fixed inputs ban are left out of their digits, and
+    a category whose entries constrain other digits becomes the head of a
+    _RuledDigit over them (the most connected first), so those banned pairs
+    are not counted at all. Digits linked by the remaining bans (between two
+    tails, or inside a merged digit) become a _TableDigit of their allowed
+    combinations when they have at most RULE_TABLE_LIMIT of them. Only bans
+    over larger digits are listed in rule_checks; allows() tests them, and
+    such a space is an upper bound of the allowed combinations.
+    """
+
+    def __init__(self, spec):
+        self.fixed = {} # Categories with a single possible value
+        self.digits = []
+        self.rules = spec.rules
+        self.rule_checks = () # (category, category) pairs of bans the digits do not hold
+        categories = spec.categories
+        # Rules only restrict random draws; values the user set are kept as they are
+        self._drawn = {name for name, category in categories.items() if category.mode in ("random", "multiple")}
+        self._multiple = {name for name, category in categories.items() if category.count_range is not None}
+        self._fixed_banned = {
+            target: {spec.rules.lists[target][index] for index in rules.iter_bits(mask)}
+            for target, mask in spec.rule_bans.items() if target in self._drawn}
+
+        self._add("artform", _NestedDigit(
+            "artform", _choice_options(categories["artform"]),
+            "photography_styles", _choice_options(categories["photography_styles"]),
+            lambda artform: artform.lower() == "photography"))
+        self._add_choice(categories["photo_type"])
+
+        if spec.has_subject:
+            self._add_choice(categories["body_types"])
+        else:
+            self._add("default_tags", _NestedDigit(
+                "default_tags", _choice_options(categories["default_tags"]),
+                "body_types", _choice_options(categories["body_types"]), bool))
+
+        for category in ("roles", "hairstyles", "additional_details", "clothing", "composition", "pose", "background", "place"):
+            self._add_choice(categories[category])
+
+        lighting = categories["lighting"]
+        if lighting.mode == "multiple":
+            self._add("lighting", _LightingDigit(list(dict.fromkeys(lighting.options)), *lighting.count_range))
+        else:
+            self._add_choice(lighting)
+
+        for category in ("face_features", "eye_colors", "skin_tone", "age_group", "ethnicity", "accessories",
+                         "expression", "tattoos_scars", "hair_color", "body_markings"):
+            self._add_choice(categories[category])
+        # Makeup hides facial hair (see _assemble_segments)
+        self._add("makeup_styles", _NestedDigit(
+            "makeup_styles", _choice_options(categories["makeup_styles"]),
+            "facial_hair", _choice_options(categories["facial_hair"]),
+            lambda makeup: not makeup, hidden_tail=""))
+        for category in ("device", "digital_artform", "photographer", "artist"):
+            self._add_choice(categories[category])
+
+        if self.rules is not None:
+            self._merge_ruled_digits(categories)
+            self._merge_checked_digits()
+        self.size = math.prod(digit.radix for digit in self.digits)
+
+    def _add_choice(self, category):
+        self._add(category.name, _ChoiceDigit(category.name, _choice_options(category)))
+
+    def _add(self, name, digit):
+        if self._fixed_banned:
+            digit = digit.restrict(self._fixed_banned)
+        if digit.radix > 1:
+            self.digits.append(digit)
         else:
-            # Specific single value chosen
-            return input_value
+            digit.decode(0, self.fixed)
+
+    def _merge_ruled_digits(self, categories):
+        owner = {} # Category -> position of the digit that decodes it
+        for position, digit in enumerate(self.digits):
+            for name in _digit_categories(digit):
+                owner[name] = position
+        # Pairs of categories the rules link, where the draw would restrict at least one side
+        pairs, links = set(), {}
+        for (category, _), targets in self.rules.masks.items():
+            for target, _ in targets:
+                if category not in owner or target not in owner or category == target:
+                    continue
+                if categories[category].sampler is None or categories[target].sampler is None:
+                    continue # Bans of values the user set are in _fixed_banned
+                if category in self._drawn or target in self._drawn:
+                    pairs.add(tuple(sorted((category, target))))
+                if target in self._drawn and owner[target] != owner[category]:
+                    links.setdefault(owner[category], set()).add(owner[target])
+
+        grouped, merged = set(), {}
+        while True:
+            best = None
+            for position, digit in enumerate(self.digits):
+                if position in grouped or not isinstance(digit, _ChoiceDigit):
+                    continue
+                tails = sorted(other for other in links.get(position, ()) if other not in grouped)
+                if tails and (best is None or len(tails) > len(best[1])):
+                    best = (position, tails)
+            if best is None:
+                break
+            head, tails = best
+            grouped.update([head, *tails])
+            merged[head] = _RuledDigit(self.digits[head], [self.digits[tail] for tail in tails], self.rules, self._drawn)
+            head_name = self.digits[head].name
+            for tail in tails:
+                for name in _digit_categories(self.digits[tail]):
+                    if name in self._drawn:
+                        pairs.discard(tuple(sorted((head_name, name))))
+        self.digits = [merged.get(position, digit) for position, digit in enumerate(self.digits)
+                       if position in merged or position not in grouped]
+        self.rule_checks = tuple(sorted(pairs))
+
+    def _merge_checked_digits(self):
+        owner = {}
+        for position, digit in enumerate(self.digits):
+            for name in _digit_categories(digit):
+                owner[name] = position
+        # Digits linked by rule_checks, grouped into connected sets
+        groups = {}
+        for category, other in self.rule_checks:
+            group = groups.get(owner[category], {owner[category]}) | groups.get(owner[other], {owner[other]})
+            for position in group:
+                groups[position] = group
+        merged, dropped, grouped, checks = {}, set(), set(), set(self.rule_checks)
+        for group in groups.values():
+            if min(group) in grouped:
+                continue
+            grouped.update(group)
+            members = [self.digits[position] for position in sorted(group)]
+            if math.prod(digit.radix for digit in members) > RULE_TABLE_LIMIT:
+                continue
+            pairs = [pair for pair in self.rule_checks if owner[pair[0]] in group]
+            allowed = []
+            for values in itertools.product(*(range(digit.radix) for digit in members)):
+                choices = {}
+                for digit, value in zip(members, values):
+                    digit.decode(value, choices)
+                if self._keeps(choices, pairs):
+                    allowed.append(values)
+            if not allowed:
+                continue # Every combination is banned: left to the walk, which draws instead
+            merged[min(group)] = _TableDigit(members, allowed)
+            dropped.update(group - {min(group)})
+            checks.difference_update(pairs)
+        self.digits = [merged.get(position, digit) for position, digit in enumerate(self.digits) if position not in dropped]
+        self.rule_checks = tuple(sorted(checks))
+
+    def allows(self, choices):
+        """Whether choices keep the rules the digits do not hold (rule_checks)."""
+        return self._keeps(choices, self.rule_checks)
+
+    def _keeps(self, choices, pairs):
+        for category, other in pairs:
+            value, other_value = choices.get(category), choices.get(other)
+            if not value or not other_value:
+                continue
+            other_parts = other_value.split(", ") if other in self._multiple else (other_value,)
+            for part in value.split(", ") if category in self._multiple else (value,):
+                excluded = self.rules.banned_entries(category, part).get(other)
+                if excluded and any(other_part in excluded for other_part in other_parts):
+                    return False
+        return True
+
+    def choices(self, number):
+        """Choices dict (as from PromptGenerator._resolve_choices, without photo_weight) of combination number."""
+        if not 0 <= number < self.size:
+            raise IndexError("combination number out of range")
+        choices = dict(self.fixed)
+        for digit in self.digits:
+            number, value = divmod(number, digit.radix)
+            digit.decode(value, choices)
+        return choices
+
+
+# --- Debug Report ---
+# "text": generate_prompt returns the rendered report; "record": a DebugRecord, rendered on str();
+# "off" (the default): nothing is collected and the debug output is ""
+DEBUG_MODES = ("text", "record", "off")
+
+
+def format_debug_info(debug_info):
+    """Format debug info as readable string"""
+    lines = []
+    lines.append("=== DEBUG INFO - CATEGORY USAGE ===\n")
+
+    # Categories Used
+    lines.append(f"✅ CATEGORIES USED ({len(debug_info['used'])})")
+    for category, value in sorted(debug_info['used'].items()):
+        # Truncate long values
+        display_value = str(value)[:60] + "..." if len(str(value)) > 60 else str(value)
+        lines.append(f"  • {category:20s} = {display_value}")
+
+    # Categories Not Used
+    lines.append(f"\n❌ CATEGORIES NOT USED ({len(debug_info['not_used'])})")
+    for category, reason in sorted(debug_info['not_used'].items()):
+        lines.append(f"  • {category:20s} : {reason}")
+
+    # RNG draws, in the order they were consumed
+    if debug_info.get('draws'):
+        lines.append(f"\n🎲 RNG DRAWS ({len(debug_info['draws'])})")
+        for category, call, detail, result in debug_info['draws']:
+            display_result = repr(result)[:60] + "..." if len(repr(result)) > 60 else repr(result)
+            lines.append(f"  • {category:20s} : {call} {detail} -> {display_result}")
+
+    return "\n".join(lines)
+
+
+class DebugRecord:
+    """Structured debug info of one prompt; the text report is only built by render() or str().
+
+    choices holds the values actually chosen, used/not_used describe every
+    input (with the reason a category was skipped), and draws lists the RNG
+    calls consumed as (category, call, detail, result) tuples.
+    """
+
+    __slots__ = ("inputs", "choices", "used", "not_used", "draws")
+
+    def __init__(self, inputs, choices, used, not_used, draws):
+        self.inputs = inputs
+        self.choices = choices
+        self.used = used
+        self.not_used = not_used
+        self.draws = draws
+
+    def as_dict(self):
+        return {"used": self.used, "not_used": self.not_used, "all_inputs": dict(self.inputs),
+                "choices": self.choices, "draws": self.draws}
+
+    def render(self):
+        return format_debug_info(self.as_dict())
+
+    __str__ = render
+
+
+class _RecordingRNG:
+    """Wraps a category's random source while debugging and logs every call into a draws list."""
+
+    __slots__ = ("rng", "category", "draws")
+
+    def __init__(self, rng, category, draws):
+        self.rng = rng
+        self.category = category
+        self.draws = draws
+
+    def random(self):
+        value = self.rng.random()
+        self.draws.append((self.category, "random", "", value))
+        return value
+
+    def choice(self, seq):
+        value = self.rng.choice(seq)
+        self.draws.append((self.category, "choice", f"of {len(seq)}", value))
+        return value
+
+    def randint(self, a, b):
+        value = self.rng.randint(a, b)
+        self.draws.append((self.category, "randint", f"{a}..{b}", value))
+        return value
+
+    def sample(self, population, k):
+        value = self.rng.sample(population, k)
+        self.draws.append((self.category, "sample", f"{k} of {len(population)}", value))
+        return value
+
+    def uniform(self, a, b):
+        value = self.rng.uniform(a, b)
+        self.draws.append((self.category, "uniform", f"{a}..{b}", value))
+        return value
+
+
+# Methods timed when a PromptGenerator has metrics: method -> (stage, size of its result)
+INSTRUMENTED_STAGES = {
+    "generate_prompt": ("generate_prompt", instrumentation.text_size),
+    "_draw_choices": ("sampling", None),
+    "_assemble_segments": ("assembly", lambda segments: instrumentation.text_size(segments.t5xxl + segments.clip_g + segments.clip_l)),
+    "_split_sections": ("split", instrumentation.text_size),
+    "strip_weights_for_natural_language": ("strip_weights", instrumentation.text_size),
+    "clean_prompt_string": ("clean", instrumentation.text_size),
+}
+
+
+# Categories drawn unconditionally between the subject and photo_weight, in draw order
+_DRAW_ORDER = (
+    "roles", "hairstyles", "additional_details", "clothing", "composition", "pose",
+    "background", "place", "lighting",
+    "face_features", "eye_colors", "skin_tone", "age_group", "ethnicity", "accessories", "expression",
+    "tattoos_scars", "hair_color", "body_markings", "facial_hair", "makeup_styles",
+    "device",
+)
+
+
+# --- CLIP token budget ---
+# Parts of each CLIP block, lowest priority first: fitting a block to the budget drops them in
+# this order. Lighting first loses terms one by one, from the last.
+CLIP_L_DROP_ORDER = ("device", "photographer", "digital_artform", "photo_type", "artist")
+CLIP_G_DROP_ORDER = ("lighting", "place", "background")
+CLIP_G_TRIM = ("lighting",)
+CLIP_CATEGORIES = ("photo_type", "device", "digital_artform", "photographer", "artist", "background", "place", "lighting")
+_clip_counter = None
+
+
+def clip_token_counter():
+    """The shared clip_tokens.ClipTokenCounter, with the CLIP block entries counted when it is created."""
+    global _clip_counter
+    if _clip_counter is None:
+        counter = clip_tokens.ClipTokenCounter()
+        if not counter.exact:
+            print(f"Warning: Could not read {counter.bpe_path}; CLIP token counts are upper bounds (one per byte), "
+                  f"not exact counts, and token budgets trim more than needed.")
+        for category in CLIP_CATEGORIES:
+            counter.precount(VOCABULARY[category])
+        _clip_counter = counter
+    return _clip_counter
+
+
+# Sections of the assembled prompt, in output order: (name, segment, inputs and choices it reads, method).
+# Incremental regeneration rebuilds only the sections that read something that changed.
+_SECTIONS = (
+    ("custom", "t5xxl", {"custom"}, "_section_custom"),
+    ("lead_in", "t5xxl", {"artform", "photo_type", "photography_styles", "subject", "default_tags"}, "_section_lead_in"),
+    ("subject", "t5xxl", {"subject", "default_tags", "body_types"}, "_section_subject"),
+    ("core", "t5xxl", {"roles", "hairstyles", "additional_details"}, "_section_core"),
+    ("clothing", "t5xxl", {"clothing"}, "_section_clothing"),
+    ("composition", "t5xxl", {"composition", "pose"}, "_section_composition"),
+    ("environment", "clip_g", {"background", "place"}, "_section_environment"),
+    ("lighting", "clip_g", {"lighting"}, "_section_lighting"),
+    ("features", "t5xxl", {"face_features", "eye_colors", "skin_tone", "age_group", "ethnicity", "accessories", "expression",
+                           "tattoos_scars", "hair_color", "body_markings", "facial_hair", "makeup_styles"}, "_section_features"),
+    ("device", "t5xxl", {"device"}, "_section_device"),
+    ("technical", "clip_l", {"photo_type", "photo_weight", "device", "digital_artform", "photographer", "artist"}, "_section_technical"),
+)
+# Conditional categories _update draws again when an input changes, besides the input itself
+_REDRAWN_WITH = {"artform": ("photography_styles",), "subject": ("default_tags", "body_types"), "default_tags": ("body_types",)}
+
+
+def _changed_inputs(old_spec, new_spec):
+    """Category inputs whose value differs between two PromptSpecs."""
+    old_config, new_config = dict(old_spec.config), dict(new_spec.config)
+    return {name for name in old_config.keys() | new_config.keys() if old_config.get(name) != new_config.get(name)}
+
+
+def _redraws_ruled_category(old_spec, new_spec):
+    """Whether an incremental update from old_spec would draw a category that new_spec.rules constrains."""
+    redrawn = _changed_inputs(old_spec, new_spec)
+    redrawn.update(*(_REDRAWN_WITH.get(name, ()) for name in list(redrawn)))
+    return not redrawn.isdisjoint(new_spec.rules.targets)
+
+
+class IncrementalState:
+    """What PromptGenerator.regenerate keeps of one prompt to rebuild only what an input change affects.
+
+    choices are the resolved choices, parts the assembled parts of every
+    section (see _SECTIONS) and outputs the cleaned (t5xxl, clip_l, clip_g).
+    The rest records what the prompt was generated with; when any of it
+    differs, the next prompt is generated in full.
+    """
+
+    __slots__ = ("spec", "seed", "rng_mode", "generation", "clip_token_budget", "choices", "parts", "outputs")
+
+    def __init__(self, spec, seed, rng_mode, generation, clip_token_budget, choices, parts, outputs):
+        self.spec = spec
+        self.seed = seed
+        self.rng_mode = rng_mode
+        self.generation = generation
+        self.clip_token_budget = clip_token_budget
+        self.choices = choices
+        self.parts = parts
+        self.outputs = outputs
+
+
+# --- PromptGenerator Class (Refactored) ---
+class PromptGenerator:
+    def __init__(self, seed=None, legacy_assembly=False, rng_mode="legacy", debug="off", metrics=None,
+                 clip_token_budget=None, stats=None):
+        if rng_mode not in RNG_MODES:
+            raise ValueError(f"Unknown rng_mode {rng_mode!r}, expected one of {RNG_MODES}")
+        if debug not in DEBUG_MODES:
+            raise ValueError(f"Unknown debug mode {debug!r}, expected one of {DEBUG_MODES}")
+        self.rng = random.Random(seed)
+        # Compatibility mode: build the BREAK-marked string and split it with process_string_v2
+        self.legacy_assembly = legacy_assembly
+        # "counter": every category draws from its own sampling.CounterRNG stream keyed by
+        # (64-bit seed, prompt index, category) instead of the shared random.Random
+        self.rng_mode = rng_mode
+        self.counter_rng = sampling.CounterRNG(seed or 0) if rng_mode != "legacy" else None
+        # "unique": the walk is keyed by the constructor seed, each prompt's seed is its position in it
+        self.walk_seed = seed or 0
+        self.walk_position = 0
+        self._walk = None # (PromptSpec, CombinationSpace, {pass number: FeistelPermutation})
+        # What generate_prompt returns as debug output (see DEBUG_MODES); only collected when asked for
+        self.debug = debug
+        self._debug_draws = None # Draws of the prompt being debugged, else None
+        # instrumentation.Metrics: the stage methods are shadowed by timed wrappers on this
+        # instance only, so a generator without metrics runs the plain methods
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.instrument(self, INSTRUMENTED_STAGES)
+        # Most CLIP tokens clip_l and clip_g may each use (see clip_tokens); None leaves them as they are
+        self.clip_token_budget = clip_token_budget
+        # coverage_stats.CoverageStats: counts the choices of every prompt drawn, like metrics only when given
+        self.stats = stats
+        if stats is not None:
+            stats.instrument(self)
+
+    def _reseed(self, seed, prompt_index=0):
+        """Starts a new prompt. prompt_index only matters in counter mode."""
+        if self.counter_rng is None:
+            self.rng.seed(seed) # Same stream as random.Random(seed), without reallocating
+        elif self.rng_mode == "unique":
+            self.walk_position = seed
+            self.counter_rng = sampling.CounterRNG(self.walk_seed, seed) # Only draws photo_weight
+        else:
+            self.counter_rng = sampling.CounterRNG(seed, prompt_index)
+
+    def _rng_for(self, category):
+        """Random source for one category: the shared legacy stream, or the category's own counter stream."""
+        rng = self.rng if self.counter_rng is None else self.counter_rng.stream(category)
+        if self._debug_draws is not None:
+            return _RecordingRNG(rng, category, self._debug_draws)
+        return rng
+
+    def _draw(self, category):
+        """Resolves one CategorySpec, drawing from the category's random source if it needs a draw."""
+        if category.sampler is None:
+            return category.value
+        return category.sampler(self._rng_for(category.name))
+
+    def _get_choice(self, input_value, default_choices, category=None):
+        """Internal helper to get a single choice, handling random/disabled."""
+        alias_table = VOCABULARY.alias_table(category) if category else None
+        return self._draw(CategorySpec(category, input_value, default_choices, alias_table=alias_table))
+
+    def _get_multiple_choices(self, input_value, default_choices, min_count=1, max_count=1, category=None):
+        """Helper to get multiple choices, useful for things like lighting."""
+        alias_table = VOCABULARY.alias_table(category) if category else None
+        return self._draw(CategorySpec(category, input_value, default_choices, (min_count, max_count), alias_table))
 
     def clean_prompt_string(self, text):
-        """Cleans up common prompt string issues."""
+        """Cleans up common prompt string issues in a single pass. Same output as clean_prompt_string_legacy."""
+        if not text: return ""
+        pattern = _ASCII_SEPARATOR_RUN if text.isascii() else _SEPARATOR_RUN
+        text = pattern.sub(_replace_separator_run, text)
+        # The only unmatched runs that still change are at the ends: a lone space,
+        # or ", " before the first word (matched runs there come back stripped)
+        if text[:1] == " ":
+            text = text[1:]
+        elif text[:1] == ",":
+            text = text[2:]
+        if text[-1:] == " ":
+            text = text[:-1]
+        # Duplicate-word fixes stay sequential str.replace calls: their left-to-right,
+        # non-overlapping matching is part of the output. All of them contain " as " but one.
+        if " as " in text:
+            text = text.replace(" of as ", " of ")
+            text = text.replace(" a as ", " as ")
+            text = text.replace(" as as ", " as ")  # Fix "working as as a"
+        if " with with " in text:
+            text = text.replace(" with with ", " with ")  # Fix "with with"
+        return text
+
+    def clean_prompt_string_legacy(self, text):
+        """Original regex-by-regex cleaner, kept as the reference for clean_prompt_string."""
         if not text: return ""
         # Remove extra spaces around commas, then replace multiple commas with one
         text = re.sub(r'\s*,\s*', ', ', text)
@@ -165,7 +1127,7 @@ class PromptGenerator:
 
     def strip_weights_for_natural_language(self, text):
         """Removes parentheses and weights from text for natural language (T5-XXL)."""
-        if not text: return ""
+        if not text or "(" not in text: return text or ""
         # Remove weights like (text:1.5) -> text
         text = re.sub(r'\(([^:)]+):[0-9.]+\)', r'\1', text)
         # Remove simple parentheses (text) -> text
@@ -177,49 +1139,15 @@ class PromptGenerator:
         if not value:
             return ""
 
-        templates = {
-            'role': f"working as {value}",
-            'hairstyle': f"with {value}",
-            'clothing': f"dressed in {value}",
-            'composition': f"The composition follows {value}",
-            'pose': f"The subject is {value}",
-            'face_features': f"with {value}",
-            'eye_color': f"with {value} eyes",
-            'skin_tone': f"with {value} skin",
-            'age_group': f"appearing {value}",
-            'ethnicity': f"of {value} descent",
-            'accessories': f"wearing {value}",
-            'expression': f"with a {value} expression",
-            'tattoos_scars': f"featuring {value}",
-            'hair_color': f"with {value} hair",
-            'body_markings': f"displaying {value}",
-            'facial_hair': f"with {value}",
-            'makeup': f"styled with {value} makeup"
-        }
-
-        return templates.get(category, value)
+        template = _SENTENCE_TEMPLATES.get(category)
+        return template.format(value) if template else value
 
     def _format_debug_info(self, debug_info):
         """Format debug info as readable string"""
-        lines = []
-        lines.append("=== DEBUG INFO - CATEGORY USAGE ===\n")
-
-        # Categories Used
-        lines.append(f"✅ CATEGORIES USED ({len(debug_info['used'])})")
-        for category, value in sorted(debug_info['used'].items()):
-            # Truncate long values
-            display_value = str(value)[:60] + "..." if len(str(value)) > 60 else str(value)
-            lines.append(f"  • {category:20s} = {display_value}")
-
-        # Categories Not Used
-        lines.append(f"\n❌ CATEGORIES NOT USED ({len(debug_info['not_used'])})")
-        for category, reason in sorted(debug_info['not_used'].items()):
-            lines.append(f"  • {category:20s} : {reason}")
+        return format_debug_info(debug_info)
 
-        return "\n".join(lines)
-
-    def process_string_v2(self, combined_prompt, seed, debug_output=""):
-        """Uses regex to split the prompt based on BREAK markers."""
+    def _split_sections(self, combined_prompt):
+        """Splits a BREAK-marked prompt into raw (t5xxl, clip_l, clip_g) text."""
         clip_l_content = ""
         clip_g_content = ""
         t5xxl_content = combined_prompt # Start with full prompt for T5
@@ -238,6 +1166,12 @@ class PromptGenerator:
              # Remove CLIP G block from T5
             t5xxl_content = t5xxl_content.replace(match_g.group(0), '', 1)
 
+        return t5xxl_content, clip_l_content, clip_g_content
+
+    def process_string_v2(self, combined_prompt, seed, debug_output=""):
+        """Uses regex to split the prompt based on BREAK markers."""
+        t5xxl_content, clip_l_content, clip_g_content = self._split_sections(combined_prompt)
+
         # Original prompt is T5 content with markers removed
         original_content = t5xxl_content.replace('BREAK_CLIPL', '').replace('BREAK_CLIPG', '')
 
@@ -253,43 +1187,148 @@ class PromptGenerator:
 
         return original_clean, seed, t5xxl_clean, clip_l_clean, clip_g_clean, debug_output
 
-    def generate_prompt(self, seed, **kwargs):
-        # Use kwargs directly, simplifies passing arguments
-        self.rng = random.Random(seed) # Re-seed for each generation if seed changes
-
-        components = []
-
-        # Debug tracking: Track which categories are used vs not used
-        debug_info = {
-            'used': {},      # Categories that had values and were used
-            'not_used': {},  # Categories that were disabled/empty/ignored
-            'all_inputs': {} # All input values for reference
-        }
-
-        # --- 1. Custom Prompt ---
-        custom = kwargs.get("custom", "")
-        if custom:
-            components.append(custom)
-
-        # --- 2. Artform / Style Lead-in (with photo_type integrated) ---
-        artform = self._get_choice(kwargs.get("artform", "disabled"), ARTFORM)
+    def _resolve_choices(self, spec):
+        """Draws a value for every category of a PromptSpec, keeping the original RNG call order.
+
+        Returns a dict keyed by input name. Categories that were never drawn
+        (e.g. photography_styles for a non-photography artform) are absent.
+        With rules, every draw only picks entries compatible with the values chosen before it.
+        """
+        draw = self._draw if spec.rules is None else rules.ConstrainedDraw(spec.rules, self._rng_for, spec.rule_bans)
+        categories = spec.categories
+        choices = {}
+
+        # --- Artform / Style Lead-in ---
+        artform = draw(categories["artform"])
+        choices["artform"] = artform
+        choices["photo_type"] = draw(categories["photo_type"])
+        if artform.lower() == "photography":
+            choices["photography_styles"] = draw(categories["photography_styles"])
+
+        # --- Subject Definition ---
+        if spec.has_subject:
+            choices["body_types"] = draw(categories["body_types"])
+        else:
+            chosen_default_tag = draw(categories["default_tags"])
+            choices["default_tags"] = chosen_default_tag
+            if chosen_default_tag: # Body type is only drawn when a default tag is used
+                choices["body_types"] = draw(categories["body_types"])
+
+        # --- Core Details, Clothing, Composition & Pose, Environment & Lighting, Physical Features, Camera ---
+        for category in _DRAW_ORDER:
+            choices[category] = draw(categories[category])
+
+        if choices["photo_type"]:
+            # Framing weight for the CLIP_L copy of photo_type
+            choices["photo_weight"] = round(self._rng_for("photo_weight").uniform(1.1, 1.5), 1)
+        # --- Technical/Artistic Details ---
+        choices["digital_artform"] = draw(categories["digital_artform"])
+        choices["photographer"] = draw(categories["photographer"])
+        choices["artist"] = draw(categories["artist"])
+
+        self._expand_templates(spec, choices)
+        return choices
+
+    def _expand_templates(self, spec, choices):
+        """Expands the custom and subject templates into choices, after every category draw."""
+        for name, template in spec.templates.items():
+            choices[name] = template.expand(self._rng_for(name), spec.template_lists)
+
+    def _draw_choices(self, spec):
+        """Choices of the current prompt: drawn from the RNG, or read off the unique walk."""
+        if self.rng_mode != "unique":
+            return self._resolve_choices(spec)
+
+        space, permutations = self._combination_walk(spec)
+        # Positions past the end start another pass, in a different order; each pass has no repeats
+        walk_pass, position = divmod(self.walk_position, space.size)
+        permutation = permutations.get(walk_pass)
+        if permutation is None:
+            permutation = permutations[walk_pass] = sampling.FeistelPermutation(space.size, self.walk_seed, walk_pass)
+        number = permutation[position]
+        choices = space.choices(number)
+        # Bans the space could not build in: try the same position in the following passes, which
+        # only meets another seed's combination by chance (not the neighbour's, as stepping on would).
+        # After RULE_WALK_LIMIT passes the prompt is drawn with the rules instead.
+        skipped = 0
+        while not space.allows(choices):
+            skipped += 1
+            if skipped == RULE_WALK_LIMIT:
+                if self._debug_draws is not None:
+                    self._debug_draws.append(("combination", "walk", f"position {position} of {space.size}", "drawn"))
+                return self._resolve_choices(spec)
+            permutation = permutations.get(walk_pass + skipped)
+            if permutation is None:
+                permutation = permutations[walk_pass + skipped] = sampling.FeistelPermutation(
+                    space.size, self.walk_seed, walk_pass + skipped)
+            number = permutation[position]
+            choices = space.choices(number)
+        if self._debug_draws is not None:
+            self._debug_draws.append(("combination", "walk", f"position {position} of {space.size}", number))
+        if choices["photo_type"]:
+            choices["photo_weight"] = round(self._rng_for("photo_weight").uniform(1.1, 1.5), 1)
+        # Templates are not part of the walk: they are expanded per prompt from its counter stream
+        self._expand_templates(spec, choices)
+        return choices
+
+    def _combination_walk(self, spec):
+        if self._walk is None or self._walk[0] is not spec:
+            self._walk = (spec, CombinationSpace(spec), {})
+        return self._walk[1], self._walk[2]
+
+    def count_combinations(self, **kwargs):
+        """Number of distinct prompts unique mode can produce for this config before a pass repeats.
+
+        With rules, only allowed combinations are counted, unless a ban links
+        digits too large to list (CombinationSpace.rule_checks). Then this is
+        an upper bound: a banned combination is replaced by the same position
+        of a later pass, which can repeat a prompt within a pass.
+        """
+        return self._combination_walk(PromptSpec.compile(kwargs))[0].size
+
+    def _assemble_segments(self, choices, spec):
+        """Builds the t5xxl, clip_g and clip_l segments from resolved choices. Draws no randomness."""
+        return self._join_sections({name: getattr(self, method)(choices, spec) for name, _, _, method in _SECTIONS}, choices)
+
+    def _join_sections(self, parts, choices):
+        """PromptSegments of per-section parts ({section name: [part, ...]}), in _SECTIONS order."""
+        segments = PromptSegments()
+        for name, target, _, _ in _SECTIONS:
+            if name == "environment": # The CLIP G block is cut out of the T5-XXL text at this point
+                segments.clip_g_index = len(segments.t5xxl)
+            getattr(segments, target).extend(parts[name])
+        if self.clip_token_budget is not None:
+            self._add_budget_groups(segments, choices)
+        return segments
+
+    # --- 1. Custom Prompt ---
+    def _section_custom(self, choices, spec):
+        custom = choices.get("custom", spec.custom)
+        return [custom] if custom else []
+
+    # --- 2. Artform / Style Lead-in (with photo_type integrated) ---
+    def _section_lead_in(self, choices, spec):
+        parts = []
+        artform = choices["artform"]
         is_photographer = (artform.lower() == "photography")
 
-        # Get photo_type early to integrate into opening
-        photo_type = self._get_choice(kwargs.get("photo_type", "random"), PHOTO_TYPE)
+        # photo_type is integrated into the opening
+        photo_type = choices["photo_type"]
+        # "of" only when a subject or default tag follows: a rule can leave default_tags empty
+        connects = spec.adds_connector and bool(choices.get("subject", spec.subject) or choices.get("default_tags"))
 
         if is_photographer:
-            photo_style = self._get_choice(kwargs.get("photography_styles", "random"), PHOTOGRAPHY_STYLES)
+            photo_style = choices["photography_styles"]
             # Build opening with optional photo_type
             opening_parts = []
             if photo_type:
                 opening_parts.append(f"A {photo_type}")
             opening_parts.append(photo_style if photo_style else "photography")
-            components.append(" ".join(opening_parts))
+            parts.append(" ".join(opening_parts))
 
             # Add "of" if a subject or default tag will follow
-            if kwargs.get("subject") or kwargs.get("default_tags", "disabled").lower() != "disabled":
-                 components.append("of") # Add connector word
+            if connects:
+                 parts.append("of") # Add connector word
 
         elif artform and artform.lower() != "disabled":
              # Build opening with optional photo_type
@@ -297,37 +1336,37 @@ class PromptGenerator:
              if photo_type:
                  opening_parts.append(f"A {photo_type}")
              opening_parts.append(artform)
-             components.append(" ".join(opening_parts))
+             parts.append(" ".join(opening_parts))
 
              # Add "of" if a subject or default tag will follow and artform isn't inherently descriptive like 'illustration'
-             if kwargs.get("subject") or kwargs.get("default_tags", "disabled").lower() != "disabled":
+             if connects:
                  # Could refine this list if needed
-                 if artform.lower() not in ["illustration", "painting", "drawing", "sketch"]:
-                     components.append("of")
+                 if artform.lower() not in _DESCRIPTIVE_ARTFORMS:
+                     parts.append("of")
 
         elif photo_type:
             # Standalone photo_type when artform is disabled
-            components.append(f"A {photo_type}")
+            parts.append(f"A {photo_type}")
             # Add "of" if a subject or default tag will follow
-            if kwargs.get("subject") or kwargs.get("default_tags", "disabled").lower() != "disabled":
-                components.append("of")
+            if connects:
+                parts.append("of")
+        return parts
 
-        # --- 3. Subject Definition ---
-        subject = kwargs.get("subject", "")
-        default_tags_input = kwargs.get("default_tags", "random")
-        body_type_input = kwargs.get("body_types", "random")
+    # --- 3. Subject Definition ---
+    def _section_subject(self, choices, spec):
+        subject = choices.get("subject", spec.subject)
 
         chosen_subject_elements = []
         # User provided subject takes precedence (but not if it's "random" or "disabled")
-        if subject and subject.lower() not in ["random", "disabled"]:
-            chosen_body_type = self._get_choice(body_type_input, BODY_TYPES)
+        if spec.has_subject:
+            chosen_body_type = choices["body_types"]
             if chosen_body_type:
                  chosen_subject_elements.extend(["a", chosen_body_type]) # e.g., "a muscular"
             chosen_subject_elements.append(subject) # e.g., "a muscular woman"
         else: # No specific subject, use default tags
-            chosen_default_tag = self._get_choice(default_tags_input, DEFAULT_TAGS)
+            chosen_default_tag = choices["default_tags"]
             if chosen_default_tag: # Only proceed if default tag isn't disabled/empty
-                chosen_body_type = self._get_choice(body_type_input, BODY_TYPES)
+                chosen_body_type = choices["body_types"]
                 # Check if tag starts with a/an, handle body type insertion
                 starts_with_article = chosen_default_tag.lower().startswith(("a ", "an "))
                 if chosen_body_type:
@@ -342,17 +1381,15 @@ class PromptGenerator:
                     # Just use the default tag
                      chosen_subject_elements.append(chosen_default_tag)
 
-        if chosen_subject_elements:
-            components.append(" ".join(chosen_subject_elements))
+        return [" ".join(chosen_subject_elements)] if chosen_subject_elements else []
 
-        # Store chosen tag for gender check later
-        resolved_subject_desc = " ".join(chosen_subject_elements).lower()
-
-        # --- 4. Core Details (Roles, Hairstyles, Additional Details) ---
+    # --- 4. Core Details (Roles, Hairstyles, Additional Details) ---
+    def _section_core(self, choices, spec):
+        parts = []
         # Build natural language sentences instead of comma-joining
-        role = self._get_choice(kwargs.get("roles", "random"), ROLES)
-        hairstyle = self._get_choice(kwargs.get("hairstyles", "random"), HAIRSTYLES)
-        additional_details = self._get_choice(kwargs.get("additional_details", "random"), ADDITIONAL_DETAILS)
+        role = choices["roles"]
+        hairstyle = choices["hairstyles"]
+        additional_details = choices["additional_details"]
 
         core_parts = []
         if role:
@@ -361,20 +1398,22 @@ class PromptGenerator:
             core_parts.append(self._build_natural_language_sentence('hairstyle', hairstyle))
 
         if core_parts:
-            components.append(" ".join(core_parts))
+            parts.append(" ".join(core_parts))
 
         if additional_details:
-            components.append(f". {additional_details}")
+            parts.append(f". {additional_details}")
+        return parts
 
-        # --- 5. Clothing ---
-        clothing = self._get_choice(kwargs.get("clothing", "random"), CLOTHING)
-        if clothing:
-            components.append(f". Dressed in {clothing}")
+    # --- 5. Clothing ---
+    def _section_clothing(self, choices, spec):
+        clothing = choices["clothing"]
+        return [f". Dressed in {clothing}"] if clothing else []
 
-        # --- 6. Composition & Pose ---
+    # --- 6. Composition & Pose ---
+    def _section_composition(self, choices, spec):
         # Build natural language sentences with periods
-        composition = self._get_choice(kwargs.get("composition", "random"), COMPOSITION)
-        pose = self._get_choice(kwargs.get("pose", "random"), POSE)
+        composition = choices["composition"]
+        pose = choices["pose"]
 
         comp_pose_parts = []
         if pose:
@@ -382,51 +1421,34 @@ class PromptGenerator:
         if composition:
             comp_pose_parts.append(f"The composition follows {composition}")
 
-        if comp_pose_parts:
-            components.append(". " + ". ".join(comp_pose_parts))
-
-        # --- BREAK CLIP G 1 ---
-        components.append("BREAK_CLIPG")
-
-        # --- 7. Environment (Background, Place) ---
-        environment = [
-             self._get_choice(kwargs.get("background", "random"), BACKGROUND),
-             self._get_choice(kwargs.get("place", "random"), PLACE),
-        ]
-        components.append(smart_join(environment))
-
-
-        # --- 8. Lighting ---
-        # Use multi-choice helper for lighting if random
-        lighting_input = kwargs.get("lighting", "random")
-        if lighting_input.lower() == "random":
-             lighting = self._get_multiple_choices(lighting_input, LIGHTING, min_count=2, max_count=4) # Example: 2-4 items
-        else:
-             lighting = self._get_choice(lighting_input, LIGHTING)
-
-        if lighting:
-            components.append(lighting)
-
-
-        # --- BREAK CLIP G 2 ---
-        components.append("BREAK_CLIPG")
-
-        # --- 9. Physical Features ---
-        # Get all feature values
-        face_features = self._get_choice(kwargs.get("face_features", "random"), FACE_FEATURES)
-        eye_color = self._get_choice(kwargs.get("eye_colors", "random"), EYE_COLORS)
-        skin_tone = self._get_choice(kwargs.get("skin_tone", "random"), SKIN_TONE)
-        age_group = self._get_choice(kwargs.get("age_group", "random"), AGE_GROUP)
-        ethnicity = self._get_choice(kwargs.get("ethnicity", "random"), ETHNICITY)
-        accessories = self._get_choice(kwargs.get("accessories", "random"), ACCESSORIES)
-        expression = self._get_choice(kwargs.get("expression", "random"), EXPRESSION)
-        tattoos_scars = self._get_choice(kwargs.get("tattoos_scars", "random"), TATTOOS_SCARS)
-        hair_color = self._get_choice(kwargs.get("hair_color", "random"), HAIR_COLOR)
-        body_markings = self._get_choice(kwargs.get("body_markings", "random"), BODY_MARKINGS)
+        return [". " + ". ".join(comp_pose_parts)] if comp_pose_parts else []
+
+    # --- 7. Environment (Background, Place) ---
+    def _section_environment(self, choices, spec):
+        environment = [choices["background"], choices["place"]]
+        return [smart_join(environment)]
+
+    # --- 8. Lighting ---
+    def _section_lighting(self, choices, spec):
+        lighting = choices["lighting"]
+        return [lighting] if lighting else []
+
+    # --- 9. Physical Features ---
+    def _section_features(self, choices, spec):
+        face_features = choices["face_features"]
+        eye_color = choices["eye_colors"]
+        skin_tone = choices["skin_tone"]
+        age_group = choices["age_group"]
+        ethnicity = choices["ethnicity"]
+        accessories = choices["accessories"]
+        expression = choices["expression"]
+        tattoos_scars = choices["tattoos_scars"]
+        hair_color = choices["hair_color"]
+        body_markings = choices["body_markings"]
 
         # Facial hair and makeup - now independent of gender for modern/creative contexts
-        facial_hair = self._get_choice(kwargs.get("facial_hair", "random"), FACIAL_HAIR)
-        makeup = self._get_choice(kwargs.get("makeup_styles", "random"), MAKEUP_STYLES)
+        facial_hair = choices["facial_hair"]
+        makeup = choices["makeup_styles"]
 
         # Group features into coherent sentences
         feature_sentences = []
@@ -448,8 +1470,7 @@ class PromptGenerator:
             identity_parts.append(f"{skin_tone} skin")
         if age_group:
             # Age groups that are nouns need articles
-            age_nouns = ["adult", "child", "infant", "preteen", "senior", "teenager", "toddler", "young adult"]
-            if age_group in age_nouns:
+            if age_group in _AGE_NOUNS:
                 article = "an" if age_group[0].lower() in "aeiou" else "a"
                 identity_parts.append(f"appearing as {article} {age_group}")
             else:
@@ -477,100 +1498,473 @@ class PromptGenerator:
         if detail_parts:
             feature_sentences.append("Notable features include " + ", ".join(detail_parts))
 
-        if feature_sentences:
-            components.append(". " + ". ".join(feature_sentences))
-
-        # --- 10. Camera/Device (for T5-XXL natural language) ---
-        device = self._get_choice(kwargs.get("device", "random"), DEVICE)
-        if device:
-            components.append(f". The image was captured using a {device}")
+        return [". " + ". ".join(feature_sentences)] if feature_sentences else []
 
-        # --- BREAK CLIP L 1 ---
-        components.append("BREAK_CLIPL")
+    # --- 10. Camera/Device (for T5-XXL natural language) ---
+    def _section_device(self, choices, spec):
+        device = choices["device"]
+        return [f". The image was captured using a {device}"] if device else []
 
-        # --- 11. Technical/Artistic Details (for CLIP_L keywords) ---
+    # --- 11. Technical/Artistic Details (for CLIP_L keywords) ---
+    def _section_technical(self, choices, spec):
         # All categories now work independently - users control via their selections
         tech_artist_details = []
 
         # Framing (weighted) - reuse the same value fetched for T5-XXL opening
         # This ensures consistency between T5-XXL and CLIP_L
+        photo_type = choices["photo_type"]
         if photo_type:
-            random_value = round(self.rng.uniform(1.1, 1.5), 1)
-            tech_artist_details.append(f"({photo_type}:{random_value})")
+            tech_artist_details.append(f"({photo_type}:{choices['photo_weight']})")
 
-        # Device - already fetched above for T5-XXL, reuse the same value
+        # Device - same value as the T5-XXL camera sentence
+        device = choices["device"]
         if device:
             tech_artist_details.append(f"shot on {device}")
 
         # Digital artform - works independently
-        digital_artform = self._get_choice(kwargs.get("digital_artform", "random"), DIGITAL_ARTFORM)
+        digital_artform = choices["digital_artform"]
         if digital_artform:
             tech_artist_details.append(digital_artform)
 
         # Photographer - works independently
-        photographer = self._get_choice(kwargs.get("photographer", "random"), PHOTOGRAPHER)
+        photographer = choices["photographer"]
         if photographer:
             tech_artist_details.append(f"photo by {photographer}")
 
         # Artist - works independently
-        artist = self._get_choice(kwargs.get("artist", "random"), ARTIST)
+        artist = choices["artist"]
         if artist:
             tech_artist_details.append(f"by {artist}")
 
-        components.append(smart_join(tech_artist_details))
+        return [smart_join(tech_artist_details)]
+
+    def _add_budget_groups(self, segments, choices):
+        """The CLIP blocks as clip_tokens.fit_groups groups, for fitting them to the token budget."""
+        entry = self._budget_item
+        photo_type, device, lighting = choices["photo_type"], choices["device"], choices["lighting"]
+        digital_artform, photographer, artist = choices["digital_artform"], choices["photographer"], choices["artist"]
+        segments.clip_l_groups = [[
+            ("photo_type", [entry(f"({photo_type}:{choices['photo_weight']})")] if photo_type else []),
+            ("device", [entry(f"shot on {device}")] if device else []),
+            ("digital_artform", [entry(digital_artform)] if digital_artform else []),
+            ("photographer", [entry(f"photo by {photographer}")] if photographer else []),
+            ("artist", [entry(f"by {artist}")] if artist else []),
+        ]]
+        segments.clip_g_groups = [
+            [(name, [entry(choices[name])] if choices[name] else []) for name in ("background", "place")],
+            [("lighting", [entry(term) for term in lighting.split(", ")] if lighting else [])],
+        ]
 
-        # --- BREAK CLIP L 2 ---
-        components.append("BREAK_CLIPL")
+    @staticmethod
+    def _budget_item(text):
+        return clip_tokens.BudgetItem(text, clip_token_counter().count_entry(text))
 
-        # --- Final Assembly & Processing ---
-        # Join all collected components, using smart_join to handle potential empty strings between sections
-        full_prompt_string = smart_join(components, separator=" ")
+    def _fit_clip_block(self, text, groups, drop_order, trim=()):
+        """text, or the block rebuilt from groups with parts dropped until it fits the token budget."""
+        counter = clip_token_counter()
+        if counter.count(text) <= self.clip_token_budget:
+            return text
+        clip_tokens.fit_groups(groups, self.clip_token_budget, counter, drop_order, " ", trim)
+        return self.clean_prompt_string(clip_tokens.join_groups(groups))
 
-        # --- Debug Info: Track all category usage ---
-        all_categories = [
-            'custom', 'subject', 'default_tags', 'body_types', 'artform', 'photography_styles',
-            'digital_artform', 'artist', 'photographer', 'roles', 'hairstyles', 'hair_color',
-            'additional_details', 'lighting', 'clothing', 'composition', 'pose', 'background',
-            'place', 'age_group', 'ethnicity', 'accessories', 'expression', 'face_features',
-            'eye_colors', 'skin_tone', 'facial_hair', 'body_markings', 'makeup_styles',
-            'tattoos_scars', 'photo_type', 'device'
-        ]
+    def _assemble_prompt(self, choices, spec):
+        """Builds the legacy BREAK-marked prompt string (compatibility mode)."""
+        return self._assemble_segments(choices, spec).to_marked_string()
 
-        for category in all_categories:
-            input_value = kwargs.get(category, "disabled")
-            debug_info['all_inputs'][category] = input_value
+    def _collect_debug_info(self, choices, spec):
+        """Tracks which categories were used vs not used for the debug report."""
+        debug_info = {
+            'used': dict(spec.debug_used),          # Categories that had values and were used
+            'not_used': dict(spec.debug_not_used),  # Categories that were disabled/empty/ignored
+            'all_inputs': dict(spec.debug_inputs)   # All input values for reference
+        }
 
-            # Determine if category was actually used and provide specific reason if not
-            if not input_value or input_value == "":
-                debug_info['not_used'][category] = "empty (not provided)"
-            elif input_value.lower() == "disabled":
-                debug_info['not_used'][category] = "disabled (explicitly set)"
-            elif input_value.lower() == "random":
-                # Random means it was used (a value was selected)
-                debug_info['used'][category] = "random (value selected)"
-            else:
-                # Specific value was used
-                debug_info['used'][category] = input_value
+        # photography_styles only used when artform is photography
+        artform = choices["artform"]
+        if spec.debug_checks_photography_styles and artform.lower() != "photography":
+            debug_info['not_used']['photography_styles'] = f"ignored (artform={artform}, not photography)"
+            del debug_info['used']['photography_styles']
+
+        return debug_info
+
+    def _debug_record(self, choices, spec, draws):
+        """DebugRecord of a resolved prompt: the chosen values and why every other category was skipped."""
+        debug_info = self._collect_debug_info(choices, spec)
+        used, not_used = debug_info['used'], debug_info['not_used']
+
+        for category in list(used):
+            if category in spec.templates:
+                used[category] = f"template: {choices[category]}"
+                continue
+            if category not in spec.categories:
+                continue # custom and subject are used as typed
+            value = choices.get(category)
+            if value is None:
+                not_used[category] = "not drawn (no default tag)" if category == "body_types" else "not drawn"
+                del used[category]
+            elif value == "":
+                not_used[category] = "empty value chosen"
+                del used[category]
+            elif category == "facial_hair" and choices.get("makeup_styles"):
+                not_used[category] = f"hidden (makeup_styles={choices['makeup_styles']} takes precedence)"
+                del used[category]
+            elif spec.categories[category].mode == "list":
+                used[category] = f"from list: {value}"
+            elif spec.categories[category].sampler is not None:
+                used[category] = f"random: {value}"
+
+        return DebugRecord(spec.debug_inputs, choices, used, not_used, draws)
+
+    def _draw_with_debug(self, spec):
+        """(choices, debug output) of the current prompt; the debug output is "" when debug is off."""
+        if self.debug == "off":
+            return self._draw_choices(spec), ""
+        self._debug_draws = draws = []
+        try:
+            choices = self._draw_choices(spec)
+        finally:
+            self._debug_draws = None
+        return choices, self._debug_output(choices, spec, draws)
+
+    def _debug_output(self, choices, spec, draws):
+        # Structured record; the text is only rendered in "text" mode
+        debug_output = self._debug_record(choices, spec, draws)
+        return debug_output.render() if self.debug == "text" else debug_output
 
-        # Special cases: Check for conditional logic
-        # default_tags is ignored when subject is provided
-        if kwargs.get('subject', '') and kwargs.get('subject', '').lower() not in ['random', 'disabled']:
-            if 'default_tags' in debug_info['used']:
-                debug_info['not_used']['default_tags'] = "ignored (subject takes precedence)"
-                del debug_info['used']['default_tags']
+    def generate_prompt(self, seed, **kwargs):
+        # Use kwargs directly, simplifies passing arguments
+        self._reseed(seed) # Re-seed for each generation if seed changes
+
+        spec = PromptSpec.compile(kwargs)
+        choices, debug_output = self._draw_with_debug(spec)
+
+        if self.legacy_assembly:
+            # Process using the V2 splitter
+            return self.process_string_v2(self._assemble_prompt(choices, spec), seed, debug_output)
+
+        # The T5-XXL text doubles as the "original" prompt: with the CLIP blocks cut out they are identical
+        t5xxl_clean, clip_l_clean, clip_g_clean = self._clean_segments(self._assemble_segments(choices, spec))
+        return t5xxl_clean, seed, t5xxl_clean, clip_l_clean, clip_g_clean, debug_output
+
+    def regenerate(self, previous, seed, **kwargs):
+        """generate_prompt that reuses the IncrementalState of the previous prompt; returns (prompt, state).
+
+        When only category inputs changed since previous, only those categories
+        are drawn again, and only the sections and outputs that read them are
+        rebuilt; every other choice is kept as it was. Redraws come from the
+        category's own counter stream, so in counter mode the result equals
+        generate_prompt. A new seed, rng_mode, budget or vocabulary, unique
+        mode, and an input change that would draw a category the rules
+        constrain all mean a full generation; categories no rule names draw as
+        without rules. The debug report only lists the draws of the categories
+        that were drawn again.
+        """
+        spec = PromptSpec.compile(kwargs)
+        if (previous is None or previous.seed != seed or previous.rng_mode != self.rng_mode
+                or previous.generation != VOCABULARY.generation or previous.clip_token_budget != self.clip_token_budget
+                or self.rng_mode == "unique" or (spec.rules is not None and _redraws_ruled_category(previous.spec, spec))):
+            self._reseed(seed)
+            choices, debug_output = self._draw_with_debug(spec)
+            parts = {name: getattr(self, method)(choices, spec) for name, _, _, method in _SECTIONS}
+            outputs = self._clean_segments(self._join_sections(parts, choices))
+        elif self.debug == "off":
+            debug_output = ""
+            choices, parts, outputs = self._update(previous, spec, seed)
+        else:
+            self._debug_draws = draws = []
+            try:
+                choices, parts, outputs = self._update(previous, spec, seed)
+            finally:
+                self._debug_draws = None
+            debug_output = self._debug_output(choices, spec, draws)
+
+        state = IncrementalState(spec, seed, self.rng_mode, VOCABULARY.generation, self.clip_token_budget,
+                                 choices, parts, outputs)
+        t5xxl_clean, clip_l_clean, clip_g_clean = outputs
+        return (t5xxl_clean, seed, t5xxl_clean, clip_l_clean, clip_g_clean, debug_output), state
+
+    def _update(self, previous, spec, seed):
+        """(choices, parts, outputs) of spec, rebuilt from previous where the inputs did not change."""
+        if spec is previous.spec:
+            return previous.choices, previous.parts, previous.outputs
+        changed = _changed_inputs(previous.spec, spec)
+
+        self._reseed(seed)
+        # Legacy mode too draws from counter streams, to leave the other draws of the shared stream alone
+        streams = self.counter_rng if self.counter_rng is not None else sampling.CounterRNG(seed)
+
+        def rng_for(name):
+            if self._debug_draws is not None:
+                return _RecordingRNG(streams.stream(name), name, self._debug_draws)
+            return streams.stream(name)
+
+        def draw(category):
+            return category.value if category.sampler is None else category.sampler(rng_for(category.name))
+
+        categories = spec.categories
+        choices = dict(previous.choices)
+
+        def keep_drawn(name, needed):
+            # Conditional categories follow the draw logic of _resolve_choices
+            if not needed:
+                choices.pop(name, None)
+            elif name in changed or name not in choices:
+                choices[name] = draw(categories[name])
+
+        for name in categories:
+            if name in changed and name not in ("photography_styles", "default_tags", "body_types"):
+                choices[name] = draw(categories[name])
+        keep_drawn("photography_styles", choices["artform"].lower() == "photography")
+        keep_drawn("default_tags", not spec.has_subject)
+        keep_drawn("body_types", spec.has_subject or bool(choices.get("default_tags")))
+        if not choices["photo_type"]:
+            choices.pop("photo_weight", None)
+        elif "photo_weight" not in choices:
+            choices["photo_weight"] = round(rng_for("photo_weight").uniform(1.1, 1.5), 1)
+        for name in ("custom", "subject"):
+            if name in changed:
+                choices.pop(name, None)
+                if name in spec.templates:
+                    choices[name] = spec.templates[name].expand(rng_for(name), spec.template_lists)
+
+        # Sections read the inputs as well as the choices (the lead-in's connector, the subject text)
+        changed |= {name for name in choices.keys() | previous.choices.keys()
+                    if choices.get(name) != previous.choices.get(name)}
+        parts = dict(previous.parts)
+        rebuilt = set()
+        for name, target, reads, method in _SECTIONS:
+            if reads & changed:
+                section = getattr(self, method)(choices, spec)
+                if section != parts[name]:
+                    parts[name] = section
+                    rebuilt.add(target)
+        if not rebuilt:
+            return choices, parts, previous.outputs
+
+        segments = self._join_sections(parts, choices)
+        t5xxl_clean, clip_l_clean, clip_g_clean = previous.outputs
+        if "t5xxl" in rebuilt:
+            t5xxl_clean = self._clean_t5xxl(segments)
+        if "clip_l" in rebuilt:
+            clip_l_clean = self._clean_clip_l(segments)
+        if "clip_g" in rebuilt:
+            clip_g_clean = self._clean_clip_g(segments)
+        return choices, parts, (t5xxl_clean, clip_l_clean, clip_g_clean)
+
+    def generate_batch(self, seeds, **kwargs):
+        """Generates one prompt per seed from a single shared config.
+
+        Produces the same strings as calling generate_prompt seed by seed, but
+        skips the per-prompt debug report and the unused "original" cleanup pass.
+        Returns (prompts, t5xxl, clip_l, clip_g, seeds) as parallel lists.
+        """
+        return self._generate_rows(((seed, seed, 0) for seed in seeds), PromptSpec.compile(kwargs))
+
+    def generate_indexed(self, seed, indices, **kwargs):
+        """Counter mode only: generates prompt (seed, index) for every index, each computed independently.
+
+        Any index of a huge batch can be produced on its own, e.g. by another
+        process, and gives the same strings. Returns (prompts, t5xxl, clip_l,
+        clip_g, indices) as parallel lists.
+        """
+        if self.counter_rng is None:
+            raise ValueError("generate_indexed requires rng_mode='counter'")
+        return self._generate_rows(((index, seed, index) for index in indices), PromptSpec.compile(kwargs))
+
+    def _generate_rows(self, rows, spec):
+        """Renders (label, seed, prompt index) rows into (prompts, t5xxl, clip_l, clip_g, labels)."""
+        prompts, t5xxl_column, clip_l_column, clip_g_column, label_column = [], [], [], [], []
+        for label, seed, prompt_index in rows:
+            self._reseed(seed, prompt_index)
+            prompt, t5xxl_clean, clip_l_clean, clip_g_clean = self._render_row(self._draw_choices(spec), spec)
+            prompts.append(prompt)
+            t5xxl_column.append(t5xxl_clean)
+            clip_l_column.append(clip_l_clean)
+            clip_g_column.append(clip_g_clean)
+            label_column.append(label)
+
+        return prompts, t5xxl_column, clip_l_column, clip_g_column, label_column
+
+    def _clean_segments(self, segments):
+        """Cleans assembled segments into (t5xxl, clip_l, clip_g) output strings."""
+        return self._clean_t5xxl(segments), self._clean_clip_l(segments), self._clean_clip_g(segments)
+
+    def _clean_t5xxl(self, segments):
+        return self.clean_prompt_string(self.strip_weights_for_natural_language(segments.raw_t5xxl()))
+
+    def _clean_clip_l(self, segments):
+        clip_l_clean = self.clean_prompt_string(segments.raw_clip_l())
+        if segments.clip_l_groups is not None:
+            clip_l_clean = self._fit_clip_block(clip_l_clean, segments.clip_l_groups, CLIP_L_DROP_ORDER)
+        return clip_l_clean
+
+    def _clean_clip_g(self, segments):
+        clip_g_clean = self.clean_prompt_string(segments.raw_clip_g())
+        if segments.clip_g_groups is not None:
+            clip_g_clean = self._fit_clip_block(clip_g_clean, segments.clip_g_groups, CLIP_G_DROP_ORDER, CLIP_G_TRIM)
+        return clip_g_clean
+
+    def _render_row(self, choices, spec):
+        """Assembles and cleans one batch row: (prompt, t5xxl, clip_l, clip_g)."""
+        if self.legacy_assembly:
+            t5xxl_content, clip_l_content, clip_g_content = self._split_sections(self._assemble_prompt(choices, spec))
+            t5xxl_clean = self.clean_prompt_string(self.strip_weights_for_natural_language(t5xxl_content))
+            clip_l_clean = self.clean_prompt_string(clip_l_content)
+            clip_g_clean = self.clean_prompt_string(clip_g_content)
+        else:
+            t5xxl_clean, clip_l_clean, clip_g_clean = self._clean_segments(self._assemble_segments(choices, spec))
+
+        return smart_join([t5xxl_clean, clip_l_clean, clip_g_clean]), t5xxl_clean, clip_l_clean, clip_g_clean
+
+
+# --- Node Result Caching ---
+# Hidden ComfyUI inputs; they describe the workflow around the node, not its own inputs
+HIDDEN_INPUTS = ("prompt", "unique_id")
+
+
+def input_fingerprint(kwargs):
+    """Stable hash of a node's inputs (seed included), independent of argument order."""
+    kwargs = {name: value for name, value in kwargs.items() if name not in HIDDEN_INPUTS}
+    canonical = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU cache of finished node results with an optional TTL.
+
+    max_size=0 disables caching; ttl=None keeps entries until they are evicted.
+    """
+
+    def __init__(self, max_size=256, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict() # key -> (stored_at, value), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            if self.max_size <= 0:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def configure(self, max_size=None, ttl=None):
+        """Changes the size and/or TTL; shrinking evicts the oldest entries."""
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl if ttl > 0 else None
+            while len(self._entries) > max(self.max_size, 0):
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Size and TTL (seconds, 0 = no expiry) can be set through the environment
+RESULT_CACHE = ResultCache(
+    max_size=int(os.environ.get("FLUX_PROMPT_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("FLUX_PROMPT_CACHE_TTL", "0")) or None,
+)
+
+
+def output_connected(workflow, node_id, output_index):
+    """Whether any node of an API-format workflow reads output output_index of node node_id.
+
+    Without a workflow (the node called from Python) every output counts as connected.
+    """
+    if workflow is None or node_id is None:
+        return True
+    node_id = str(node_id)
+    for node in workflow.values():
+        for value in node.get("inputs", {}).values():
+            # Links are [source node id, output index]
+            if isinstance(value, list) and len(value) == 2 and str(value[0]) == node_id and value[1] == output_index:
+                return True
+    return False
+
+
+# --- Optional Prompt Service Client ---
+# With FLUX_PROMPT_SERVICE_URL set (http://host:port or unix:/path), the node asks a running
+# service.py for its prompts instead of generating them in-process; it falls back to local
+# generation when the service cannot be reached.
+SERVICE_URL = os.environ.get("FLUX_PROMPT_SERVICE_URL") or None
+_service_clients = threading.local() # One kept-alive connection per thread
+
+def _service_row(kwargs):
+    """(prompt, t5xxl, clip_l, clip_g, seed) of the node's inputs from the prompt service, or None."""
+    client = getattr(_service_clients, "client", None)
+    if client is None:
+        try:
+            from . import service
+        except ImportError:
+            import service
+        client = _service_clients.client = service.ServiceClient(SERVICE_URL)
+    inputs = {name: value for name, value in kwargs.items() if name in ALL_CATEGORIES}
+    try:
+        row = client.generate(kwargs.get("seed", 0), kwargs.get("rng_mode", "legacy"), **inputs)
+    except (OSError, http.client.HTTPException, RuntimeError, ValueError) as e:
+        print(f"Warning: Prompt service at {SERVICE_URL} failed ({e}), generating locally.")
+        return None
+    return row["prompt"], row["t5xxl"], row["clip_l"], row["clip_g"], str(row["seed"])
 
-        # photography_styles only used when artform is photography
-        if kwargs.get('photography_styles', '') and kwargs.get('photography_styles', '').lower() not in ['disabled', '']:
-            if artform.lower() != "photography":
-                if 'photography_styles' in debug_info['used']:
-                    debug_info['not_used']['photography_styles'] = f"ignored (artform={artform}, not photography)"
-                    del debug_info['used']['photography_styles']
 
-        # Format debug output as readable string
-        debug_output = self._format_debug_info(debug_info)
+def clip_token_counts(clip_l, clip_g):
+    """(clip_l tokens, clip_g tokens) of the node's outputs."""
+    counter = clip_token_counter()
+    return counter.count(clip_l), counter.count(clip_g)
 
-        # Process using the V2 splitter
-        return self.process_string_v2(full_prompt_string, seed, debug_output)
+
+def _vocabulary_changed(categories):
+    # Every compiled spec holds the lists (and alias tables) of all categories, and cached
+    # results were drawn from them; unique-mode walks are rebuilt along with their spec
+    _compile_prompt_spec.cache_clear()
+    RESULT_CACHE.clear()
+    if _clip_counter is not None:
+        for category in categories:
+            if category in CLIP_CATEGORIES:
+                _clip_counter.precount(VOCABULARY[category])
+
+VOCABULARY.add_listener(_vocabulary_changed)
 
 
 # --- ComfyUI Node Class (Updated RETURN_TYPES) ---
@@ -579,68 +1973,165 @@ class FluxPromptGenerator:
     def INPUT_TYPES(cls):
         return {
             "required": {
-                "seed": ("INT", {"default": random.randint(0, 30000), "min": 0, "max": 30000, "step": 1}),
+                "seed": ("INT", {"default": random.randint(0, 30000), "min": 0, "max": 0xffffffffffffffff, "step": 1}),
                 "custom": ("STRING", {"multiline": True, "default": ""}),
                 "subject": ("STRING", {"multiline": True, "default": ""}),
-                "accessories": (["disabled", "random"] + ACCESSORIES, {"default": "disabled"}),
-                "additional_details": (["disabled", "random"] + ADDITIONAL_DETAILS, {"default": "disabled"}),
-                "age_group": (["disabled", "random"] + AGE_GROUP, {"default": "disabled"}),
-                "artform": (["disabled", "random"] + ARTFORM, {"default": "disabled"}),
-                "artist": (["disabled", "random"] + ARTIST, {"default": "disabled"}),
-                "background": (["disabled", "random"] + BACKGROUND, {"default": "disabled"}),
-                "body_markings": (["disabled", "random"] + BODY_MARKINGS, {"default": "disabled"}),
-                "body_types": (["disabled", "random"] + BODY_TYPES, {"default": "disabled"}),
-                "clothing": (["disabled", "random"] + CLOTHING, {"default": "disabled"}),
-                "composition": (["disabled", "random"] + COMPOSITION, {"default": "disabled"}),
-                "default_tags": (["disabled", "random"] + DEFAULT_TAGS, {"default": "disabled"}),
-                "device": (["disabled", "random"] + DEVICE, {"default": "disabled"}),
-                "digital_artform": (["disabled", "random"] + DIGITAL_ARTFORM, {"default": "disabled"}),
-                "ethnicity": (["disabled", "random"] + ETHNICITY, {"default": "disabled"}),
-                "expression": (["disabled", "random"] + EXPRESSION, {"default": "disabled"}),
-                "eye_colors": (["disabled", "random"] + EYE_COLORS, {"default": "disabled"}),
-                "face_features": (["disabled", "random"] + FACE_FEATURES, {"default": "disabled"}),
-                "facial_hair": (["disabled", "random"] + FACIAL_HAIR, {"default": "disabled"}),
-                "hair_color": (["disabled", "random"] + HAIR_COLOR, {"default": "disabled"}),
-                "hairstyles": (["disabled", "random"] + HAIRSTYLES, {"default": "disabled"}),
-                "lighting": (["disabled", "random"] + LIGHTING, {"default": "disabled"}),
-                "makeup_styles": (["disabled", "random"] + MAKEUP_STYLES, {"default": "disabled"}),
-                "photographer": (["disabled", "random"] + PHOTOGRAPHER, {"default": "disabled"}),
-                "photography_styles": (["disabled", "random"] + PHOTOGRAPHY_STYLES, {"default": "disabled"}),
-                "photo_type": (["disabled", "random"] + PHOTO_TYPE, {"default": "disabled"}),
-                "place": (["disabled", "random"] + PLACE, {"default": "disabled"}),
-                "pose": (["disabled", "random"] + POSE, {"default": "disabled"}),
-                "roles": (["disabled", "random"] + ROLES, {"default": "disabled"}),
-                "skin_tone": (["disabled", "random"] + SKIN_TONE, {"default": "disabled"}),
-                "tattoos_scars": (["disabled", "random"] + TATTOOS_SCARS, {"default": "disabled"}),
-            }
+                "accessories": (["disabled", "random"] + list(VOCABULARY["accessories"]), {"default": "disabled"}),
+                "additional_details": (["disabled", "random"] + list(VOCABULARY["additional_details"]), {"default": "disabled"}),
+                "age_group": (["disabled", "random"] + list(VOCABULARY["age_group"]), {"default": "disabled"}),
+                "artform": (["disabled", "random"] + list(VOCABULARY["artform"]), {"default": "disabled"}),
+                "artist": (["disabled", "random"] + list(VOCABULARY["artist"]), {"default": "disabled"}),
+                "background": (["disabled", "random"] + list(VOCABULARY["background"]), {"default": "disabled"}),
+                "body_markings": (["disabled", "random"] + list(VOCABULARY["body_markings"]), {"default": "disabled"}),
+                "body_types": (["disabled", "random"] + list(VOCABULARY["body_types"]), {"default": "disabled"}),
+                "clothing": (["disabled", "random"] + list(VOCABULARY["clothing"]), {"default": "disabled"}),
+                "composition": (["disabled", "random"] + list(VOCABULARY["composition"]), {"default": "disabled"}),
+                "default_tags": (["disabled", "random"] + list(VOCABULARY["default_tags"]), {"default": "disabled"}),
+                "device": (["disabled", "random"] + list(VOCABULARY["device"]), {"default": "disabled"}),
+                "digital_artform": (["disabled", "random"] + list(VOCABULARY["digital_artform"]), {"default": "disabled"}),
+                "ethnicity": (["disabled", "random"] + list(VOCABULARY["ethnicity"]), {"default": "disabled"}),
+                "expression": (["disabled", "random"] + list(VOCABULARY["expression"]), {"default": "disabled"}),
+                "eye_colors": (["disabled", "random"] + list(VOCABULARY["eye_colors"]), {"default": "disabled"}),
+                "face_features": (["disabled", "random"] + list(VOCABULARY["face_features"]), {"default": "disabled"}),
+                "facial_hair": (["disabled", "random"] + list(VOCABULARY["facial_hair"]), {"default": "disabled"}),
+                "hair_color": (["disabled", "random"] + list(VOCABULARY["hair_color"]), {"default": "disabled"}),
+                "hairstyles": (["disabled", "random"] + list(VOCABULARY["hairstyles"]), {"default": "disabled"}),
+                "lighting": (["disabled", "random"] + list(VOCABULARY["lighting"]), {"default": "disabled"}),
+                "makeup_styles": (["disabled", "random"] + list(VOCABULARY["makeup_styles"]), {"default": "disabled"}),
+                "photographer": (["disabled", "random"] + list(VOCABULARY["photographer"]), {"default": "disabled"}),
+                "photography_styles": (["disabled", "random"] + list(VOCABULARY["photography_styles"]), {"default": "disabled"}),
+                "photo_type": (["disabled", "random"] + list(VOCABULARY["photo_type"]), {"default": "disabled"}),
+                "place": (["disabled", "random"] + list(VOCABULARY["place"]), {"default": "disabled"}),
+                "pose": (["disabled", "random"] + list(VOCABULARY["pose"]), {"default": "disabled"}),
+                "roles": (["disabled", "random"] + list(VOCABULARY["roles"]), {"default": "disabled"}),
+                "skin_tone": (["disabled", "random"] + list(VOCABULARY["skin_tone"]), {"default": "disabled"}),
+                "tattoos_scars": (["disabled", "random"] + list(VOCABULARY["tattoos_scars"]), {"default": "disabled"}),
+            },
+            "optional": {
+                # Optional so that saved workflows keep loading (and keep their legacy prompts)
+                "rng_mode": (list(RNG_MODES), {"default": "legacy"}),
+                # Most CLIP tokens clip_l and clip_g may each use; 0 leaves them untrimmed
+                "clip_token_budget": ("INT", {"default": 0, "min": 0, "max": clip_tokens.CONTENT_TOKENS, "step": 1}),
+                # Keep the previous prompt and only redraw the categories whose inputs changed
+                "incremental": ("BOOLEAN", {"default": False}),
+            },
+            # Used to tell whether the debug_info output is connected at all
+            "hidden": {"prompt": "PROMPT", "unique_id": "UNIQUE_ID"},
         }
 
     # Correct RETURN_TYPES and add RETURN_NAMES
-    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING", "STRING", "STRING")
-    RETURN_NAMES = ("prompt", "t5xxl", "clip_l", "clip_g", "seed", "debug_info")
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING", "STRING", "STRING", "INT", "INT")
+    RETURN_NAMES = ("prompt", "t5xxl", "clip_l", "clip_g", "seed", "debug_info", "clip_l_tokens", "clip_g_tokens")
+    OUTPUT_TOOLTIPS = ("", "", "", "", "", "",
+                       "CLIP tokens of clip_l: exact with data/bpe_simple_vocab_16e6.txt.gz, an upper bound without it",
+                       "CLIP tokens of clip_g: exact with data/bpe_simple_vocab_16e6.txt.gz, an upper bound without it")
 
     FUNCTION = "execute"
     CATEGORY = "Prompt"
 
+    _incremental_state = None # IncrementalState of this node's last prompt in incremental mode
+
     def execute(self, **kwargs):
+        debug = self._debug_mode(kwargs)
+        VOCABULARY.check_for_changes()
+        if kwargs.get('incremental'):
+            # The prompt depends on the previous one, so neither the result cache nor the service applies
+            return self._execute_incremental(debug, kwargs)
+        # Identical inputs (and vocabulary) always give identical outputs, so finished results are reusable
+        cache_key = input_fingerprint(dict(kwargs, debug=debug, vocabulary=VOCABULARY.generation))
+        cached = RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+        clip_token_budget = kwargs.get('clip_token_budget') or None
+        if SERVICE_URL and debug == "off" and clip_token_budget is None:
+            row = _service_row(kwargs)
+            if row is not None:
+                result = row + ("",) + clip_token_counts(row[2], row[3])
+                RESULT_CACHE.put(cache_key, result)
+                return result
+
         # Pass all arguments using kwargs
         seed = kwargs.get('seed', 0) # Extract seed separately if needed elsewhere
-        prompt_generator = PromptGenerator(seed)
+        rng_mode = kwargs.get('rng_mode', 'legacy')
+        # In unique mode every seed is a position in the same walk, so incrementing seeds never repeats a prompt
+        prompt_generator = PromptGenerator(0 if rng_mode == "unique" else seed, rng_mode=rng_mode, debug=debug,
+                                           clip_token_budget=clip_token_budget)
         prompt = prompt_generator.generate_prompt(**kwargs)
         # Unpack the 6-tuple and return all 6 outputs including seed_used
         original_clean, seed_used, t5xxl_clean, clip_l_clean, clip_g_clean, debug_output = prompt
         # Concatenate all sections into a single combined prompt
-        combined_prompt = ", ".join(filter(None, [t5xxl_clean, clip_l_clean, clip_g_clean]))
-        return (combined_prompt, t5xxl_clean, clip_l_clean, clip_g_clean, str(seed_used), debug_output)
+        combined_prompt = smart_join([t5xxl_clean, clip_l_clean, clip_g_clean])
+        result = (combined_prompt, t5xxl_clean, clip_l_clean, clip_g_clean, str(seed_used), debug_output) \
+            + clip_token_counts(clip_l_clean, clip_g_clean)
+        RESULT_CACHE.put(cache_key, result)
+        return result
+
+    def _execute_incremental(self, debug, kwargs):
+        rng_mode = kwargs.get('rng_mode', 'legacy')
+        prompt_generator = PromptGenerator(0 if rng_mode == "unique" else kwargs.get('seed', 0), rng_mode=rng_mode,
+                                           debug=debug, clip_token_budget=kwargs.get('clip_token_budget') or None)
+        prompt, self._incremental_state = prompt_generator.regenerate(self._incremental_state, **kwargs)
+        original_clean, seed_used, t5xxl_clean, clip_l_clean, clip_g_clean, debug_output = prompt
+        return (smart_join([t5xxl_clean, clip_l_clean, clip_g_clean]), t5xxl_clean, clip_l_clean, clip_g_clean,
+                str(seed_used), debug_output) + clip_token_counts(clip_l_clean, clip_g_clean)
+
+    @classmethod
+    def _debug_mode(cls, kwargs):
+        """Pops the hidden inputs; the debug report is only collected and rendered when something reads it."""
+        connected = output_connected(kwargs.pop("prompt", None), kwargs.pop("unique_id", None),
+                                     cls.RETURN_NAMES.index("debug_info"))
+        return "text" if connected else "off"
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # Output only depends on the inputs, so ComfyUI may reuse it (and everything downstream)
+        # until the seed or any other input changes, the debug_info output gets connected or a data file is edited
+        debug = cls._debug_mode(kwargs)
+        VOCABULARY.check_for_changes()
+        return input_fingerprint(dict(kwargs, debug=debug, vocabulary=VOCABULARY.generation))
+
+
+class FluxPromptGeneratorBatch:
+    @classmethod
+    def INPUT_TYPES(cls):
+        inputs = FluxPromptGenerator.INPUT_TYPES()
+        del inputs["hidden"] # No debug_info output
+        del inputs["optional"]["incremental"] # Every batch is generated in full
+        # Seeds run from seed to seed + batch_size - 1
+        inputs["required"]["batch_size"] = ("INT", {"default": 4, "min": 1, "max": 4096, "step": 1})
+        return inputs
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("prompt", "t5xxl", "clip_l", "clip_g", "seed")
+    OUTPUT_IS_LIST = (True, True, True, True, True)
+
+    FUNCTION = "execute"
+    CATEGORY = "Prompt"
+
+    def execute(self, **kwargs):
+        VOCABULARY.check_for_changes()
+        seed = kwargs.get('seed', 0)
+        batch_size = kwargs.get('batch_size', 1)
+        rng_mode = kwargs.get('rng_mode', 'legacy')
+        # In unique mode every seed is a position in the same walk, so incrementing seeds never repeats a prompt
+        prompt_generator = PromptGenerator(0 if rng_mode == "unique" else seed, rng_mode=rng_mode,
+                                           clip_token_budget=kwargs.get('clip_token_budget') or None)
+        prompts, t5xxl, clip_l, clip_g, seeds = prompt_generator.generate_batch(range(seed, seed + batch_size), **kwargs)
+        return (prompts, t5xxl, clip_l, clip_g, [str(s) for s in seeds])
 
     @classmethod
     def IS_CHANGED(cls, **kwargs):
-        # Trigger refresh based on seed or any other input change
-        # Simple approach: always return True if any input changes (including seed)
-        # You could implement more complex logic comparing old/new kwargs if needed
-        return float('nan') # Standard ComfyUI way to indicate always refresh
+        VOCABULARY.check_for_changes()
+        return input_fingerprint(dict(kwargs, vocabulary=VOCABULARY.generation))
 
 
 # Node export details
-NODE_CLASS_MAPPINGS = {"FluxPromptGenerator": FluxPromptGenerator}
-NODE_DISPLAY_NAME_MAPPINGS = {"FluxPromptGenerator": "Flux Prompt Generator"}
\ No newline at end of file
+NODE_CLASS_MAPPINGS = {
+    "FluxPromptGenerator": FluxPromptGenerator,
+    "FluxPromptGeneratorBatch": FluxPromptGeneratorBatch,
+}
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "FluxPromptGenerator": "Flux Prompt Generator",
+    "FluxPromptGeneratorBatch": "Flux Prompt Generator (Batch)",
+}
\ No newline at end of file
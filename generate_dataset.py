@@ -0,0 +1,289 @@
+# generate_dataset.py
+"""Command-line dataset generator: streams prompts to JSONL, CSV or Parquet.
+
+Run from the repository directory:
+
+    python -m generate_dataset --count 1000000 --output prompts.jsonl --artist random --lighting random
+
+Category options mirror the node inputs (``--artist``, ``--clothing``, ...) and
+default to "disabled" like the node does. Prompts are generated and written
+``--flush-size`` rows at a time, so memory stays flat however many rows are
+written. ``--workers N`` generates shards of ``--shard-size`` seeds in N
+processes; rows are still written in seed order and are identical to a
+single-process run. With ``--rows-per-file`` the output is split into numbered part files;
+the output path must then contain a ``{part}`` field, e.g. ``prompts-{part:05d}.jsonl``.
+``--dedup THRESHOLD`` drops rows whose t5xxl text (or ``--dedup-column``) is a
+near-duplicate of a recent row (see dedup.py); with ``--dedup-mode resample``
+further seeds replace them, so the output still has ``--count`` rows.
+``--stats PATH`` writes a vocabulary coverage report of the written rows
+(see coverage_stats.py): JSON, or the text table for ``-``. With ``--dedup``
+the choices of each kept row are drawn again from its seed, so dropped rows
+are not counted.
+"""
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+
+try:
+    from . import flux_prompt_generator as fpg
+    from . import coverage_stats, dedup, instrumentation, sharded
+except ImportError:  # Run as a top-level module (python -m generate_dataset)
+    import flux_prompt_generator as fpg
+    import coverage_stats
+    import dedup
+    import instrumentation
+    import sharded
+
+COLUMNS = ("seed", "prompt", "t5xxl", "clip_l", "clip_g")
+FORMATS = ("jsonl", "csv", "parquet")
+DEDUP_MODES = ("drop", "resample")
+RESAMPLE_LIMIT = 4 # --dedup-mode resample tries at most this many times --count seeds
+
+
+def iter_rows(generator, seeds, kwargs, chunk_size):
+    """Streams (seed, prompt, t5xxl, clip_l, clip_g) rows, generating at most chunk_size at a time."""
+    for chunk_start in range(0, len(seeds), chunk_size):
+        chunk = seeds[chunk_start:chunk_start + chunk_size]
+        prompts, t5xxl, clip_l, clip_g, chunk_seeds = generator.generate_batch(chunk, **kwargs)
+        yield from zip(chunk_seeds, prompts, t5xxl, clip_l, clip_g)
+
+
+def iter_counted_rows(rows, generator, kwargs, stats):
+    """Passes rows through, recording the choices of each into stats.
+
+    generate_batch draws a prompt's choices from its seed alone, so drawing
+    them again for the row's seed gives the choices the row was rendered from.
+    generator must be built like the one that generated the rows, without stats.
+    """
+    spec = fpg.PromptSpec.compile(kwargs)
+    for row in rows:
+        generator._reseed(row[0])
+        stats.record(spec, generator._draw_choices(spec))
+        yield row
+
+
+def iter_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class JsonlSink:
+    def __init__(self, path):
+        self.file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="\n")
+
+    def write(self, rows):
+        self.file.write("".join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows))
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetSink:
+    """Writes one Parquet row group per flushed chunk. Requires pyarrow."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+        if path == "-":
+            raise SystemExit("Parquet output cannot be written to stdout")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([("seed", pyarrow.int64())] + [(name, pyarrow.string()) for name in COLUMNS[1:]])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pyarrow.Table.from_arrays([list(column) for column in columns], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+SINKS = {"jsonl": JsonlSink, "csv": CsvSink, "parquet": ParquetSink}
+
+
+def write_dataset(rows, output, output_format, flush_size, rows_per_file=None):
+    """Writes rows in flush_size chunks, starting a new part file every rows_per_file rows. Returns the row count."""
+    sink_class = SINKS[output_format]
+    written = 0
+    part = 0
+    sink = None
+    rows_in_part = 0
+    try:
+        for chunk in iter_chunks(rows, flush_size):
+            while chunk:
+                if sink is None:
+                    sink = sink_class(output.format(part=part) if rows_per_file else output)
+                    rows_in_part = 0
+                take = len(chunk) if not rows_per_file else min(len(chunk), rows_per_file - rows_in_part)
+                sink.write(chunk[:take])
+                chunk = chunk[take:]
+                written += take
+                rows_in_part += take
+                if rows_per_file and rows_in_part >= rows_per_file:
+                    sink.close()
+                    sink = None
+                    part += 1
+    finally:
+        if sink is not None:
+            sink.close()
+    return written
+
+
+def category_arguments():
+    """(name, default) for every string input of the node, in INPUT_TYPES order."""
+    required = fpg.FluxPromptGenerator.INPUT_TYPES()["required"]
+    arguments = []
+    for name, (kind, options) in required.items():
+        if name == "seed":
+            continue
+        arguments.append((name, options.get("default", "")))
+    return arguments
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m generate_dataset", description="Stream generated prompts to a dataset file.")
+    parser.add_argument("--count", type=int, required=True, help="number of prompts to generate")
+    parser.add_argument("--start-seed", type=int, default=0, help="seed of the first prompt; seeds are consecutive")
+    parser.add_argument("--output", "-o", default="-", help="output path, '-' for stdout (default)")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="output format (default: from the file extension, else jsonl)")
+    parser.add_argument("--flush-size", type=int, default=1000, help="rows generated and written per chunk")
+    parser.add_argument("--rows-per-file", type=int, default=None, help="split the output into part files of this many rows")
+    parser.add_argument("--engine", choices=sharded.ENGINES, default="python",
+                        help="python: same prompts as the node; counter: the node's counter RNG mode, 64-bit seeds; "
+                             "unique: no repeated prompt until every combination was written; numpy: vectorized sampler with its own seeding")
+    parser.add_argument("--generator-seed", type=int, default=None,
+                        help="key of the unique walk and the numpy stream (default: --start-seed); keep it fixed and "
+                             "move --start-seed to resume a run")
+    parser.add_argument("--workers", type=int, default=1, help="generator processes (0 = one per CPU); output is identical for any count")
+    parser.add_argument("--shard-size", type=int, default=2000, help="seeds per worker task when --workers is not 1")
+    parser.add_argument("--metrics", default=None,
+                        help="write per-stage timings to this path when done: Prometheus text for *.prom, else JSON "
+                             "(single-process python, counter and unique engines only)")
+    parser.add_argument("--dedup", type=float, default=None, metavar="THRESHOLD",
+                        help="drop rows whose word-shingle Jaccard similarity to a recent row is at least THRESHOLD (0-1], e.g. 0.8")
+    parser.add_argument("--dedup-mode", choices=DEDUP_MODES, default="drop",
+                        help="drop: fewer rows than --count; resample: replace dropped rows with rows of further seeds")
+    parser.add_argument("--dedup-column", choices=COLUMNS[1:], default="t5xxl", help="text compared by --dedup")
+    parser.add_argument("--dedup-window", type=int, default=50000,
+                        help="recent rows --dedup compares with (about 2.5 KB of memory each for t5xxl text)")
+    parser.add_argument("--stats", default=None, metavar="PATH",
+                        help="write a vocabulary coverage report of the written rows (rows dropped by --dedup are not counted) "
+                             "to this path: JSON, or a text table for '-' (not with the numpy engine)")
+    parser.add_argument("--stats-pair", action="append", default=[], metavar="CATEGORY,CATEGORY",
+                        help="also count which entries of two categories appear together, e.g. artist,lighting (repeatable)")
+    parser.add_argument("--strict", action="store_true",
+                        help="exit with an error when a category option names a value that is not in data/ (default: warn)")
+    parser.add_argument("--quiet", action="store_true", help="do not print progress to stderr")
+
+    group = parser.add_argument_group("categories", "Same values as the node inputs: disabled, random, an entry, or a comma-separated list")
+    for name, default in category_arguments():
+        group.add_argument(f"--{name.replace('_', '-')}", dest=name, default=default, metavar="VALUE")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.count < 0 or args.workers < 0 or args.flush_size < 1 or args.shard_size < 1 or (args.rows_per_file is not None and args.rows_per_file < 1):
+        parser.error("--count and --workers must be >= 0, --flush-size, --shard-size and --rows-per-file >= 1")
+    if args.metrics and (args.workers != 1 or args.engine == "numpy"):
+        parser.error("--metrics needs --workers 1 and a python, counter or unique engine")
+    if args.dedup is not None and not (0 < args.dedup <= 1 and args.dedup_window >= 1):
+        parser.error("--dedup must be in (0, 1] and --dedup-window >= 1")
+    if args.stats and args.engine == "numpy":
+        parser.error("--stats needs a python, counter or unique engine")
+    stats_pairs = [tuple(pair.split(",")) for pair in args.stats_pair]
+    if any(len(pair) != 2 or not set(pair) <= set(fpg.vocabulary.CATEGORIES) for pair in stats_pairs):
+        parser.error("--stats-pair takes two category names, e.g. artist,lighting")
+    if args.rows_per_file and "{part" not in args.output:
+        parser.error("--rows-per-file needs a '{part}' field in --output, e.g. prompts-{part:05d}.jsonl")
+    output_format = args.format or next((name for name in FORMATS if args.output.endswith("." + name)), "jsonl")
+
+    kwargs = {name: getattr(args, name) for name, _ in category_arguments()}
+    problems = fpg.validate_inputs(kwargs)
+    for category, values in problems.items():
+        for value, suggestions in values:
+            hint = f" (did you mean {' or '.join(repr(entry) for entry in suggestions)}?)" if suggestions else ""
+            print(f"{'Error' if args.strict else 'Warning'}: --{category.replace('_', '-')} {value!r} is not in data/{category}.json{hint}", file=sys.stderr)
+    if problems and args.strict:
+        sys.exit(2)
+    seeds = range(args.start_seed, args.start_seed + args.count)
+    generator_seed = args.start_seed if args.generator_seed is None else args.generator_seed
+    metrics = None
+    if args.metrics:
+        metrics = instrumentation.Metrics(
+            instrumentation.PrometheusSink(args.metrics) if args.metrics.endswith(".prom") else instrumentation.JSONSink(args.metrics))
+    stats = coverage_stats.CoverageStats(pairs=stats_pairs) if args.stats else None
+    # With --dedup the generator's counts would include dropped rows: the kept rows are counted after the filter
+    generator_stats = stats if args.dedup is None else None
+    generator = sharded.make_generator(args.engine, generator_seed, metrics, generator_stats if args.workers == 1 else None)
+    if args.engine == "unique" and not args.quiet:
+        combinations = generator.count_combinations(**kwargs)
+        if args.start_seed + args.count > combinations:
+            print(f"Note: only {combinations} distinct prompts exist for these options; later rows start another pass", file=sys.stderr)
+    duplicates = None
+    if args.dedup is not None:
+        duplicates = dedup.NearDuplicateFilter(args.dedup, window=args.dedup_window, metrics=metrics)
+        if args.dedup_mode == "resample":
+            seeds = range(args.start_seed, args.start_seed + args.count * RESAMPLE_LIMIT)
+    start = time.perf_counter()
+    if args.workers == 1:
+        rows = iter_rows(generator, seeds, kwargs, args.flush_size)
+    else:
+        rows = sharded.iter_sharded_rows(seeds, kwargs, args.workers or None, args.shard_size, args.engine, generator_seed,
+                                         stats=generator_stats)
+    if duplicates is not None:
+        rows = itertools.islice(duplicates.filter(rows, key=lambda row, column=COLUMNS.index(args.dedup_column): row[column]), args.count)
+        if stats is not None:
+            rows = iter_counted_rows(rows, sharded.make_generator(args.engine, generator_seed), kwargs, stats)
+    written = write_dataset(rows, args.output, output_format, args.flush_size, args.rows_per_file)
+    elapsed = time.perf_counter() - start
+    if metrics is not None:
+        metrics.sink.emit(instrumentation.merge_snapshots(metrics.snapshot(), instrumentation.VOCABULARY_LOADS.snapshot()))
+    if stats is not None:
+        report = stats.report(fpg.VOCABULARY)
+        if args.stats == "-":
+            print(coverage_stats.render_report(report), file=sys.stderr)
+        else:
+            with open(args.stats, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+    if duplicates is not None and not args.quiet:
+        print(f"Dropped {duplicates.dropped} of {duplicates.seen} rows as near-duplicates ({duplicates.drop_rate:.2%})", file=sys.stderr)
+        if written < args.count and args.dedup_mode == "resample":
+            print(f"Note: {args.count * RESAMPLE_LIMIT} seeds gave only {written} distinct rows", file=sys.stderr)
+    if not args.quiet:
+        print(f"Wrote {written} rows ({output_format}) in {elapsed:.1f} s, {written / elapsed if elapsed else 0:,.0f} rows/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
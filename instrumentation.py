@@ -0,0 +1,206 @@
+# instrumentation.py
+"""Optional per-stage timers and counters for the prompt generator.
+
+A ``Metrics`` object collects, per stage name, the call count, the total wall
+time, a latency histogram and the total size (in characters) of what the stage
+produced. ``PromptGenerator(metrics=Metrics())`` instruments sampling, sentence
+assembly, BREAK splitting and cleaning; without it nothing is wrapped, so the
+generator runs exactly the code it runs today.
+
+``load_json_file`` always records its parse times into ``VOCABULARY_LOADS``
+(one stage per file); that happens at most once per category and process.
+
+Snapshots go to a sink, any object with an ``emit(snapshot)`` method:
+``HistogramSink`` accumulates them in memory, ``PrometheusSink`` writes the
+Prometheus text exposition format and ``JSONSink`` writes a JSON dump.
+"""
+import bisect
+import json
+import sys
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets; a last +Inf bucket is implied
+HISTOGRAM_BOUNDS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+def text_size(value):
+    """Characters of a stage result: a string, or the strings of a tuple/list."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(len(part) for part in value if isinstance(part, str))
+    return 0
+
+
+class StageStats:
+    __slots__ = ("count", "seconds", "max_seconds", "size", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.size = 0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, seconds, size):
+        self.count += 1
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        self.size += size
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "seconds": self.seconds,
+            "mean_seconds": self.seconds / self.count if self.count else 0.0,
+            "max_seconds": self.max_seconds,
+            "size": self.size,
+            "buckets": list(self.buckets),
+        }
+
+
+class Metrics:
+    """Thread-safe per-stage counters; flush() hands a snapshot to the sink (if any)."""
+
+    def __init__(self, sink=None):
+        self.sink = sink
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, size=0):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.add(seconds, size)
+
+    def wrap(self, stage, func, size=text_size):
+        """func, timed as stage; size(result) is added to the stage's size counter."""
+        record = self.record
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            result = func(*args, **kwargs)
+            record(stage, clock() - start, size(result) if size is not None else 0)
+            return result
+
+        timed.__name__ = getattr(func, "__name__", stage)
+        timed.__doc__ = getattr(func, "__doc__", None)
+        return timed
+
+    def instrument(self, obj, stages):
+        """Shadows the methods of obj named in stages ({method: (stage, size)}) with timed versions."""
+        for method, (stage, size) in stages.items():
+            setattr(obj, method, self.wrap(stage, getattr(obj, method), size))
+
+    def snapshot(self):
+        """{"bounds": histogram bounds, "stages": {stage: counters}}, stages sorted by name."""
+        with self._lock:
+            stages = {stage: self._stages[stage].as_dict() for stage in sorted(self._stages)}
+        return {"bounds": list(HISTOGRAM_BOUNDS), "stages": stages}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def flush(self, sink=None, reset=False):
+        """Emits a snapshot to sink (default: self.sink) and returns it."""
+        snapshot = self.snapshot()
+        if reset:
+            self.reset()
+        sink = sink or self.sink
+        if sink is not None:
+            sink.emit(snapshot)
+        return snapshot
+
+
+def merge_snapshots(*snapshots):
+    """Adds up snapshots (e.g. a generator's and VOCABULARY_LOADS) into one."""
+    stages = {}
+    for snapshot in snapshots:
+        for stage, counters in snapshot["stages"].items():
+            total = stages.get(stage)
+            if total is None:
+                stages[stage] = dict(counters, buckets=list(counters["buckets"]))
+                continue
+            total["count"] += counters["count"]
+            total["seconds"] += counters["seconds"]
+            total["max_seconds"] = max(total["max_seconds"], counters["max_seconds"])
+            total["size"] += counters["size"]
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], counters["buckets"])]
+            total["mean_seconds"] = total["seconds"] / total["count"] if total["count"] else 0.0
+    return {"bounds": list(HISTOGRAM_BOUNDS), "stages": {stage: stages[stage] for stage in sorted(stages)}}
+
+
+def render_prometheus(snapshot, prefix="flux_prompt"):
+    """Prometheus text exposition of a snapshot: a stage latency histogram plus a size counter."""
+    lines = [
+        f"# HELP {prefix}_stage_seconds Wall time per prompt generator stage.",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    for stage, counters in snapshot["stages"].items():
+        label = stage.replace("\\", "\\\\").replace('"', '\\"')
+        cumulative = 0
+        for bound, count in zip(list(snapshot["bounds"]) + ["+Inf"], counters["buckets"]):
+            cumulative += count
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{label}"}} {counters["seconds"]!r}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{label}"}} {counters["count"]}')
+    lines.append(f"# HELP {prefix}_stage_chars_total Characters produced per prompt generator stage.")
+    lines.append(f"# TYPE {prefix}_stage_chars_total counter")
+    for stage, counters in snapshot["stages"].items():
+        label = stage.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'{prefix}_stage_chars_total{{stage="{label}"}} {counters["size"]}')
+    return "\n".join(lines) + "\n"
+
+
+# --- Sinks ---
+class HistogramSink:
+    """Keeps the sum of every emitted snapshot in memory."""
+
+    def __init__(self):
+        self.total = merge_snapshots()
+
+    def emit(self, snapshot):
+        self.total = merge_snapshots(self.total, snapshot)
+
+
+class _FileSink:
+    def __init__(self, path="-"):
+        self.path = path
+
+    def _write(self, text):
+        if self.path == "-":
+            sys.stdout.write(text)
+            return
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+
+class PrometheusSink(_FileSink):
+    """Writes each snapshot in Prometheus text format ('-' for stdout), e.g. for node_exporter's textfile collector."""
+
+    def __init__(self, path="-", prefix="flux_prompt"):
+        super().__init__(path)
+        self.prefix = prefix
+
+    def emit(self, snapshot):
+        self._write(render_prometheus(snapshot, self.prefix))
+
+
+class JSONSink(_FileSink):
+    """Writes each snapshot as JSON ('-' for stdout)."""
+
+    def emit(self, snapshot):
+        self._write(json.dumps(snapshot, indent=2) + "\n")
+
+
+# Parse times of load_json_file, one stage per data file
+VOCABULARY_LOADS = Metrics()
@@ -0,0 +1,126 @@
+# lookup.py
+"""Indexed lookup of vocabulary entries, for validating and completing input values.
+
+``CategoryIndex`` indexes one category list three ways, all on the normalized
+form of an entry (case-folded, whitespace collapsed, one space after each
+comma):
+
+- a dict, for exact lookups;
+- the sorted normalized entries, for prefix completion with bisect;
+- a trigram index (trigram -> entry ids), for fuzzy suggestions scored by the
+  Dice coefficient of the trigram sets.
+
+An index is built once per list, the first time it is asked for
+(``VocabularyRegistry.index``), and a hot reload replaces it along with the
+list. Lookups, completions and suggestions then cost well under a millisecond
+even for the largest categories.
+
+``resolve`` maps a comma-separated input onto canonical entries. Entries that
+contain commas themselves (some backgrounds do) are matched whole, and items
+that are not entries are kept as typed, so free text still works.
+"""
+import bisect
+import re
+from collections import Counter
+
+_WHITESPACE = re.compile(r"\s+")
+_COMMA = re.compile(r" ?, ?")
+
+
+def normalize(text):
+    """The form entries are matched on: case-folded, whitespace collapsed, one space after each comma."""
+    return _COMMA.sub(", ", _WHITESPACE.sub(" ", text).strip()).casefold()
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CategoryIndex:
+    """Exact, prefix and fuzzy lookup over one category list (``values``, kept as given)."""
+
+    def __init__(self, values):
+        self.values = values
+        canonical = {}
+        for value in values:
+            canonical.setdefault(normalize(value), value) # The first spelling of a duplicate wins
+        self._canonical = canonical
+        self._keys = sorted(canonical)
+        self._gram_counts = []
+        postings = {}
+        for key_id, key in enumerate(self._keys):
+            grams = _trigrams(key)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(key_id)
+        self._postings = postings
+        # Longest run of comma-separated pieces that one entry spans
+        self._max_pieces = 1 + max((key.count(",") for key in self._keys), default=0)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, text):
+        return normalize(text) in self._canonical
+
+    def lookup(self, text):
+        """The entry text normalizes to, or None."""
+        return self._canonical.get(normalize(text))
+
+    def complete(self, prefix, limit=10):
+        """Entries starting with prefix (after normalizing), in alphabetical order."""
+        prefix = normalize(prefix)
+        start = bisect.bisect_left(self._keys, prefix)
+        matches = []
+        for key in self._keys[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            matches.append(self._canonical[key])
+        return matches
+
+    def suggest(self, text, limit=5, cutoff=0.5):
+        """[(entry, score)] of the entries most similar to text, best first; score is in (0, 1]."""
+        key = normalize(text)
+        if key in self._canonical:
+            return [(self._canonical[key], 1.0)]
+        grams = _trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings:
+                shared.update(postings)
+        gram_count = len(grams)
+        scored = []
+        for key_id, count in shared.items():
+            score = 2 * count / (gram_count + self._gram_counts[key_id])
+            if score >= cutoff:
+                scored.append((score, key_id))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(self._canonical[self._keys[key_id]], score) for score, key_id in scored[:limit]]
+
+    def resolve(self, text):
+        """(items, unknown) of a comma-separated input.
+
+        items are canonical entries where the input names one, else the
+        stripped text as typed (empty pieces included); unknown lists the
+        items that are not entries. Adjacent pieces are joined into one item
+        when together they name an entry, longest match first.
+        """
+        pieces = text.split(",")
+        items, unknown = [], []
+        start = 0
+        while start < len(pieces):
+            for end in range(min(len(pieces), start + self._max_pieces), start, -1):
+                entry = self._canonical.get(normalize(",".join(pieces[start:end])))
+                if entry is not None:
+                    items.append(entry)
+                    start = end
+                    break
+            else:
+                item = pieces[start].strip()
+                items.append(item)
+                if item:
+                    unknown.append(item)
+                start += 1
+        return items, unknown
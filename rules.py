@@ -0,0 +1,255 @@
+# rules.py
+"""Exclusion and implication rules between vocabulary entries.
+
+Rules live in ``data/rules.json``, which is not shipped: without it prompts are
+drawn as before, and ``data/rules.example.json`` is a file to copy from::
+
+    {
+      "exclude": [
+        {"if": {"age_group": ["child", "toddler"]}, "not": {"roles": ["soldier"], "clothing": ["*"]}}
+      ],
+      "imply": [
+        {"if": {"artform": ["photography"]}, "then": {"device": ["Nikon D780 with Nikkor 14-24mm f-2.8G", "Nikon D850 with Nikkor 50mm f-1.8"]}}
+      ]
+    }
+
+An exclusion forbids every listed ``if`` entry together with every listed
+``not`` entry. An implication allows only the ``then`` entries of each target
+category once an ``if`` entry was chosen. ``"*"`` stands for every entry of
+the category. Rules hold in both directions, whatever the draw order: when
+``roles`` is drawn before ``age_group``, a "soldier" role bans "child".
+
+``RuleSet`` compiles the rules against the current vocabulary lists into one
+bitset per (category, entry) and target category: bit ``i`` is set when entry
+``i`` of the target is banned. Drawing a category ORs the masks of the values
+chosen so far, so the cost of a draw depends on the rules that touch the chosen
+values, not on the number of rules. The sampler then draws among the remaining
+entries directly (see ``ConstrainedDraw``), without rejection.
+"""
+import json
+
+RULES_FILE_NAME = "rules.json"
+
+
+def iter_bits(mask):
+    """Indices of the set bits of mask, ascending."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def load_rules(path):
+    """Parsed rules file, or None when there is none (or it cannot be read)."""
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read rules from {path}: {e}")
+        return None
+    if not isinstance(data, dict):
+        print(f"Warning: Expected an object in {path}, ignoring it.")
+        return None
+    return data
+
+
+class RuleSet:
+    """Rules compiled against one set of vocabulary lists.
+
+    ``masks[(category, value)]`` is a tuple of (target category, banned bitset)
+    pairs. ``lists`` holds the lists the indices refer to.
+    """
+
+    def __init__(self, data, lists):
+        self.lists = lists
+        self.rule_count = 0
+        self._positions = {} # category -> {entry: index}
+        self._banned_entries = {} # (category, entry) -> {target category: set of banned entries}
+        masks = {}
+
+        for rule in data.get("exclude", []):
+            sources, targets = self._sides(rule, "if", "not")
+            if sources is None:
+                continue
+            for source, source_mask in sources.items():
+                for target, target_mask in targets.items():
+                    self._ban(masks, source, source_mask, target, target_mask)
+        for rule in data.get("imply", []):
+            sources, targets = self._sides(rule, "if", "then")
+            if sources is None:
+                continue
+            for target, allowed_mask in targets.items():
+                banned_mask = ((1 << len(lists[target])) - 1) & ~allowed_mask
+                for source, source_mask in sources.items():
+                    self._ban(masks, source, source_mask, target, banned_mask)
+
+        self.masks = {key: tuple(targets.items()) for key, targets in masks.items()}
+        self.targets = frozenset(target for targets in masks.values() for target in targets)
+
+    def _position(self, category, entry):
+        positions = self._positions.get(category)
+        if positions is None:
+            positions = self._positions[category] = {value: index for index, value in enumerate(self.lists[category])}
+        return positions.get(entry)
+
+    def _entry_mask(self, category, entries):
+        if category not in self.lists:
+            print(f"Warning: Unknown category {category!r} in the rules, ignoring it.")
+            return 0
+        if isinstance(entries, str):
+            entries = [entries]
+        mask = 0
+        for entry in entries:
+            if entry == "*":
+                return (1 << len(self.lists[category])) - 1
+            index = self._position(category, entry)
+            if index is None:
+                print(f"Warning: {category} has no entry {entry!r}, ignoring it in the rules.")
+                continue
+            mask |= 1 << index
+        return mask
+
+    def _sides(self, rule, source_key, target_key):
+        """({category: mask} of the rule's sources, {category: mask} of its targets), or (None, None) if malformed."""
+        if not isinstance(rule, dict) or not isinstance(rule.get(source_key), dict) or not isinstance(rule.get(target_key), dict):
+            print(f"Warning: Skipping malformed rule {rule!r}")
+            return None, None
+        self.rule_count += 1
+        sources = {category: self._entry_mask(category, entries) for category, entries in rule[source_key].items()}
+        targets = {category: self._entry_mask(category, entries) for category, entries in rule[target_key].items()}
+        return sources, targets
+
+    def _ban(self, masks, source, source_mask, target, target_mask):
+        """Bans the pairs of source_mask x target_mask, recorded from both sides."""
+        if not source_mask or not target_mask:
+            return
+        for category, mask, other, other_mask in ((source, source_mask, target, target_mask), (target, target_mask, source, source_mask)):
+            for index in iter_bits(mask):
+                banned = masks.setdefault((category, self.lists[category][index]), {})
+                banned[other] = banned.get(other, 0) | other_mask
+
+    def banned_entries(self, category, entry):
+        """{target category: set of entries} that one entry bans, read off its masks."""
+        banned = self._banned_entries.get((category, entry))
+        if banned is None:
+            banned = self._banned_entries[(category, entry)] = {
+                target: {self.lists[target][index] for index in iter_bits(mask)}
+                for target, mask in self.masks.get((category, entry), ())}
+        return banned
+
+    def fixed_bans(self, categories):
+        """{category: banned bitset} implied by the CategorySpecs that need no draw (values the user set)."""
+        banned = {}
+        for category in categories.values():
+            if category.sampler is None:
+                _add_bans(banned, self.masks, category, category.value)
+        return banned
+
+    def compiled_for(self, lists):
+        """Whether the rules were compiled against exactly these lists ({category: list})."""
+        return all(lists.get(category, values) is values for category, values in self.lists.items())
+
+    def __repr__(self):
+        return f"<RuleSet {self.rule_count} rules, {len(self.masks)} constrained entries>"
+
+
+def _add_bans(banned, masks, category, value):
+    if not value:
+        return
+    values = value.split(", ") if category.count_range is not None else (value,)
+    for part in values:
+        for target, mask in masks.get((category.name, part), ()):
+            banned[target] = banned.get(target, 0) | mask
+
+
+class ConstrainedDraw:
+    """Per-prompt state of a rule-aware draw: the banned entries of each category so far.
+
+    It starts from initial_bans (RuleSet.fixed_bans of the spec), so values the
+    user set constrain every draw, whatever the draw order.
+    Call it like PromptGenerator._draw. Categories without bans draw exactly
+    as without rules; otherwise the draw picks among the allowed entries in one
+    step. A category whose every entry is banned resolves to "".
+    """
+
+    __slots__ = ("rules", "rng_for", "banned")
+
+    def __init__(self, rules, rng_for, initial_bans=None):
+        self.rules = rules
+        self.rng_for = rng_for
+        self.banned = dict(initial_bans or {})
+
+    def __call__(self, category):
+        banned = self.banned.get(category.name, 0) if category.mode in ("random", "multiple") else 0
+        if category.sampler is None:
+            value = category.value
+        elif not banned:
+            value = category.sampler(self.rng_for(category.name))
+        elif category.mode == "random":
+            value = self._choose(category, banned)
+        else:
+            value = self._choose_several(category, banned)
+        _add_bans(self.banned, self.rules.masks, category, value)
+        return value
+
+    def accept(self, category, value):
+        """Takes a value drawn elsewhere (the NumPy engine) in place of a draw.
+
+        The value is kept when the rules allow it; otherwise the category is
+        drawn again among the allowed entries, as __call__ would have.
+        """
+        banned = self.banned.get(category.name, 0) if category.mode in ("random", "multiple") else 0
+        if banned and category.sampler is not None and value:
+            parts = value.split(", ") if category.count_range is not None else (value,)
+            for part in parts:
+                index = self.rules._position(category.name, part)
+                if index is not None and banned >> index & 1:
+                    return self(category)
+        _add_bans(self.banned, self.rules.masks, category, value)
+        return value
+
+    def _choose(self, category, banned):
+        rng = self.rng_for(category.name)
+        options = category.options
+        banned_indices = list(iter_bits(banned))
+        if category.alias_table is not None:
+            table = category.alias_table
+            excluded = set(banned_indices)
+            remaining = table.total - sum(table.weights[index] for index in banned_indices)
+            if remaining <= 0:
+                return ""
+            return options[table.pick_remaining(rng.random(), excluded, table.total - remaining)]
+        allowed = len(options) - len(banned_indices)
+        if allowed <= 0:
+            return ""
+        # The position among the allowed entries, shifted past every banned index at or before it
+        index = rng.choice(range(allowed))
+        for banned_index in banned_indices:
+            if banned_index <= index:
+                index += 1
+        return options[index]
+
+    def _choose_several(self, category, banned):
+        rng = self.rng_for(category.name)
+        options = category.options
+        count = rng.randint(*category.count_range)
+        excluded = set(iter_bits(banned))
+        if category.alias_table is not None:
+            table = category.alias_table
+            picked_weight = sum(table.weights[index] for index in excluded)
+            picks = []
+            for _ in range(count):
+                if table.total - picked_weight <= 0:
+                    break
+                index = table.pick_remaining(rng.random(), excluded, picked_weight)
+                excluded.add(index)
+                picked_weight += table.weights[index]
+                picks.append(index)
+            return ", ".join(options[index] for index in picks)
+        allowed = [value for index, value in enumerate(options) if index not in excluded]
+        actual_count = min(count, len(allowed))
+        if actual_count == 0:
+            return ""
+        return ", ".join(rng.sample(allowed, actual_count))
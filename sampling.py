@@ -0,0 +1,243 @@
+# sampling.py
+"""Sampling primitives for the prompt generator.
+
+Counter-based RNG
+-----------------
+``CounterRNG(seed, index)`` gives every category slot of prompt ``index`` its
+own independent stream, so any prompt can be computed without replaying the
+ones before it, and changing one category's input never moves the draws of
+another. Draw ``d`` of slot ``s`` is::
+
+    stream = mix64(mix64(mix64(seed ^ SEED_SALT) + index) ^ slot_id(s))
+    value  = mix64(stream + (d + 1) * GOLDEN_GAMMA)
+
+``mix64`` is the SplitMix64 finalizer and ``slot_id`` the CRC32 of the slot
+name; all arithmetic is modulo 2**64, so seeds and indices are 64-bit. An
+integer below ``n`` is ``(value * n) >> 64``.
+
+Feistel permutation
+-------------------
+``FeistelPermutation(size, seed)`` maps positions to a shuffled order of
+``range(size)`` without storing it, for walking a space of combinations with
+no repeats (the generator's unique mode).
+
+Alias tables
+------------
+``AliasTable(weights)`` draws weighted indices in O(1) (Walker/Vose), and
+samples several distinct ones for the random lighting pick.
+"""
+import zlib
+
+MASK64 = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+SEED_SALT = 0x243F6A8885A308D3
+
+
+def mix64(z):
+    """SplitMix64 finalizer: a bijective 64-bit mixing function."""
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+_slot_ids = {}
+
+def slot_id(slot):
+    """Stable integer id of a category slot name (the same in every process)."""
+    try:
+        return _slot_ids[slot]
+    except KeyError:
+        return _slot_ids.setdefault(slot, zlib.crc32(slot.encode("utf-8")))
+
+
+class CounterStream:
+    """The draws of one (seed, index, slot). Implements the random.Random methods the generator uses."""
+
+    __slots__ = ("_state",)
+
+    def __init__(self, stream_key):
+        self._state = stream_key
+
+    def next64(self):
+        self._state = (self._state + GOLDEN_GAMMA) & MASK64
+        return mix64(self._state)
+
+    def random(self):
+        return (self.next64() >> 11) * (1.0 / (1 << 53))
+
+    def below(self, n):
+        """Integer in [0, n)."""
+        return (self.next64() * n) >> 64
+
+    def choice(self, seq):
+        if not seq:
+            raise IndexError("Cannot choose from an empty sequence")
+        return seq[self.below(len(seq))]
+
+    def randint(self, a, b):
+        return a + self.below(b - a + 1)
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def sample(self, population, k):
+        """k distinct entries in random order: pick among the n - i remaining, then skip earlier picks."""
+        n = len(population)
+        if not 0 <= k <= n:
+            raise ValueError("Sample larger than population or is negative")
+        picks = []
+        for i in range(k):
+            index = self.below(n - i)
+            for previous in sorted(picks):
+                if index >= previous:
+                    index += 1
+            picks.append(index)
+        return [population[index] for index in picks]
+
+
+class CounterRNG:
+    """Counter-based generator for prompt ``index`` under a 64-bit ``seed``."""
+
+    __slots__ = ("seed", "index", "_prompt_key")
+
+    def __init__(self, seed, index=0):
+        self.seed = seed & MASK64
+        self.index = index & MASK64
+        self._prompt_key = mix64((mix64(self.seed ^ SEED_SALT) + self.index) & MASK64)
+
+    def stream(self, slot):
+        """Fresh stream for one category slot; each call restarts at draw 0."""
+        return CounterStream(mix64(self._prompt_key ^ slot_id(slot)))
+
+
+class FeistelPermutation:
+    """Keyed bijection of range(size), for walking a space in a random order without repeats.
+
+    A balanced Feistel network over the smallest even number of bits that
+    covers ``size``; outputs that fall outside the range are encrypted again
+    (cycle walking), which stays a bijection. ``size`` may be any positive int,
+    far beyond 64 bits. Indexing costs O(1) memory and a few hash rounds.
+    """
+
+    __slots__ = ("size", "_half_bits", "_half_mask", "_chunks", "_round_keys")
+
+    def __init__(self, size, seed, tweak=0, rounds=6):
+        if size < 1:
+            raise ValueError("FeistelPermutation needs a size of at least 1")
+        self.size = size
+        self._half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self._half_mask = (1 << self._half_bits) - 1
+        self._chunks = (self._half_bits + 63) // 64
+        key = mix64((mix64((seed & MASK64) ^ SEED_SALT) + (tweak & MASK64)) & MASK64)
+        self._round_keys = [mix64((key + (r + 1) * GOLDEN_GAMMA) & MASK64) for r in range(rounds)]
+
+    def __len__(self):
+        return self.size
+
+    def _round(self, round_key, value):
+        state = round_key
+        while True:
+            state = mix64(state ^ (value & MASK64))
+            value >>= 64
+            if not value:
+                break
+        if self._chunks == 1:
+            return state & self._half_mask
+        output = 0
+        for chunk in range(self._chunks):
+            output |= mix64((state + (chunk + 1) * GOLDEN_GAMMA) & MASK64) << (64 * chunk)
+        return output & self._half_mask
+
+    def _encrypt(self, value):
+        left, right = value >> self._half_bits, value & self._half_mask
+        for round_key in self._round_keys:
+            left, right = right, left ^ self._round(round_key, right)
+        return (left << self._half_bits) | right
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError("permutation index out of range")
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+class AliasTable:
+    """Walker/Vose alias table over per-entry weights: one weighted draw costs one uniform.
+
+    ``draw(rng)`` and ``sample(rng, k)`` take any object with a ``random()``
+    method (``random.Random`` or a ``CounterStream``). Zero weights are never drawn.
+    """
+
+    __slots__ = ("weights", "total", "size", "positive", "probability", "alias")
+
+    def __init__(self, weights):
+        self.weights = tuple(float(weight) for weight in weights)
+        self.size = len(self.weights)
+        self.total = sum(self.weights)
+        if not self.size or self.total <= 0 or min(self.weights) < 0:
+            raise ValueError("AliasTable needs non-negative weights with a positive sum")
+        self.positive = sum(1 for weight in self.weights if weight > 0)
+
+        scaled = [weight * self.size / self.total for weight in self.weights]
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+        self.probability = [1.0] * self.size
+        self.alias = list(range(self.size))
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1 up to rounding error
+
+    def draw(self, rng):
+        """Index drawn with probability weight / total."""
+        position = rng.random() * self.size
+        index = min(int(position), self.size - 1)
+        return index if position - index < self.probability[index] else self.alias[index]
+
+    def sample(self, rng, k):
+        """Up to k distinct indices, each drawn in proportion to its weight among the ones not drawn yet.
+
+        Alias draws that repeat an earlier pick are redrawn, which is exactly
+        successive weighted sampling; once the picks hold half the weight the
+        rest is drawn with one linear scan instead.
+        """
+        picked = []
+        picked_weight = 0.0
+        while len(picked) < min(k, self.positive):
+            if picked_weight * 2 > self.total:
+                index = self.pick_remaining(rng.random(), picked, picked_weight)
+            else:
+                index = self.draw(rng)
+                if index in picked:
+                    continue
+            picked.append(index)
+            picked_weight += self.weights[index]
+        return picked
+
+    def sample_with_uniforms(self, uniforms):
+        """Like sample(), but each pick uses exactly one of the given uniforms (for fixed draw layouts)."""
+        picked = []
+        picked_weight = 0.0
+        for uniform in uniforms[:self.positive]:
+            index = self.pick_remaining(uniform, picked, picked_weight)
+            picked.append(index)
+            picked_weight += self.weights[index]
+        return picked
+
+    def pick_remaining(self, uniform, picked, picked_weight):
+        """Inverse-CDF pick among the positive-weight entries not in picked."""
+        target = uniform * (self.total - picked_weight)
+        last = None
+        for index, weight in enumerate(self.weights):
+            if weight <= 0 or index in picked:
+                continue
+            last = index
+            target -= weight
+            if target < 0:
+                return index
+        return last
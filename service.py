@@ -0,0 +1,366 @@
+# service.py
+"""Local prompt-generation service.
+
+One process loads the vocabulary once and serves prompts over HTTP, on a TCP
+port or a Unix socket, to render workers, scripts and (optionally) the ComfyUI
+node. Run it from the repository directory:
+
+    python -m service --port 8189
+    python -m service --unix /tmp/flux-prompt.sock
+
+Endpoints (JSON bodies):
+
+    POST /generate  {"seed": 42, "inputs": {"artist": "random", ...}, "rng_mode": "legacy"}
+                    -> {"prompt", "t5xxl", "clip_l", "clip_g", "seed"}
+    POST /batch     {"start_seed": 0, "count": 100000, "inputs": {...}, "rng_mode": "legacy"}
+                    -> one JSON object per line (NDJSON), streamed in chunks
+    GET  /health    GET /stats
+
+``inputs`` are the node inputs; as in the node, a category that is not given
+is disabled. Concurrent /generate requests are coalesced: requests that arrive
+within ``max_delay`` seconds of each other are grouped by config and rendered
+with one ``generate_batch`` call, and identical requests share one result. The
+rows are exactly what the node returns for the same inputs.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+try:
+    from . import flux_prompt_generator as fpg
+except ImportError:  # Run as a top-level module (python -m service)
+    import flux_prompt_generator as fpg
+
+ROW_FIELDS = ("prompt", "t5xxl", "clip_l", "clip_g", "seed")
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class RequestError(ValueError):
+    """A malformed request; answered with 400."""
+
+
+class StreamAborted(ConnectionError):
+    """A streamed response failed after its 200 header went out; the connection is dropped."""
+
+
+def node_config(inputs):
+    """Canonical, hashable config of a request's node inputs: every category, disabled unless given."""
+    if not isinstance(inputs, dict):
+        raise RequestError("inputs must be an object")
+    config = {category: "disabled" for category in fpg.ALL_CATEGORIES}
+    config["custom"] = config["subject"] = ""
+    for name, value in inputs.items():
+        if name not in config:
+            raise RequestError(f"unknown input {name!r}")
+        if not isinstance(value, str):
+            raise RequestError(f"input {name!r} must be a string")
+        config[name] = value
+    return tuple(sorted(config.items()))
+
+
+def _seed(value, name="seed"):
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 0xffffffffffffffff:
+        raise RequestError(f"{name} must be an integer from 0 to 2**64 - 1")
+    return value
+
+
+def _rng_mode(body):
+    rng_mode = body.get("rng_mode", "legacy")
+    if rng_mode not in fpg.RNG_MODES:
+        raise RequestError(f"rng_mode must be one of {fpg.RNG_MODES}")
+    return rng_mode
+
+
+class PromptService:
+    """Coalesces prompt requests into generate_batch calls on one generator per rng_mode.
+
+    Generation runs on a single worker thread, so the generators are never
+    used concurrently and the event loop stays free to accept requests.
+    """
+
+    def __init__(self, max_batch=256, max_delay=0.002, chunk_size=1000):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.chunk_size = chunk_size
+        # Same generators as the node: unique mode walks positions of the walk keyed by 0
+        self.generators = {rng_mode: fpg.PromptGenerator(0, rng_mode=rng_mode, debug="off") for rng_mode in fpg.RNG_MODES}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-service")
+        self._pending = {} # (rng_mode, config, seed) -> future, waiting for the next flush
+        self._flush_handle = None
+        self.stats = {"requests": 0, "coalesced": 0, "batches": 0, "rows": 0, "streamed_rows": 0}
+
+    # --- Coalesced single prompts ---
+    async def generate(self, seed, config, rng_mode="legacy"):
+        """The (prompt, t5xxl, clip_l, clip_g, seed) row of one prompt."""
+        self.stats["requests"] += 1
+        key = (rng_mode, config, seed)
+        future = self._pending.get(key)
+        if future is not None: # The same prompt is already waiting for this flush
+            self.stats["coalesced"] += 1
+        else:
+            future = self._pending[key] = asyncio.get_running_loop().create_future()
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        groups = {}
+        for (rng_mode, config, seed), future in pending.items():
+            groups.setdefault((rng_mode, config), []).append((seed, future))
+        for (rng_mode, config), requests in groups.items():
+            asyncio.ensure_future(self._render_group(rng_mode, config, requests))
+
+    async def _render_group(self, rng_mode, config, requests):
+        seeds = [seed for seed, _ in requests]
+        try:
+            rows = await self._rows(rng_mode, config, seeds)
+        except Exception as e:
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for row, (_, future) in zip(rows, requests):
+            if not future.done():
+                future.set_result(row)
+
+    async def _rows(self, rng_mode, config, seeds):
+        generator = self.generators[rng_mode]
+        kwargs = dict(config)
+
+        def render():
+            fpg.VOCABULARY.check_for_changes() # Edited data files, as in the node
+            return generator.generate_batch(seeds, **kwargs)
+
+        columns = await asyncio.get_running_loop().run_in_executor(self.executor, render)
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(seeds)
+        return list(zip(*columns))
+
+    # --- Streamed seed ranges ---
+    async def stream(self, start_seed, count, config, rng_mode="legacy"):
+        """Yields rows for start_seed .. start_seed + count - 1, chunk_size rows at a time."""
+        for chunk_start in range(start_seed, start_seed + count, self.chunk_size):
+            rows = await self._rows(rng_mode, config, range(chunk_start, min(chunk_start + self.chunk_size, start_seed + count)))
+            self.stats["streamed_rows"] += len(rows)
+            yield rows
+
+    # --- HTTP ---
+    async def handle_connection(self, reader, writer):
+        """Serves HTTP/1.1 requests on one connection, keeping it open between requests."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                await self.dispatch(method, urlsplit(target).path, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body, writer):
+        routes = {"/generate": ("POST", self._post_generate), "/batch": ("POST", self._post_batch),
+                  "/health": ("GET", self._get_health), "/stats": ("GET", self._get_stats)}
+        if path not in routes:
+            return await self._respond(writer, 404, {"error": f"no endpoint {path}"})
+        expected, handler = routes[path]
+        if method != expected:
+            return await self._respond(writer, 405, {"error": f"{path} takes {expected}"})
+        try:
+            request = json.loads(body or b"{}")
+            if not isinstance(request, dict):
+                raise RequestError("the body must be a JSON object")
+            await handler(request, writer)
+        except (RequestError, json.JSONDecodeError) as e:
+            await self._respond(writer, 400, {"error": str(e)})
+        except ConnectionError:
+            raise
+        except Exception as e:
+            await self._respond(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+
+    async def _post_generate(self, request, writer):
+        row = await self.generate(_seed(request.get("seed", 0)), node_config(request.get("inputs", {})), _rng_mode(request))
+        await self._respond(writer, 200, dict(zip(ROW_FIELDS, row)))
+
+    async def _post_batch(self, request, writer):
+        start_seed = _seed(request.get("start_seed", 0), "start_seed")
+        count = request.get("count")
+        if not isinstance(count, int) or count < 0 or start_seed + count - 1 > 0xffffffffffffffff:
+            raise RequestError("count must be a non-negative integer that keeps every seed below 2**64")
+        config = node_config(request.get("inputs", {}))
+        rng_mode = _rng_mode(request)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        try:
+            async for rows in self.stream(start_seed, count, config, rng_mode):
+                _write_chunk(writer, [dict(zip(ROW_FIELDS, row)) for row in rows])
+                await writer.drain() # Backpressure: a slow reader pauses generation
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # Too late for a 500: send the error as a last line and drop the connection without the
+            # final chunk, so the client sees a cut-off body rather than a complete one
+            _write_chunk(writer, [{"error": f"{type(e).__name__}: {e}"}])
+            await writer.drain()
+            raise StreamAborted(str(e)) from e
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _get_health(self, request, writer):
+        await self._respond(writer, 200, {"status": "ok"})
+
+    async def _get_stats(self, request, writer):
+        await self._respond(writer, 200, dict(self.stats, pending=len(self._pending)))
+
+    async def _respond(self, writer, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode("ascii") + data)
+        await writer.drain()
+
+
+def _write_chunk(writer, objects):
+    """Writes objects as NDJSON lines in one chunk of a chunked response."""
+    data = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in objects).encode("utf-8")
+    writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+
+async def serve(host="127.0.0.1", port=8189, unix_path=None, ready=None, **options):
+    """Runs a PromptService until cancelled. ready, if given, is an asyncio.Event set once it accepts connections."""
+    service = PromptService(**options)
+    fpg.VOCABULARY.load_all() # Once, before the first request
+    if unix_path:
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix_path)
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+    if ready is not None:
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+# --- Client ---
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class ServiceClient:
+    """Blocking client of a running service; url is http://host:port or unix:/path/to.sock.
+
+    Not thread-safe: it keeps one connection open between calls.
+    """
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+        self._connection = None
+
+    def _connect(self):
+        if self.url.startswith("unix:"):
+            return _UnixHTTPConnection(self.url[len("unix:"):], self.timeout)
+        parts = urlsplit(self.url)
+        return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=self.timeout)
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2): # A kept-alive connection may have been closed by the server
+            if self._connection is None:
+                self._connection = self._connect()
+            try:
+                self._connection.request(method, path, body, headers)
+                return self._connection.getresponse()
+            except (ConnectionError, http.client.HTTPException, OSError):
+                self._connection.close()
+                self._connection = None
+                if attempt:
+                    raise
+
+    def _json(self, method, path, payload=None):
+        response = self._request(method, path, payload)
+        data = json.loads(response.read() or b"{}")
+        if response.status != 200:
+            raise RuntimeError(f"prompt service answered {response.status}: {data.get('error')}")
+        return data
+
+    def generate(self, seed, rng_mode="legacy", **inputs):
+        """{"prompt", "t5xxl", "clip_l", "clip_g", "seed"} of one prompt."""
+        return self._json("POST", "/generate", {"seed": seed, "inputs": inputs, "rng_mode": rng_mode})
+
+    def iter_batch(self, start_seed, count, rng_mode="legacy", **inputs):
+        """Yields the row dicts of a seed range as the service streams them.
+
+        Raises RuntimeError when the service fails partway (it sends an error
+        line and drops the connection).
+        """
+        response = self._request("POST", "/batch", {"start_seed": start_seed, "count": count, "inputs": inputs, "rng_mode": rng_mode})
+        if response.status != 200:
+            raise RuntimeError(f"prompt service answered {response.status}: {json.loads(response.read()).get('error')}")
+        try:
+            for line in response:
+                row = json.loads(line)
+                if "error" in row:
+                    raise RuntimeError(f"prompt service failed while streaming: {row['error']}")
+                yield row
+        except RuntimeError:
+            self.close() # The service drops the connection after an error line
+            raise
+
+    def stats(self):
+        return self._json("GET", "/stats")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m service", description="Local prompt-generation service.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8189, help="TCP port (default: 8189)")
+    parser.add_argument("--unix", default=None, metavar="PATH", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--max-batch", type=int, default=256, help="requests rendered per coalesced batch at most")
+    parser.add_argument("--max-delay-ms", type=float, default=2.0, help="how long a request waits for others to join its batch")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows per streamed /batch chunk")
+    args = parser.parse_args(argv)
+
+    where = f"unix:{args.unix}" if args.unix else f"http://{args.host}:{args.port}"
+    print(f"Serving prompts on {where}", file=sys.stderr)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, max_batch=args.max_batch,
+                          max_delay=args.max_delay_ms / 1000, chunk_size=args.chunk_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
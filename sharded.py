@@ -0,0 +1,110 @@
+# sharded.py
+"""Multi-process sharded prompt generation.
+
+The seed range is cut into shards of consecutive seeds. Every worker process
+builds one generator and loads the vocabulary once, in the pool initializer,
+then turns shards into rows. Results are merged back strictly in shard order,
+so the output is identical to a single-process run with the same engine. With
+a coverage_stats.CoverageStats, every shard also returns the counts of its prompts,
+which are merged into it as the shard is read. Only
+a bounded number of shards is in flight at a time, which keeps memory flat for
+streaming consumers such as the dataset CLI.
+
+Workers are separate processes, so this is meant for scripts and the CLI
+rather than for use inside a running ComfyUI node.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from . import flux_prompt_generator as fpg
+    from . import coverage_stats
+except ImportError:  # Loaded as a top-level module (scripts, benchmarks)
+    import flux_prompt_generator as fpg
+    import coverage_stats
+
+ENGINES = ("python", "counter", "unique", "numpy")
+
+# Set in each worker process by _init_worker
+_worker_generator = None
+
+
+def make_generator(engine="python", generator_seed=None, metrics=None, stats=None):
+    """PromptGenerator for "python", "counter" and "unique" (its rng_mode, "legacy" for "python"), VectorizedPromptGenerator for "numpy".
+
+    generator_seed keys the unique walk and the numpy stream; the other engines reseed per prompt.
+    metrics (an instrumentation.Metrics) and stats (a coverage_stats.CoverageStats) are not supported by the numpy engine.
+    """
+    if engine == "numpy":
+        try:
+            from .vectorized_sampler import VectorizedPromptGenerator
+        except ImportError:
+            from vectorized_sampler import VectorizedPromptGenerator
+        return VectorizedPromptGenerator(generator_seed)
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    return fpg.PromptGenerator(generator_seed, rng_mode="legacy" if engine == "python" else engine, metrics=metrics,
+                               stats=stats)
+
+
+def _init_worker(engine, generator_seed, stats_pairs=None):
+    global _worker_generator
+    stats = coverage_stats.CoverageStats(pairs=stats_pairs) if stats_pairs is not None else None
+    _worker_generator = make_generator(engine, generator_seed, stats=stats)
+    fpg.VOCABULARY.load_all() # Once per worker, not once per shard
+
+
+def _generate_shard(shard, kwargs):
+    prompts, t5xxl, clip_l, clip_g, seeds = _worker_generator.generate_batch(shard, **kwargs)
+    rows = list(zip(seeds, prompts, t5xxl, clip_l, clip_g))
+    stats = getattr(_worker_generator, "stats", None) # The numpy engine keeps none
+    if stats is None:
+        return rows, None
+    snapshot = stats.snapshot()
+    stats.reset()
+    return rows, snapshot
+
+
+def iter_sharded_rows(seeds, kwargs, workers=None, shard_size=1000, engine="python", generator_seed=None, max_pending=None,
+                      stats=None):
+    """Yields (seed, prompt, t5xxl, clip_l, clip_g) rows in seed order, generated by a process pool.
+
+    seeds must support len() and slicing (a range or a list). At most
+    max_pending shards (default: two per worker) are queued or held at once.
+    stats, a coverage_stats.CoverageStats, gets the counts of every shard that was read.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(engine, generator_seed, stats.pairs if stats is not None else None))
+    pending = deque()
+
+    def read_shard():
+        rows, snapshot = pending.popleft().result()
+        if snapshot is not None:
+            stats.merge(snapshot)
+        return rows
+
+    try:
+        for shard_start in range(0, len(seeds), shard_size):
+            pending.append(executor.submit(_generate_shard, seeds[shard_start:shard_start + shard_size], kwargs))
+            if len(pending) >= max_pending:
+                yield from read_shard()
+        while pending:
+            yield from read_shard()
+    finally:
+        # Also reached when the consumer stops early: drop the shards nobody will read
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def generate_batch_sharded(seeds, workers=None, shard_size=1000, engine="python", generator_seed=None, **kwargs):
+    """Process-pool version of generate_batch: returns (prompts, t5xxl, clip_l, clip_g, seeds)."""
+    columns = ([], [], [], [], [])
+    for seed, prompt, t5xxl, clip_l, clip_g in iter_sharded_rows(seeds, kwargs, workers, shard_size, engine, generator_seed):
+        columns[0].append(prompt)
+        columns[1].append(t5xxl)
+        columns[2].append(clip_l)
+        columns[3].append(clip_g)
+        columns[4].append(seed)
+    return columns
@@ -0,0 +1,143 @@
+# templates.py
+"""Dynamic-prompt templates for the custom and subject inputs.
+
+Syntax:
+
+- ``{a|b|c}`` picks one of the alternatives, uniformly; ``{a|}`` may pick nothing.
+- ``__artist__`` picks one entry of a vocabulary list (weighted when the
+  category has weights). Names that are not categories are kept as typed.
+- Both nest: ``{__artist__|a {red|blue} __clothing__}``.
+- ``\\{``, ``\\}``, ``\\|`` and ``\\_`` stand for the character itself.
+
+``compile_template`` parses a template once into a tree of ``Text``,
+``Alternatives`` and ``Wildcard`` nodes, and caches it by template text. A
+batch therefore parses every template once, and ``Template.expand`` only walks
+the tree. Text without any syntax compiles to a plain ``Template`` whose
+``dynamic`` is False; the generator uses such text as it is, without a draw.
+"""
+import re
+from functools import lru_cache
+
+_TOKEN = re.compile(r"\\[{}|_\\]|[{}|]|__([A-Za-z0-9_]+?)__")
+
+
+class Wildcard:
+    """``__name__``: one entry of a vocabulary list."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Wildcard({self.name!r})"
+
+
+class Alternatives:
+    """``{a|b}``: one of several sequences of nodes."""
+
+    __slots__ = ("options",)
+
+    def __init__(self, options):
+        self.options = options
+
+    def __repr__(self):
+        return f"Alternatives({self.options!r})"
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class Template:
+    """A compiled template: a tuple of nodes (str, Alternatives or Wildcard)."""
+
+    __slots__ = ("text", "nodes", "dynamic", "categories")
+
+    def __init__(self, text, nodes):
+        self.text = text
+        self.nodes = nodes
+        self.dynamic = any(not isinstance(node, str) for node in nodes)
+        categories = set()
+        _collect_categories(nodes, categories)
+        self.categories = frozenset(categories)
+
+    def __repr__(self):
+        return f"Template({self.text!r})"
+
+    def expand(self, rng, lists):
+        """The text of one expansion. lists maps a category to (entries, sampling.AliasTable or None)."""
+        parts = []
+        _expand(self.nodes, rng, lists, parts)
+        return "".join(parts)
+
+
+def _collect_categories(nodes, categories):
+    for node in nodes:
+        if isinstance(node, Wildcard):
+            categories.add(node.name)
+        elif isinstance(node, Alternatives):
+            for option in node.options:
+                _collect_categories(option, categories)
+
+
+def _expand(nodes, rng, lists, parts):
+    for node in nodes:
+        if isinstance(node, str):
+            parts.append(node)
+        elif isinstance(node, Alternatives):
+            _expand(rng.choice(node.options), rng, lists, parts)
+        else:
+            values, alias_table = lists[node.name]
+            if values:
+                parts.append(values[alias_table.draw(rng)] if alias_table is not None else rng.choice(values))
+
+
+@lru_cache(maxsize=256)
+def compile_template(text, categories):
+    """Template of text; categories (a frozenset) are the names __name__ may refer to.
+
+    Raises TemplateError for an unbalanced brace.
+    """
+    # Each open group is a list of finished options plus the sequence being built
+    stack = []
+    current = []
+    position = 0
+
+    def add_text(value):
+        if value:
+            if current and isinstance(current[-1], str):
+                current[-1] += value
+            else:
+                current.append(value)
+
+    for match in _TOKEN.finditer(text):
+        add_text(text[position:match.start()])
+        position = match.end()
+        token = match.group()
+        if token[0] == "\\":
+            add_text(token[1])
+        elif token == "{":
+            stack.append(([], current))
+            current = []
+        elif token == "|":
+            if not stack:
+                add_text("|") # Outside braces a bar is plain text
+            else:
+                stack[-1][0].append(tuple(current))
+                current = []
+        elif token == "}":
+            if not stack:
+                raise TemplateError(f"Unmatched '}}' at position {match.start()} of {text!r}")
+            options, outer = stack.pop()
+            options.append(tuple(current))
+            current = outer
+            current.append(Alternatives(tuple(options)))
+        elif match.group(1) in categories:
+            current.append(Wildcard(match.group(1)))
+        else:
+            add_text(token)
+    add_text(text[position:])
+    if stack:
+        raise TemplateError(f"Unclosed '{{' in {text!r}")
+    return Template(text, tuple(current))
@@ -0,0 +1,37 @@
+# tests/conftest.py
+# The modules are imported top-level, as the scripts and benchmarks do
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flux_prompt_generator as fpg
+import vocabulary
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """A copy of data/*.json, read by a fresh registry standing in for fpg.VOCABULARY.
+
+    Files can be edited in place; the registry checks for changes on every
+    check_for_changes() call, as the nodes do.
+    """
+    source = os.path.dirname(fpg.VOCABULARY.rules_path)
+    for file_name in os.listdir(source):
+        if file_name.endswith(".json"):
+            shutil.copy(os.path.join(source, file_name), tmp_path)
+
+    def load(file_name):
+        with open(tmp_path / file_name, encoding="utf-8") as file:
+            return json.load(file)
+
+    registry = vocabulary.VocabularyRegistry(str(tmp_path), load, reload_interval=0)
+    registry.add_listener(fpg._vocabulary_changed)
+    monkeypatch.setattr(fpg, "VOCABULARY", registry)
+    fpg._vocabulary_changed(set()) # Specs and results drawn from the real lists
+    yield tmp_path
+    fpg._vocabulary_changed(set())
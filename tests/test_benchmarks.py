@@ -0,0 +1,41 @@
+# tests/test_benchmarks.py
+import json
+import os
+import subprocess
+import sys
+
+SUITE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "suite.py")
+
+
+def results(unit_us, peak_rss):
+    """Results JSON of the suite with one entry per benchmark name."""
+    return {"format": 1, "python": "3", "platform": "test", "repeat": 1, "rules": None,
+            "results": {name: {"seconds": unit_us[name] / 1e6, "units": 1, "unit_us": unit_us[name], "peak_rss": peak_rss[name]}
+                        for name in unit_us}}
+
+
+def compare(tmp_path, baseline, current, *options):
+    for name, data in (("baseline.json", baseline), ("current.json", current)):
+        (tmp_path / name).write_text(json.dumps(data), encoding="utf-8")
+    return subprocess.run([sys.executable, SUITE, "compare", str(tmp_path / "baseline.json"), str(tmp_path / "current.json"), *options],
+                          capture_output=True, text=True)
+
+
+def test_compare_flags_only_regressions_beyond_the_threshold(tmp_path):
+    memory = {"execute": 1000, "batch_1k": 1000, "cleaner_long": 1000}
+    baseline = results({"execute": 100.0, "batch_1k": 100.0, "cleaner_long": 100.0}, memory)
+    current = results({"execute": 130.0, "batch_1k": 110.0, "cleaner_long": 50.0}, dict(memory, cleaner_long=1300))
+    run = compare(tmp_path, baseline, current, "--threshold", "0.2")
+    assert run.returncode == 1
+    flagged = {line.split()[0] for line in run.stdout.splitlines() if "SLOWER" in line or "MORE MEMORY" in line}
+    assert flagged == {"execute", "cleaner_long"} # 30% slower, 30% more memory; batch_1k is 10% slower
+    assert "2 regression(s) beyond 20%: execute, cleaner_long" in run.stdout
+
+
+def test_compare_passes_within_the_threshold(tmp_path):
+    memory = {"execute": 1000, "batch_1k": 1000}
+    baseline = results({"execute": 100.0, "batch_1k": 100.0}, memory)
+    current = results({"execute": 114.0, "batch_1k": 90.0}, dict(memory, execute=1100))
+    run = compare(tmp_path, baseline, current)
+    assert run.returncode == 0
+    assert "SLOWER" not in run.stdout and "no regression beyond 15%" in run.stdout
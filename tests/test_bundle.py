@@ -0,0 +1,72 @@
+# tests/test_bundle.py
+import json
+import random
+
+import pytest
+
+import flux_prompt_generator as fpg
+import vocabulary
+
+
+def make_registry(data_dir):
+    """A registry over data_dir whose loader records the files it parses."""
+    parsed = []
+
+    def load(file_name):
+        parsed.append(file_name)
+        with open(data_dir / file_name, encoding="utf-8") as file:
+            return json.load(file)
+
+    return vocabulary.VocabularyRegistry(str(data_dir), load), parsed
+
+
+def test_bundle_reads_back_every_category(data_dir):
+    registry, _ = make_registry(data_dir)
+    registry.build_bundle()
+    mapped, parsed = make_registry(data_dir)
+    for category in vocabulary.CATEGORIES:
+        values = mapped[category]
+        entries = json.loads((data_dir / vocabulary.category_file_name(category)).read_text(encoding="utf-8"))
+        expected = vocabulary.split_weights(entries)[0] # Duplicates removed, as the registry does
+        assert isinstance(values, vocabulary.MappedCategory)
+        assert len(values) == len(expected) and list(values) == expected
+        assert values[0] == expected[0] and values[-1] == expected[-1] and values[-len(expected)] == expected[0]
+        assert values[1:4] == expected[1:4] and values[::-3] == expected[::-3]
+    assert parsed == [] # Nothing parsed from JSON
+
+
+def test_bundle_index_errors(data_dir):
+    registry, _ = make_registry(data_dir)
+    registry.build_bundle()
+    values = make_registry(data_dir)[0]["eye_colors"]
+    for index in (len(values), -len(values) - 1):
+        with pytest.raises(IndexError):
+            values[index]
+
+
+def test_stale_bundle_falls_back_to_json(data_dir):
+    registry, _ = make_registry(data_dir)
+    registry.build_bundle()
+    (data_dir / "eye_colors.json").write_text(json.dumps(["violet", "grey"]), encoding="utf-8")
+    stale, parsed = make_registry(data_dir)
+    assert stale["eye_colors"] == ["violet", "grey"]
+    assert not isinstance(stale["eye_colors"], vocabulary.MappedCategory)
+    assert parsed == ["eye_colors.json"]
+    assert vocabulary.open_bundle(stale.bundle_path, stale.fingerprint()) is None
+
+
+def test_weights_work_on_mapped_categories(data_dir):
+    (data_dir / "weights.json").write_text(json.dumps({"eye_colors": {"blue": 30, "amber": 0}}), encoding="utf-8")
+    registry, _ = make_registry(data_dir)
+    registry.build_bundle()
+    mapped, _ = make_registry(data_dir)
+    values = mapped["eye_colors"]
+    assert isinstance(values, vocabulary.MappedCategory)
+    assert mapped.weights("eye_colors") == registry.weights("eye_colors")
+    alias_table = mapped.alias_table("eye_colors")
+    assert alias_table is not None
+    spec = fpg.CategorySpec("eye_colors", "random", values, alias_table=alias_table)
+    rng = random.Random(0)
+    picks = [spec.sampler(rng) for _ in range(2000)]
+    assert "amber" not in picks
+    assert picks.count("blue") > len(picks) // 3 # 30 of about 55 weight
@@ -0,0 +1,42 @@
+# tests/test_cleaner.py
+"""clean_prompt_string must give the same output as the regex chain it replaced (clean_prompt_string_legacy)."""
+import random
+
+import pytest
+
+import flux_prompt_generator as fpg
+from benchmarks import bench_cleaner
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_random_strings_match_legacy_cleaner(seed):
+    generator = fpg.PromptGenerator(0)
+    rng = random.Random(seed)
+    for _ in range(20000):
+        text = bench_cleaner.random_text(rng)
+        assert generator.clean_prompt_string(text) == generator.clean_prompt_string_legacy(text), repr(text)
+
+
+def test_long_strings_match_legacy_cleaner():
+    generator = fpg.PromptGenerator(0)
+    rng = random.Random(3)
+    for _ in range(300):
+        text = bench_cleaner.random_text(rng, 400)
+        assert generator.clean_prompt_string(text) == generator.clean_prompt_string_legacy(text), repr(text)
+
+
+def test_generated_segments_match_legacy_cleaner():
+    generator = fpg.PromptGenerator(0)
+    for text in bench_cleaner.generated_segments(300):
+        assert generator.clean_prompt_string(text) == generator.clean_prompt_string_legacy(text), repr(text)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", ""),
+    (" , a ,, b . .C ", "a, b. C"),
+    ("working as as a  model", "working as a model"),
+    ("lit with with candles..", "lit with candles."),
+    (", ,start", "start"),
+])
+def test_examples(text, expected):
+    assert fpg.PromptGenerator(0).clean_prompt_string(text) == expected
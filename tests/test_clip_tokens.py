@@ -0,0 +1,47 @@
+# tests/test_clip_tokens.py
+import random
+
+import pytest
+
+import clip_tokens
+import flux_prompt_generator as fpg
+
+
+@pytest.fixture(scope="module")
+def exact():
+    counter = clip_tokens.ClipTokenCounter()
+    assert counter.exact, "data/bpe_simple_vocab_16e6.txt.gz is missing"
+    return counter
+
+
+@pytest.fixture(scope="module")
+def texts():
+    """Every CLIP block entry, and clip_l / clip_g outputs of a few hundred prompts."""
+    entries = [entry for category in fpg.CLIP_CATEGORIES for entry in fpg.VOCABULARY[category]]
+    kwargs = {category: "random" for category in fpg.ALL_CATEGORIES if category not in ("custom", "subject")}
+    _, _, clip_l, clip_g, _ = fpg.PromptGenerator(1).generate_batch(range(200), **kwargs)
+    return entries + clip_l + clip_g
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("photography", 1), ("a photo of a cat", 5), ("(masterpiece:1.2)", 7), ("Lyubov Popova", 6), ("", 0), ("  ,  ", 1),
+])
+def test_exact_counts(exact, text, tokens):
+    # The token counts of open_clip's SimpleTokenizer, without the start and end markers
+    assert exact.count(text) == tokens
+
+
+def test_fallback_never_counts_low(exact, texts):
+    fallback = clip_tokens.ClipTokenCounter(bpe_path="/nonexistent/bpe.txt.gz")
+    assert not fallback.exact
+    rng = random.Random(0)
+    noise = ["".join(rng.choice("qxzjvkwé(),.-' ") for _ in range(rng.randint(1, 40))) for _ in range(500)]
+    for text in texts + noise:
+        assert fallback.count(text) >= exact.count(text), text
+
+
+def test_fallback_budget_still_fits(exact, monkeypatch):
+    monkeypatch.setattr(fpg, "_clip_counter", clip_tokens.ClipTokenCounter(bpe_path="/nonexistent/bpe.txt.gz"))
+    kwargs = {category: "random" for category in fpg.ALL_CATEGORIES if category not in ("custom", "subject")}
+    _, _, clip_l, clip_g, _ = fpg.PromptGenerator(2, clip_token_budget=30).generate_batch(range(100), **kwargs)
+    assert max(exact.count(text) for text in clip_l + clip_g) <= 30
@@ -0,0 +1,70 @@
+# tests/test_coverage_stats.py
+import json
+
+import coverage_stats
+import flux_prompt_generator as fpg
+
+INPUTS = {"artist": "random", "lighting": "random", "facial_hair": "random", "makeup_styles": "random",
+          "default_tags": "random", "body_types": "random", "pose": "disabled"}
+PAIRS = [("artist", "lighting")]
+
+
+def collect(seeds):
+    stats = coverage_stats.CoverageStats(pairs=PAIRS)
+    fpg.PromptGenerator(0, debug="off", stats=stats).generate_batch(seeds, **INPUTS)
+    return stats
+
+
+def test_outcomes_cover_every_prompt():
+    stats = collect(range(300))
+    report = stats.report(fpg.VOCABULARY)
+    assert report["prompts"] == 300
+    for category, summary in report["categories"].items():
+        assert summary["used"] + sum(summary[outcome] for outcome in coverage_stats.OUTCOMES) == 300, category
+    assert report["categories"]["pose"]["disabled"] == 300
+    assert report["categories"]["facial_hair"]["hidden"] == 300 # Makeup is always present here
+    assert report["categories"]["photography_styles"]["not_drawn"] == 300
+    lighting = report["categories"]["lighting"]
+    assert lighting["unlisted"] == 0 and lighting["covered"] <= lighting["list_size"]
+
+
+def test_merge_of_shards_equals_one_run():
+    whole = collect(range(400))
+    merged = coverage_stats.CoverageStats(pairs=PAIRS)
+    for shard in (range(300, 400), range(0, 150), range(150, 300)): # Any order
+        merged.merge(json.loads(json.dumps(collect(shard).snapshot())))
+    assert merged.report(fpg.VOCABULARY) == whole.report(fpg.VOCABULARY)
+    assert merged.co_occurrence() == whole.co_occurrence()
+
+
+def test_merge_maps_masks_by_category_name():
+    stats = coverage_stats.CoverageStats(categories=("artist", "lighting"))
+    stats.merge({"categories": ["lighting", "pose", "artist"], "prompts": 2, "entries": {}, "outcomes": {},
+                 "masks": [[0b101, 1], [0b001, 1]], "pairs": {}})
+    assert stats.co_occurrence() == {"lighting": {"lighting": 2, "artist": 1}, "artist": {"lighting": 1, "artist": 1}}
+
+
+def test_reset():
+    stats = collect(range(50))
+    stats.reset()
+    assert stats.snapshot()["prompts"] == 0 and stats.snapshot()["masks"] == []
+
+
+def test_incremental_prompts_are_counted():
+    stats = coverage_stats.CoverageStats()
+    generator = fpg.PromptGenerator(0, stats=stats)
+    _, state = generator.regenerate(None, 3, **INPUTS)
+    _, state = generator.regenerate(state, 3, **dict(INPUTS, lighting="disabled"))
+    report = stats.report()
+    assert report["prompts"] == 2
+    assert report["categories"]["lighting"]["disabled"] == 1 and report["categories"]["lighting"]["used"] == 1
+
+
+def test_plans_are_bounded():
+    stats = coverage_stats.CoverageStats()
+    generator = fpg.PromptGenerator(0, stats=stats)
+    artists = fpg.VOCABULARY["artist"]
+    for index in range(coverage_stats.PLAN_CACHE_SIZE + 10):
+        generator.generate_batch([index], artist=artists[index % len(artists)], lighting=str(index))
+    assert len(stats._plans) <= coverage_stats.PLAN_CACHE_SIZE
+    assert stats.prompts == coverage_stats.PLAN_CACHE_SIZE + 10
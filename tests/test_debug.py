@@ -0,0 +1,52 @@
+# tests/test_debug.py
+import pytest
+
+import flux_prompt_generator as fpg
+
+INPUTS = {"artform": "photography", "photography_styles": "random", "artist": "disabled", "lighting": "random",
+          "eye_colors": "violet, hazel", "clothing": "", "subject": "a lighthouse keeper"}
+
+
+def test_off_collects_nothing():
+    generator = fpg.PromptGenerator(3)
+    assert generator.generate_prompt(3, **INPUTS)[5] == ""
+    with pytest.raises(ValueError):
+        fpg.PromptGenerator(3, debug="verbose")
+
+
+def test_debug_does_not_change_the_prompt():
+    for debug in ("text", "record"):
+        assert fpg.PromptGenerator(3, debug=debug).generate_prompt(3, **INPUTS)[:5] == fpg.PromptGenerator(3).generate_prompt(3, **INPUTS)[:5]
+
+
+def test_record_lists_used_and_skipped_categories():
+    record = fpg.PromptGenerator(3, debug="record").generate_prompt(3, **INPUTS)[5]
+    assert isinstance(record, fpg.DebugRecord)
+    assert record.used["lighting"].startswith("random: ")
+    assert record.used["eye_colors"] == "from list: " + record.choices["eye_colors"]
+    assert record.used["subject"] == "a lighthouse keeper"
+    assert "artist" in record.not_used
+    assert record.choices["eye_colors"] in ("violet", "hazel")
+    assert {category for category, _, _, _ in record.draws} >= {"lighting", "photography_styles"}
+    assert str(record) == record.render()
+
+
+def test_text_is_the_rendered_record():
+    text = fpg.PromptGenerator(3, debug="text").generate_prompt(3, **INPUTS)[5]
+    assert text == fpg.PromptGenerator(3, debug="record").generate_prompt(3, **INPUTS)[5].render()
+    assert "CATEGORIES USED" in text and "CATEGORIES NOT USED" in text and "RNG DRAWS" in text
+
+
+def test_photography_styles_are_skipped_for_other_artforms():
+    record = fpg.PromptGenerator(3, debug="record").generate_prompt(3, **dict(INPUTS, artform="digital art"))[5]
+    assert "photography_styles" not in record.used
+    assert record.not_used["photography_styles"] == "ignored (artform=digital art, not photography)"
+
+
+def test_node_renders_the_report_only_when_debug_info_is_read():
+    node = fpg.FluxPromptGenerator()
+    inputs = dict(INPUTS, seed=3, custom="")
+    unread = node.execute(**dict(inputs, prompt={"1": {"inputs": {}}}, unique_id="1"))
+    read = node.execute(**dict(inputs, prompt={"1": {"inputs": {}}, "2": {"inputs": {"text": ["1", 5]}}}, unique_id="1"))
+    assert unread[5] == "" and "CATEGORIES USED" in read[5]
+    assert unread[:5] == read[:5]
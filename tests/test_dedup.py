@@ -0,0 +1,71 @@
+# tests/test_dedup.py
+import re
+
+import pytest
+
+import dedup
+import flux_prompt_generator as fpg
+
+
+def shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    size = min(size, len(words))
+    return {tuple(words[start:start + size]) for start in range(len(words) - size + 1)}
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second)
+
+
+@pytest.fixture(scope="module")
+def texts():
+    """clip_l texts of a few random categories: about 25 shingles, many of them shared."""
+    kwargs = {"artist": "random", "photographer": "random", "device": "random", "digital_artform": "random"}
+    return fpg.PromptGenerator(1).generate_batch(range(600), **kwargs)[2]
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.8])
+def test_drops_only_exact_near_duplicates(texts, threshold):
+    duplicates = dedup.NearDuplicateFilter(threshold)
+    kept = []
+    for text in texts:
+        words = shingles(text)
+        closest = max((jaccard(words, other) for other in kept), default=0.0)
+        if duplicates.check(text):
+            assert closest >= threshold, text
+        else:
+            kept.append(words)
+    assert duplicates.num_hashes == 32 # Sized from the first text's shingles
+    if threshold == 0.5:
+        assert duplicates.dropped
+
+
+def test_band_keys_remember_several_prompts():
+    # One-row bands: prompts that share a shingle minimum share a band key
+    duplicates = dedup.NearDuplicateFilter(0.8, num_hashes=16, rows_per_band=1)
+    texts = [f"a quiet harbor at dawn with {boat} boats" for boat in ("red", "blue", "green", "yellow")]
+    assert not any(map(duplicates.check, texts))
+    assert max(map(len, duplicates._generations[0][0].values())) > 1
+    assert all(map(duplicates.check, texts)) # The first is not forgotten by the later ones
+
+
+def test_window_forgets_old_prompts():
+    duplicates = dedup.NearDuplicateFilter(0.8, window=4)
+    assert not duplicates.check("the first prompt of the run")
+    for number in range(4):
+        duplicates.check(f"filler prompt number {number} " * 3 + str(number))
+    assert not duplicates.check("the first prompt of the run")
+    assert duplicates.check("the first prompt of the run")
+
+
+def test_runs_are_deterministic(texts):
+    runs = [list(dedup.NearDuplicateFilter(0.6).filter(texts)) for _ in range(2)]
+    assert runs[0] == runs[1] and len(runs[0]) < len(texts)
+
+
+def test_sizes():
+    assert [dedup.scaled_num_hashes(count) for count in (1, 24, 25, 60, 110, 1000)] == [16, 16, 32, 64, 128, 128]
+    with pytest.raises(ValueError):
+        dedup.NearDuplicateFilter(0.8, num_hashes=48)
+    with pytest.raises(ValueError):
+        dedup.NearDuplicateFilter(0.8, num_hashes=16, rows_per_band=3)
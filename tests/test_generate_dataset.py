@@ -0,0 +1,71 @@
+# tests/test_generate_dataset.py
+import csv
+import json
+
+import pytest
+
+import coverage_stats
+import generate_dataset
+import sharded
+
+OPTIONS = ["--artist", "random", "--lighting", "random", "--clothing", "random", "--quiet"]
+INPUTS = dict(generate_dataset.category_arguments(), artist="random", lighting="random", clothing="random")
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_jsonl_rows_are_the_generator_prompts(tmp_path):
+    path = tmp_path / "prompts.jsonl"
+    generate_dataset.main(["--count", "25", "--start-seed", "40", "--output", str(path), "--flush-size", "7"] + OPTIONS)
+    rows = read_jsonl(path)
+    prompts, t5xxl, clip_l, clip_g, seeds = sharded.make_generator("python", 40).generate_batch(range(40, 65), **INPUTS)
+    assert rows == [dict(zip(generate_dataset.COLUMNS, row)) for row in zip(seeds, prompts, t5xxl, clip_l, clip_g)]
+
+
+def test_csv_and_part_files(tmp_path):
+    generate_dataset.main(["--count", "10", "--output", str(tmp_path / "all.csv")] + OPTIONS)
+    with open(tmp_path / "all.csv", encoding="utf-8", newline="") as file:
+        table = list(csv.reader(file))
+    assert table[0] == list(generate_dataset.COLUMNS) and len(table) == 11
+
+    generate_dataset.main(["--count", "10", "--rows-per-file", "4", "--output", str(tmp_path / "part-{part}.jsonl")] + OPTIONS)
+    parts = [read_jsonl(tmp_path / f"part-{part}.jsonl") for part in range(3)]
+    assert [len(rows) for rows in parts] == [4, 4, 2]
+    assert [row["t5xxl"] for rows in parts for row in rows] == [row[2] for row in table[1:]]
+
+
+def test_strict_rejects_unknown_values(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        generate_dataset.main(["--count", "1", "--output", str(tmp_path / "x.jsonl"), "--artist", "Alan Leee", "--strict"])
+    assert exit_info.value.code == 2
+    assert "did you mean 'Alan Lee'" in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        generate_dataset.main(["--count", "1", "--rows-per-file", "5"]) # No {part} field
+
+
+def test_dedup_resample_still_writes_count_rows(tmp_path, capsys):
+    path = tmp_path / "prompts.jsonl"
+    # Two categories only: many rows share most of their words
+    generate_dataset.main(["--count", "40", "--output", str(path), "--artform", "random", "--photo-type", "random",
+                           "--dedup", "0.5", "--dedup-mode", "resample", "--dedup-column", "t5xxl"])
+    rows = read_jsonl(path)
+    assert len(rows) == 40 and len({row["t5xxl"] for row in rows}) == 40
+    assert "near-duplicates" in capsys.readouterr().err
+
+
+def test_stats_count_only_the_rows_kept_by_dedup(tmp_path):
+    path, stats_path = tmp_path / "prompts.jsonl", tmp_path / "stats.json"
+    generate_dataset.main(["--count", "200", "--output", str(path), "--age-group", "random", "--default-tags", "random",
+                           "--dedup", "0.3", "--dedup-mode", "resample", "--stats", str(stats_path), "--quiet"])
+    rows = read_jsonl(path)
+    assert 0 < len(rows) < 200
+    # Same report as generating only the kept seeds
+    stats = coverage_stats.CoverageStats()
+    inputs = dict(generate_dataset.category_arguments(), age_group="random", default_tags="random")
+    sharded.make_generator("python", 0, stats=stats).generate_batch([row["seed"] for row in rows], **inputs)
+    report = json.loads(stats_path.read_text(encoding="utf-8"))
+    assert report["prompts"] == len(rows)
+    assert report == json.loads(json.dumps(stats.report(generate_dataset.fpg.VOCABULARY)))
@@ -0,0 +1,52 @@
+# tests/test_hot_reload.py
+import json
+
+import flux_prompt_generator as fpg
+
+INPUTS = {"seed": 9, "custom": "", "subject": "", "artist": "random", "lighting": "random"}
+
+
+def write(data_dir, file_name, data):
+    (data_dir / file_name).write_text(json.dumps(data), encoding="utf-8")
+
+
+def test_only_edited_categories_are_reloaded(data_dir):
+    registry = fpg.VOCABULARY
+    artists, lighting = registry["artist"], registry["lighting"]
+    assert registry.check_for_changes() == set()
+    write(data_dir, "artist.json", ["Only Artist"])
+    write(data_dir, "place.json", ["only place"]) # Not loaded yet: nothing to re-parse
+    generation = registry.generation
+    assert registry.check_for_changes() == {"artist"}
+    assert registry.generation == generation + 1
+    assert registry["artist"] == ["Only Artist"] and registry["artist"] is not artists
+    assert registry["lighting"] is lighting
+    assert registry["place"] == ["only place"]
+    assert registry.check_for_changes() == set()
+
+
+def test_node_picks_up_edited_files(data_dir):
+    node = fpg.FluxPromptGenerator()
+    fingerprint = node.IS_CHANGED(**INPUTS)
+    first = node.execute(**INPUTS)
+    write(data_dir, "artist.json", ["Only Artist"])
+    assert node.IS_CHANGED(**INPUTS) != fingerprint # Checks for changes, as ComfyUI does before every run
+    second = node.execute(**INPUTS)
+    assert second[2].endswith("by Only Artist") and "Only Artist" not in first[2]
+
+
+def test_weights_file_edits_reload_its_categories(data_dir):
+    registry = fpg.VOCABULARY
+    assert registry.weights("eye_colors") is None
+    write(data_dir, "weights.json", {"eye_colors": {"blue": 5}})
+    assert registry.check_for_changes() == {"eye_colors"}
+    assert max(registry.weights("eye_colors")) == 5.0 and registry.alias_table("eye_colors") is not None
+
+
+def test_reload_can_be_turned_off(data_dir):
+    registry = fpg.VOCABULARY
+    registry["artist"]
+    registry.reload_interval = None
+    write(data_dir, "artist.json", ["Only Artist"])
+    assert registry.check_for_changes() == set() and registry["artist"] != ["Only Artist"]
+    assert registry.reload() == {"artist"} # An explicit reload still works
@@ -0,0 +1,64 @@
+# tests/test_incremental.py
+import os
+
+import pytest
+
+import flux_prompt_generator as fpg
+
+EXAMPLE_RULES = os.path.join(os.path.dirname(fpg.__file__), "data", "rules.example.json")
+BASE = {"artform": "random", "photo_type": "random", "default_tags": "random", "lighting": "random", "clothing": "random",
+        "face_features": "random", "eye_colors": "random", "ethnicity": "random", "age_group": "random", "device": "random"}
+CHANGES = [
+    {"lighting": "disabled"},
+    {"lighting": "random", "clothing": "disabled"},
+    {"artform": "photography"},
+    {"subject": "a lighthouse keeper"},
+    {"default_tags": "disabled", "hairstyles": "random"},
+]
+
+
+@pytest.fixture
+def example_rules():
+    rules_path = fpg.VOCABULARY.rules_path
+    fpg.VOCABULARY.use_rules(EXAMPLE_RULES)
+    yield
+    fpg.VOCABULARY.use_rules(rules_path)
+
+
+def update(generator, seed, change):
+    """regenerate from BASE to BASE with change, and whether it was incremental."""
+    _, state = generator.regenerate(None, seed, **BASE)
+    updates = []
+    incremental_update = generator._update
+
+    def counted(*args):
+        updates.append(args)
+        return incremental_update(*args)
+
+    generator._update = counted
+    prompt, _ = generator.regenerate(state, seed, **dict(BASE, **change))
+    return prompt, state, bool(updates)
+
+
+@pytest.mark.parametrize("change", CHANGES)
+def test_counter_mode_matches_a_full_generation(change):
+    for seed in range(20):
+        prompt, _, incremental = update(fpg.PromptGenerator(seed, rng_mode="counter"), seed, change)
+        assert incremental
+        assert prompt == fpg.PromptGenerator(seed, rng_mode="counter").generate_prompt(seed, **dict(BASE, **change))
+
+
+def test_other_outputs_are_kept(example_rules):
+    # lighting is in clip_g only, and no rule names it: the rules leave the update incremental
+    for seed in range(20):
+        prompt, state, incremental = update(fpg.PromptGenerator(seed), seed, {"lighting": "disabled"})
+        assert incremental
+        assert prompt[2:4] == state.outputs[:2] and prompt[4] != state.outputs[2]
+
+
+@pytest.mark.parametrize("change", [{"lighting": "disabled"}, {"age_group": "child"}, {"clothing": "disabled"}])
+def test_rules_with_counter_mode_match_a_full_generation(example_rules, change):
+    for seed in range(20):
+        prompt, _, incremental = update(fpg.PromptGenerator(seed, rng_mode="counter"), seed, change)
+        assert incremental == ("lighting" in change) # age_group and clothing are named by the rules
+        assert prompt == fpg.PromptGenerator(seed, rng_mode="counter").generate_prompt(seed, **dict(BASE, **change))
@@ -0,0 +1,64 @@
+# tests/test_instrumentation.py
+import json
+
+import pytest
+
+import flux_prompt_generator as fpg
+import generate_dataset
+import instrumentation
+
+INPUTS = {"artist": "random", "lighting": "random", "clothing": "random"}
+
+
+def test_stages_are_timed_and_sized():
+    metrics = instrumentation.Metrics()
+    generator = fpg.PromptGenerator(5, metrics=metrics)
+    prompt = generator.generate_prompt(5, **INPUTS)
+    assert prompt == fpg.PromptGenerator(5).generate_prompt(5, **INPUTS)
+    stages = metrics.snapshot()["stages"]
+    assert {"generate_prompt", "sampling", "assembly", "clean"} <= set(stages)
+    assert stages["sampling"]["count"] == 1 and stages["sampling"]["size"] == 0
+    assert stages["generate_prompt"]["size"] == instrumentation.text_size(prompt)
+    for counters in stages.values():
+        assert sum(counters["buckets"]) == counters["count"]
+        assert 0 <= counters["max_seconds"] <= counters["seconds"]
+
+
+def test_uninstrumented_generators_run_the_plain_methods():
+    generator = fpg.PromptGenerator(5)
+    assert "generate_prompt" not in vars(generator)
+    assert "generate_prompt" in vars(fpg.PromptGenerator(5, metrics=instrumentation.Metrics()))
+
+
+def test_flush_and_merge():
+    metrics = instrumentation.Metrics()
+    metrics.record("stage", 0.002, 10)
+    metrics.record("stage", 0.004, 5)
+    sink = instrumentation.HistogramSink()
+    snapshot = metrics.flush(sink, reset=True)
+    assert metrics.snapshot()["stages"] == {}
+    sink.emit(snapshot)
+    total = sink.total["stages"]["stage"]
+    assert total["count"] == 4 and total["size"] == 30
+    assert total["mean_seconds"] == pytest.approx(0.003)
+
+
+def test_sinks_write_json_and_prometheus(tmp_path):
+    metrics = instrumentation.Metrics()
+    metrics.record('say "hi"', 0.5, 7)
+    json_path, prometheus_path = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    metrics.flush(instrumentation.JSONSink(str(json_path)))
+    assert json.loads(json_path.read_text(encoding="utf-8")) == metrics.snapshot()
+    metrics.flush(instrumentation.PrometheusSink(str(prometheus_path)))
+    text = prometheus_path.read_text(encoding="utf-8")
+    assert 'flux_prompt_stage_seconds_bucket{stage="say \\"hi\\"",le="0.5"} 1' in text
+    assert 'flux_prompt_stage_seconds_count{stage="say \\"hi\\""} 1' in text
+    assert 'flux_prompt_stage_chars_total{stage="say \\"hi\\""} 7' in text
+
+
+def test_cli_metrics(tmp_path):
+    path = tmp_path / "metrics.json"
+    generate_dataset.main(["--count", "20", "--output", str(tmp_path / "prompts.jsonl"), "--artist", "random",
+                           "--metrics", str(path), "--quiet"])
+    stages = json.loads(path.read_text(encoding="utf-8"))["stages"]
+    assert stages["sampling"]["count"] == 20
@@ -0,0 +1,65 @@
+# tests/test_lookup.py
+import pytest
+
+import flux_prompt_generator as fpg
+from lookup import CategoryIndex, normalize
+
+ENTRIES = ["Soft lighting", "Golden hour", "beach, at sunset", "beach", "calm sea, overcast sky, sandy beach", "Neon"]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return CategoryIndex(ENTRIES)
+
+
+def test_normalize():
+    assert normalize("  Soft\tLIGHTING ") == "soft lighting"
+    assert normalize("beach ,at   sunset") == "beach, at sunset"
+
+
+def test_lookup_ignores_case_and_spacing(index):
+    assert index.lookup("soft  LIGHTING") == "Soft lighting"
+    assert index.lookup("Beach,at sunset") == "beach, at sunset"
+    assert index.lookup("sunset") is None
+    assert "golden HOUR" in index and "sunrise" not in index
+    assert len(index) == len(ENTRIES)
+
+
+def test_resolve_keeps_entries_with_commas_whole(index):
+    assert index.resolve("beach, at sunset") == (["beach, at sunset"], [])
+    assert index.resolve("Calm sea,overcast sky , sandy beach") == (["calm sea, overcast sky, sandy beach"], [])
+
+
+def test_resolve_prefers_the_longest_match(index):
+    assert index.resolve("beach, at sunset, neon") == (["beach, at sunset", "Neon"], [])
+    assert index.resolve("beach, neon") == (["beach", "Neon"], [])
+
+
+def test_resolve_keeps_unknown_items_as_typed(index):
+    assert index.resolve("neon, Moonlight , golden hour") == (["Neon", "Moonlight", "Golden hour"], ["Moonlight"])
+    assert index.resolve("neon,,") == (["Neon", "", ""], [])
+
+
+def test_complete(index):
+    assert index.complete("BEA") == ["beach", "beach, at sunset"]
+    assert index.complete("beach", limit=1) == ["beach"]
+    assert index.complete("x") == []
+
+
+def test_suggest(index):
+    assert index.suggest("Neon") == [("Neon", 1.0)]
+    assert index.suggest("sof lightning")[0][0] == "Soft lighting"
+    assert index.suggest("zzzz") == []
+
+
+def test_validate_inputs_reports_typos_only():
+    problems = fpg.validate_inputs({"artist": "Alan Leee, alex  GREY", "eye_colors": "Violet", "lighting": "random",
+                                    "clothing": "disabled", "custom": "anything"})
+    assert problems == {"artist": [("Alan Leee", ["Alan Lee"])]}
+
+
+def test_generation_uses_the_canonical_entry():
+    generator = fpg.PromptGenerator(1)
+    for seed in range(10):
+        assert generator.generate_prompt(seed, artist="alan  LEE")[3].endswith("by Alan Lee")
+        assert generator.generate_prompt(seed, artist="Alan Lee, alex grey")[3].endswith(("by Alan Lee", "by Alex Grey"))
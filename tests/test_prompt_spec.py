@@ -0,0 +1,33 @@
+# tests/test_prompt_spec.py
+import pytest
+
+import flux_prompt_generator as fpg
+
+INPUTS = {"artist": "random", "lighting": "random", "eye_colors": "blue, green", "custom": "a {red|blue} sky"}
+
+
+def test_equal_kwargs_give_the_cached_spec():
+    spec = fpg.PromptSpec.compile(INPUTS)
+    assert fpg.PromptSpec.compile(dict(reversed(list(INPUTS.items())))) is spec # Key order does not matter
+    assert fpg.PromptSpec.compile(dict(INPUTS, seed=3, debug="text")) is spec # Non-category inputs are ignored
+    assert fpg.PromptSpec.compile(dict(INPUTS, artist="disabled")) is not spec
+
+
+def test_specs_are_immutable():
+    spec = fpg.PromptSpec.compile(INPUTS)
+    category = spec.categories["eye_colors"]
+    with pytest.raises(AttributeError):
+        spec.custom = "changed"
+    with pytest.raises(AttributeError):
+        category.mode = "disabled"
+    with pytest.raises(TypeError):
+        spec.categories["eye_colors"] = category # A read-only mapping
+    assert spec.custom == "a {red|blue} sky" and category.mode == "list"
+
+
+def test_specs_are_hashable_dict_keys():
+    spec = fpg.PromptSpec.compile(INPUTS)
+    category = spec.categories["artist"]
+    counts = {spec: 1, category: 2}
+    assert counts[fpg.PromptSpec.compile(dict(INPUTS))] == 1 and counts[category] == 2
+    assert hash(spec) == hash(fpg.PromptSpec.compile(INPUTS))
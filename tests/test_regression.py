@@ -0,0 +1,103 @@
+# tests/test_regression.py
+"""Regression corpus: node configs and seeds with the prompts the original generator made for them.
+
+tests/data/regression_corpus.jsonl.gz was written by the baseline generator
+(the code before the segment assembler and the single-pass cleaner) with
+
+    python tests/test_regression.py <path of a checkout of the baseline>
+
+Every row is one config and seed, and the (original, t5xxl, clip_l, clip_g)
+strings it produced. The current generator must still produce exactly these
+strings, through the segment assembler as well as through legacy_assembly.
+Fixed values that contain commas are left out: those are resolved as whole
+entries now (see lookup.py), which intentionally changed their output.
+The baseline had no rules, and rules are opt-in (data/rules.json is not
+shipped), so the default generator is compared as it is.
+"""
+import gzip
+import json
+import os
+import random
+import sys
+
+import pytest
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "regression_corpus.jsonl.gz")
+CORPUS_SIZE = 2015
+CORPUS_SEED = 5
+# Category inputs the baseline node had, in its order
+CATEGORY_INPUTS = (
+    "default_tags", "body_types", "artform", "photography_styles", "digital_artform", "artist", "photographer",
+    "roles", "hairstyles", "hair_color", "additional_details", "lighting", "clothing", "composition", "pose",
+    "background", "place", "age_group", "ethnicity", "accessories", "expression", "face_features", "eye_colors",
+    "skin_tone", "facial_hair", "body_markings", "makeup_styles", "tattoos_scars", "photo_type", "device",
+)
+SUBJECTS = ("", "woman", "a cat", "random", "disabled", "an old (fisherman) ", "Robot")
+CUSTOM_TEXTS = ("", "masterpiece, best quality", " , ,test.. ", "Hello. World", "as as with with, ,.", "A  B\tC")
+
+
+def corpus_configs(lists):
+    """(seed, kwargs) of every corpus row; lists maps a category to its entries."""
+    rng = random.Random(CORPUS_SEED)
+    for _ in range(CORPUS_SIZE):
+        kwargs = {}
+        for category in CATEGORY_INPUTS:
+            entries = [entry for entry in lists[category] if "," not in entry]
+            roll = rng.random()
+            if roll < 0.3:
+                kwargs[category] = "disabled"
+            elif roll < 0.8 or len(entries) < 2:
+                kwargs[category] = "random"
+            elif roll < 0.95:
+                kwargs[category] = rng.choice(entries)
+            else:
+                kwargs[category] = ", ".join(rng.sample(entries, 2))
+        if rng.random() < 0.4:
+            kwargs["subject"] = rng.choice(SUBJECTS)
+        if rng.random() < 0.4:
+            kwargs["custom"] = rng.choice(CUSTOM_TEXTS)
+        yield rng.randint(0, 30000), kwargs
+
+
+def load_corpus():
+    with gzip.open(CORPUS, "rt", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_corpus_rows_match_configs():
+    import flux_prompt_generator as fpg
+    rows = load_corpus()
+    assert len(rows) == CORPUS_SIZE
+    assert [(row["seed"], row["inputs"]) for row in rows] == list(corpus_configs(fpg.VOCABULARY))
+
+
+def test_prompts_match_corpus():
+    import flux_prompt_generator as fpg
+    for row in load_corpus():
+        for legacy_assembly in (False, True):
+            generator = fpg.PromptGenerator(row["seed"], legacy_assembly=legacy_assembly, debug="off")
+            result = generator.generate_prompt(row["seed"], **row["inputs"])
+            assert [result[0]] + list(result[2:5]) == row["expected"], (row["seed"], row["inputs"], legacy_assembly)
+
+
+def test_batch_matches_corpus():
+    import flux_prompt_generator as fpg
+    for row in load_corpus()[:200]:
+        prompts, t5xxl, clip_l, clip_g, _ = fpg.PromptGenerator(debug="off").generate_batch([row["seed"]], **row["inputs"])
+        assert [t5xxl[0], clip_l[0], clip_g[0]] == row["expected"][1:]
+
+
+def write_corpus(tree):
+    """Writes the corpus with the generator of the checkout at tree."""
+    sys.path.insert(0, tree)
+    import flux_prompt_generator as fpg
+    lists = {category: getattr(fpg, category.upper()) for category in CATEGORY_INPUTS}
+    with gzip.open(CORPUS, "wt", encoding="utf-8", newline="\n") as file:
+        for seed, kwargs in corpus_configs(lists):
+            result = fpg.PromptGenerator(seed).generate_prompt(seed, **kwargs)
+            row = {"seed": seed, "inputs": kwargs, "expected": [result[0]] + list(result[2:5])}
+            file.write(json.dumps(row, ensure_ascii=False, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    write_corpus(sys.argv[1])
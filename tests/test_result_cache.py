@@ -0,0 +1,61 @@
+# tests/test_result_cache.py
+import pytest
+
+import flux_prompt_generator as fpg
+
+INPUTS = {"seed": 11, "custom": "", "subject": "", "artist": "random", "lighting": "random"}
+
+
+@pytest.fixture
+def cache():
+    fpg.RESULT_CACHE.clear()
+    yield fpg.RESULT_CACHE
+    fpg.RESULT_CACHE.clear()
+
+
+def test_fingerprint_is_independent_of_order_and_hidden_inputs():
+    reordered = dict(reversed(list(INPUTS.items())))
+    assert fpg.input_fingerprint(INPUTS) == fpg.input_fingerprint(reordered)
+    assert fpg.input_fingerprint(INPUTS) == fpg.input_fingerprint(dict(INPUTS, prompt={"1": {}}, unique_id="7"))
+    assert fpg.input_fingerprint(INPUTS) != fpg.input_fingerprint(dict(INPUTS, seed=12))
+    assert fpg.input_fingerprint(INPUTS) != fpg.input_fingerprint(dict(INPUTS, artist="disabled"))
+
+
+def test_is_changed_follows_inputs_debug_output_and_vocabulary():
+    node = fpg.FluxPromptGenerator
+    fingerprint = node.IS_CHANGED(**INPUTS)
+    assert node.IS_CHANGED(**INPUTS) == fingerprint
+    assert node.IS_CHANGED(**dict(INPUTS, seed=12)) != fingerprint
+    # Called from Python every output counts as read, as when another node of the workflow reads debug_info (output 5)
+    workflow = {"1": {"inputs": {}}, "2": {"inputs": {"text": ["1", 5]}}}
+    assert node.IS_CHANGED(**dict(INPUTS, prompt=workflow, unique_id="1")) == fingerprint
+    assert node.IS_CHANGED(**dict(INPUTS, prompt={"1": {"inputs": {}}}, unique_id="1")) != fingerprint
+    rules_path = fpg.VOCABULARY.rules_path
+    fpg.VOCABULARY.use_rules(rules_path) # Bumps the vocabulary generation, as a reload does
+    assert node.IS_CHANGED(**INPUTS) != fingerprint
+
+
+def test_execute_reuses_finished_results(cache):
+    node = fpg.FluxPromptGenerator()
+    first = node.execute(**INPUTS)
+    hits = cache.hits
+    assert node.execute(**INPUTS) == first and cache.hits == hits + 1
+    assert node.execute(**dict(INPUTS, seed=12)) != first
+    fpg.VOCABULARY.use_rules(fpg.VOCABULARY.rules_path) # A reload empties the cache
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(fpg.time, "monotonic", lambda: now[0])
+    cache = fpg.ResultCache(max_size=2, ttl=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1 # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("c") == 3 and cache.evictions == 1
+    now[0] += 11
+    assert cache.get("a") is None and cache.expirations == 1
+    cache.configure(max_size=0)
+    cache.put("d", 4)
+    assert cache.get("d") is None
@@ -0,0 +1,195 @@
+# tests/test_rules.py
+import json
+import os
+
+import pytest
+
+import flux_prompt_generator as fpg
+
+EXAMPLE_RULES = os.path.join(os.path.dirname(fpg.__file__), "data", "rules.example.json")
+MINORS = ("infant", "toddler", "child", "preteen")
+# Bans the combination space cannot all hold: roles heads age_group, clothing and lighting,
+# which leaves age_group x clothing (too large to list) to the walk and default_tags x body_types to a table
+CROSSED_RULES = {
+    "exclude": [
+        {"if": {"age_group": ["child", "toddler"]}, "not": {"clothing": ["*"], "roles": ["as a (soldier)"]}},
+        {"if": {"roles": ["as a (soldier)", "as a (cowboy)"]}, "not": {"clothing": ["a shimmering sequin dress"], "lighting": ["*"]}},
+        {"if": {"default_tags": ["a man"]}, "not": {"body_types": ["buxom"]}},
+    ],
+}
+
+
+def broken_pairs(spec, choices):
+    """(category, entry, category, entry) of every pair of drawn values that the rules ban."""
+    parts = {name: value.split(", ") if spec.categories[name].count_range else [value]
+             for name, value in choices.items() if name in spec.categories and value}
+    if choices.get("makeup_styles"):
+        parts.pop("facial_hair", None) # Hidden by the makeup
+    broken = []
+    for name, values in parts.items():
+        if spec.categories[name].mode not in ("random", "multiple"):
+            continue
+        for other, other_values in parts.items():
+            for value in values:
+                excluded = spec.rules.banned_entries(name, value).get(other, ())
+                broken.extend((name, value, other, other_value) for other_value in other_values if other_value in excluded)
+    return broken
+
+
+@pytest.fixture(autouse=True)
+def example_rules():
+    rules_path = fpg.VOCABULARY.rules_path
+    fpg.VOCABULARY.use_rules(EXAMPLE_RULES)
+    yield
+    fpg.VOCABULARY.use_rules(rules_path)
+
+
+@pytest.fixture
+def crossed_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(CROSSED_RULES), encoding="utf-8")
+    rules_path = fpg.VOCABULARY.rules_path
+    fpg.VOCABULARY.use_rules(str(path))
+    yield
+    fpg.VOCABULARY.use_rules(rules_path)
+
+
+def test_rules_are_opt_in():
+    assert not os.path.exists(os.path.join(os.path.dirname(fpg.__file__), "data", "rules.json"))
+
+
+def test_example_rules_load_cleanly(capsys):
+    rule_set = fpg.VOCABULARY.rules()
+    assert rule_set is not None and rule_set.rule_count > 0
+    assert capsys.readouterr().out == "" # Every entry the rules name exists
+    for age_group in MINORS:
+        banned = rule_set.banned_entries("age_group", age_group)
+        assert "as a (soldier)" in banned["roles"]
+        # Bans name entries, so a minor can still be clothed and still has a default tag
+        assert 0 < len(banned["clothing"]) < len(fpg.VOCABULARY["clothing"])
+        assert 0 < len(banned["default_tags"]) < len(fpg.VOCABULARY["default_tags"])
+
+
+def test_minors_keep_a_subject_and_can_be_drawn():
+    generator = fpg.PromptGenerator(0)
+    for seed in range(50):
+        prompt = generator.generate_prompt(seed, artform="photography", default_tags="random", age_group="child")[2]
+        assert "child" in prompt and not prompt.rstrip(", ").endswith(" of")
+        assert " of " in prompt.split(",")[0] and " young " in prompt
+    spec = fpg.PromptSpec.compile({"age_group": "random", "clothing": "random"})
+    ages = set()
+    for seed in range(2000):
+        generator._reseed(seed)
+        ages.add(generator._draw_choices(spec)["age_group"])
+    assert ages & set(MINORS)
+
+
+@pytest.mark.parametrize("rng_mode", ["legacy", "counter", "unique"])
+@pytest.mark.parametrize("kwargs", [{}, {"subject": "a person"}, {"age_group": "child"}])
+def test_engines_keep_the_rules(rng_mode, kwargs):
+    generator = fpg.PromptGenerator(3, rng_mode=rng_mode)
+    spec = fpg.PromptSpec.compile(kwargs)
+    for seed in range(300):
+        generator._reseed(seed)
+        assert broken_pairs(spec, generator._draw_choices(spec)) == []
+
+
+def test_user_values_are_kept():
+    prompt = fpg.PromptGenerator(1, rng_mode="unique").generate_prompt(4, age_group="child", roles="as a (soldier)")[2]
+    assert "child" in prompt and "soldier" in prompt
+
+
+def test_connector_follows_the_drawn_default_tag(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"exclude": [{"if": {"age_group": ["child"]}, "not": {"default_tags": ["*"]}}]}), encoding="utf-8")
+    fpg.VOCABULARY.use_rules(str(path))
+    prompt = fpg.PromptGenerator(0).generate_prompt(1, artform="photography", default_tags="random", age_group="child")[2]
+    assert prompt.startswith("A ") and " photography of " not in prompt # No "of" without a subject
+
+
+def test_unique_mode_builds_the_rules_into_the_space():
+    assert fpg.CombinationSpace(fpg.PromptSpec.compile({})).rule_checks == ()
+    # A child gets fewer combinations, none of them with banned clothing
+    generator = fpg.PromptGenerator(0, rng_mode="unique")
+    child = fpg.PromptSpec.compile({"age_group": "child"})
+    assert generator.count_combinations(age_group="child") < generator.count_combinations(age_group="adult")
+    banned = fpg.VOCABULARY.rules().banned_entries("age_group", "child")["clothing"]
+    for seed in range(100):
+        generator._reseed(seed)
+        assert generator._draw_choices(child)["clothing"] not in banned
+
+
+def test_unique_mode_walks_past_rules_outside_the_space(crossed_rules):
+    spec = fpg.PromptSpec.compile({})
+    assert fpg.CombinationSpace(spec).rule_checks == (("age_group", "clothing"),)
+    generator = fpg.PromptGenerator(5, rng_mode="unique")
+    seen = set()
+    for seed in range(500):
+        generator._reseed(seed)
+        choices = generator._draw_choices(spec)
+        assert broken_pairs(spec, choices) == []
+        seen.add(tuple(sorted(choices.items())))
+    assert len(seen) == 500
+
+
+@pytest.fixture
+def chained_rules(tmp_path):
+    """age_group -> default_tags -> eye_colors -> age_group, and inputs where only those three are drawn."""
+    age_groups, default_tags, eye_colors = (fpg.VOCABULARY[name] for name in ("age_group", "default_tags", "eye_colors"))
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"exclude": [
+        {"if": {"age_group": age_groups[:3]}, "not": {"default_tags": default_tags[:4]}},
+        {"if": {"default_tags": default_tags[:5]}, "not": {"eye_colors": eye_colors[:6]}},
+        {"if": {"eye_colors": eye_colors[:4]}, "not": {"age_group": age_groups[2:6]}},
+    ]}), encoding="utf-8")
+    rules_path = fpg.VOCABULARY.rules_path
+    fpg.VOCABULARY.use_rules(str(path))
+    yield dict({category: "disabled" for category in fpg.vocabulary.CATEGORIES},
+               age_group="random", default_tags="random", eye_colors="random")
+    fpg.VOCABULARY.use_rules(rules_path)
+
+
+def test_unique_mode_walks_a_ruled_space_without_repeats(chained_rules):
+    spec = fpg.PromptSpec.compile(chained_rules)
+    assert fpg.CombinationSpace(spec).rule_checks == ()
+    # Count the allowed combinations by hand
+    allowed = sum(not broken_pairs(spec, {"age_group": age_group, "default_tags": default_tag, "eye_colors": eye_color})
+                  for age_group in fpg.VOCABULARY["age_group"] for default_tag in fpg.VOCABULARY["default_tags"]
+                  for eye_color in fpg.VOCABULARY["eye_colors"])
+    generator = fpg.PromptGenerator(5, rng_mode="unique")
+    assert generator.count_combinations(**chained_rules) == allowed
+    seen = set()
+    for seed in range(allowed):
+        generator._reseed(seed)
+        choices = generator._draw_choices(spec)
+        assert broken_pairs(spec, choices) == []
+        seen.add(tuple(sorted(choices.items())))
+    assert len(seen) == allowed
+
+
+def test_unique_mode_draws_when_the_walk_finds_no_allowed_combination(chained_rules, monkeypatch):
+    monkeypatch.setattr(fpg, "RULE_TABLE_LIMIT", 1) # Leave every ban to the walk
+    monkeypatch.setattr(fpg, "RULE_WALK_LIMIT", 1) # Draw as soon as a position is banned
+    spec = fpg.PromptSpec.compile(chained_rules)
+    assert fpg.CombinationSpace(spec).rule_checks != ()
+    generator = fpg.PromptGenerator(5, rng_mode="unique")
+    for seed in range(300):
+        generator._reseed(seed)
+        assert broken_pairs(spec, generator._draw_choices(spec)) == []
+
+
+def test_numpy_engine_keeps_the_rules():
+    pytest.importorskip("numpy")
+    import vectorized_sampler
+    generator = vectorized_sampler.VectorizedPromptGenerator(3)
+    for kwargs in ({}, {"subject": "a person"}, {"age_group": "child"}):
+        spec = fpg.PromptSpec.compile(kwargs)
+        columns = generator.resolve_columns(generator.draw_matrix(100, 300), spec)
+        generator.apply_rules(columns, spec, 100)
+        for row in range(300):
+            choices = {name: columns[name][row] for name in vectorized_sampler._drawn_categories(columns, row, spec.has_subject)}
+            assert broken_pairs(spec, choices) == []
+    # Rows depend on (seed, index) only, with the redraws too
+    whole = generator.generate_batch(range(40), age_group="random")
+    parts = [generator.generate_batch(seeds, age_group="random") for seeds in (range(17), range(17, 40))]
+    assert whole[1] == parts[0][1] + parts[1][1]
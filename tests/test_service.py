@@ -0,0 +1,86 @@
+# tests/test_service.py
+import asyncio
+import socket
+import threading
+
+import pytest
+
+import flux_prompt_generator as fpg
+import service
+
+INPUTS = {"artist": "random", "lighting": "random"}
+
+
+def run_with_service(check, **options):
+    """Runs check(service, url) in a thread while a PromptService serves on a free port."""
+    async def main():
+        prompt_service = service.PromptService(**options)
+        server = await asyncio.start_server(prompt_service.handle_connection, "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        async with server:
+            return await asyncio.get_running_loop().run_in_executor(None, check, prompt_service, url)
+
+    return asyncio.run(main())
+
+
+def test_batch_streams_every_row():
+    def check(prompt_service, url):
+        client = service.ServiceClient(url)
+        rows = list(client.iter_batch(10, 25, **INPUTS))
+        assert [row["seed"] for row in rows] == list(range(10, 35))
+        assert rows[3] == client.generate(13, **INPUTS)
+
+    run_with_service(check, chunk_size=10)
+
+
+def test_batch_failure_after_the_header_cuts_the_stream():
+    def check(prompt_service, url):
+        rows_of = prompt_service._rows
+
+        async def failing_rows(rng_mode, config, seeds):
+            if seeds[0] >= 10:
+                raise KeyError("boom")
+            return await rows_of(rng_mode, config, seeds)
+
+        prompt_service._rows = failing_rows
+        client = service.ServiceClient(url)
+        rows = []
+        with pytest.raises(RuntimeError, match="boom"):
+            for row in client.iter_batch(0, 30, **INPUTS):
+                rows.append(row)
+        assert len(rows) == 10
+        assert client.stats()["streamed_rows"] == 10 # A new connection works
+
+    run_with_service(check, chunk_size=10)
+
+
+def test_identical_requests_are_coalesced():
+    async def main():
+        prompt_service = service.PromptService(max_delay=0.05)
+        config = service.node_config(INPUTS)
+        rows = await asyncio.gather(*(prompt_service.generate(seed, config) for seed in (1, 2, 1, 1)))
+        return prompt_service.stats, rows
+
+    stats, rows = asyncio.run(main())
+    assert rows[0] == rows[2] == rows[3] != rows[1]
+    assert (stats["requests"], stats["coalesced"], stats["batches"], stats["rows"]) == (4, 2, 1, 2)
+
+
+def test_node_falls_back_on_a_malformed_response(monkeypatch, capsys):
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def answer_garbage():
+        for _ in range(2): # The client retries once on a fresh connection
+            connection, _ = listener.accept()
+            with connection:
+                connection.recv(65536)
+                connection.sendall(b"NOT HTTP\r\n\r\n")
+
+    thread = threading.Thread(target=answer_garbage, daemon=True)
+    thread.start()
+    monkeypatch.setattr(fpg, "SERVICE_URL", f"http://127.0.0.1:{listener.getsockname()[1]}")
+    monkeypatch.setattr(fpg, "_service_clients", threading.local())
+    with listener:
+        assert fpg._service_row(dict(INPUTS, seed=3)) is None
+    thread.join(5)
+    assert "generating locally" in capsys.readouterr().out
@@ -0,0 +1,37 @@
+# tests/test_sharded.py
+import json
+
+import pytest
+
+import generate_dataset
+import sharded
+
+INPUTS = {"artist": "random", "lighting": "random", "clothing": "random", "pose": "random"}
+SEEDS = range(1000, 1090)
+
+
+@pytest.mark.parametrize("engine", sharded.ENGINES)
+def test_sharded_rows_equal_a_single_process_run(engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    single = sharded.make_generator(engine, 7).generate_batch(SEEDS, **INPUTS)
+    merged = sharded.generate_batch_sharded(SEEDS, workers=3, shard_size=13, engine=engine, generator_seed=7, **INPUTS)
+    assert list(merged) == [list(column) for column in single]
+
+
+def test_cli_output_is_the_same_for_any_worker_count(tmp_path):
+    outputs = []
+    for workers in ("1", "2"):
+        path = tmp_path / f"workers-{workers}.jsonl"
+        generate_dataset.main(["--count", "60", "--start-seed", "5", "--workers", workers, "--shard-size", "11",
+                               "--output", str(path), "--artist", "random", "--place", "random", "--quiet"])
+        outputs.append(path.read_text(encoding="utf-8"))
+    assert outputs[0] == outputs[1] and len(outputs[0].splitlines()) == 60
+    assert [json.loads(line)["seed"] for line in outputs[0].splitlines()] == list(range(5, 65))
+
+
+def test_early_stop_leaves_no_work_behind():
+    rows = sharded.iter_sharded_rows(range(10000), INPUTS, workers=2, shard_size=50, max_pending=2)
+    first = [next(rows) for _ in range(3)]
+    rows.close() # Cancels the shards nobody will read
+    assert [row[0] for row in first] == [0, 1, 2]
@@ -0,0 +1,74 @@
+# tests/test_snapshot.py
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import vocabulary
+
+
+def make_registry(data_dir):
+    """A registry over data_dir whose loader records the files it parses."""
+    parsed = []
+
+    def load(file_name):
+        parsed.append(file_name)
+        with open(data_dir / file_name, encoding="utf-8") as file:
+            return json.load(file)
+
+    return vocabulary.VocabularyRegistry(str(data_dir), load), parsed
+
+
+@pytest.fixture
+def fresh_data_dir(data_dir):
+    """data_dir without a snapshot from an earlier registry."""
+    snapshot = data_dir / vocabulary.SNAPSHOT_FILE_NAME
+    if snapshot.exists():
+        snapshot.unlink()
+    return data_dir
+
+
+def test_import_parses_no_json():
+    code = ("import flux_prompt_generator as fpg, vocabulary\n"
+            "assert not any(fpg.VOCABULARY.is_loaded(category) for category in vocabulary.CATEGORIES)\n"
+            "assert fpg.EYE_COLORS is fpg.VOCABULARY['eye_colors']\n")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", code], cwd=root, check=True)
+
+
+def test_categories_are_parsed_on_first_access(fresh_data_dir):
+    registry, parsed = make_registry(fresh_data_dir)
+    assert parsed == []
+    registry["eye_colors"]
+    registry["eye_colors"]
+    assert parsed == ["eye_colors.json"]
+    assert [category for category in vocabulary.CATEGORIES if registry.is_loaded(category)] == ["eye_colors"]
+
+
+def test_current_snapshot_skips_the_loader(fresh_data_dir):
+    registry, _ = make_registry(fresh_data_dir)
+    lists = registry.load_all() # Writes the snapshot once every category is loaded
+    assert (fresh_data_dir / vocabulary.SNAPSHOT_FILE_NAME).exists()
+    cached, parsed = make_registry(fresh_data_dir)
+    assert cached.load_all() == lists
+    assert parsed == []
+
+
+@pytest.mark.parametrize("change", ["size", "crc32"])
+def test_edited_file_invalidates_the_snapshot(fresh_data_dir, change):
+    make_registry(fresh_data_dir)[0].load_all()
+    path = fresh_data_dir / "eye_colors.json"
+    text = path.read_text(encoding="utf-8")
+    if change == "size":
+        text += "\n"
+    else: # Same size, one letter changed
+        position = text.index("blue")
+        text = text[:position] + "glue" + text[position + 4:]
+    path.write_text(text, encoding="utf-8")
+    entries = vocabulary.split_weights(json.loads(text))[0]
+    registry, parsed = make_registry(fresh_data_dir)
+    assert registry["artist"]
+    assert parsed == ["artist.json"] # The snapshot is ignored, for unchanged files too
+    assert registry["eye_colors"] == entries
@@ -0,0 +1,99 @@
+# tests/test_templates.py
+import random
+
+import pytest
+
+import flux_prompt_generator as fpg
+import templates
+
+CATEGORIES = frozenset({"artist", "lighting"})
+LISTS = {"artist": (["Alan Lee", "Alex Grey"], None), "lighting": (["Backlit"], None)}
+
+
+def compile_template(text):
+    return templates.compile_template(text, CATEGORIES)
+
+
+@pytest.mark.parametrize("text", ["{a|b", "a}", "{a|{b}", "{}}", "x {y"])
+def test_unbalanced_braces_raise(text):
+    with pytest.raises(templates.TemplateError):
+        compile_template(text)
+
+
+def test_template_error_is_a_value_error():
+    assert issubclass(templates.TemplateError, ValueError)
+
+
+@pytest.mark.parametrize("text", ["plain text", "x | y", "__unknown__ stays", r"\{not\} a \| group"])
+def test_text_without_syntax_is_static(text):
+    assert not compile_template(text).dynamic
+
+
+def test_escapes_stand_for_the_character():
+    assert compile_template(r"\{a\|b\} \_\_artist\_\_").nodes == ("{a|b} __artist__",)
+
+
+def test_unknown_wildcards_are_kept_as_typed():
+    template = compile_template("__artist__ and __nope__")
+    assert template.categories == {"artist"}
+    assert template.expand(random.Random(0), LISTS) in ("Alan Lee and __nope__", "Alex Grey and __nope__")
+
+
+def test_nested_alternatives_expand_to_every_option():
+    template = compile_template("{a|{b|c}|}!")
+    seen = {template.expand(random.Random(seed), LISTS) for seed in range(200)}
+    assert seen == {"a!", "b!", "c!", "!"}
+
+
+def test_wildcards_inside_alternatives():
+    template = compile_template("{__lighting__|dark} by __artist__")
+    assert template.categories == {"artist", "lighting"}
+    seen = {template.expand(random.Random(seed), LISTS) for seed in range(200)}
+    assert seen == {f"{light} by {artist}" for light in ("Backlit", "dark") for artist in ("Alan Lee", "Alex Grey")}
+
+
+def test_expansion_is_deterministic_per_seed():
+    template = compile_template("{red|green|blue} {cat|dog} __artist__")
+    assert template.expand(random.Random(7), LISTS) == template.expand(random.Random(7), LISTS)
+
+
+def test_compiled_templates_are_cached():
+    assert compile_template("{a|b} c") is compile_template("{a|b} c")
+
+
+@pytest.mark.parametrize("rng_mode", ["legacy", "counter"])
+def test_generator_expands_templates(rng_mode):
+    kwargs = {"custom": "{red|blue} sky", "subject": "a portrait by __artist__", "lighting": "random"}
+    generator = fpg.PromptGenerator(4, rng_mode=rng_mode)
+    prompts, t5xxl = generator.generate_batch(range(60), **kwargs)[:2]
+    assert not any("{" in prompt or "__" in prompt for prompt in prompts)
+    assert {prompt.startswith("red sky") for prompt in prompts} == {True, False}
+    assert prompts == generator.generate_batch(range(60), **kwargs)[0]
+    assert t5xxl[7] == fpg.PromptGenerator(4, rng_mode=rng_mode).generate_prompt(7, **kwargs)[2]
+
+
+def test_generator_uses_a_broken_template_as_typed(capsys):
+    prompt = fpg.PromptGenerator(4).generate_prompt(4, custom="{red|blue sky")[0]
+    assert prompt.startswith("{red|blue sky")
+    assert "Unclosed '{'" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("name", ["custom", "subject"])
+def test_escapes_are_removed_from_static_inputs(name):
+    # Same text with and without a dynamic part elsewhere in it
+    prompt = fpg.PromptGenerator(1).generate_prompt(1, **{name: r"a \{literal\} brace \| bar"})[2]
+    assert r"a {literal} brace | bar" in prompt and "\\" not in prompt
+    prompt = fpg.PromptGenerator(1).generate_prompt(1, **{name: r"a \{literal\} brace {x|x}"})[2]
+    assert "a {literal} brace x" in prompt
+    assert fpg.PromptSpec.compile({name: r"\_\_artist\_\_"}).templates == {}
+
+
+def test_numpy_engine_expands_templates():
+    pytest.importorskip("numpy")
+    import vectorized_sampler
+    generator = vectorized_sampler.VectorizedPromptGenerator(2)
+    kwargs = {"custom": "{red|blue} sky", "subject": "a portrait by __artist__", "lighting": "random"}
+    prompts = generator.generate_batch(range(60), **kwargs)[0]
+    assert not any("{" in prompt or "__" in prompt for prompt in prompts)
+    assert {"red sky" in prompt for prompt in prompts} == {True, False}
+    assert generator.generate_batch(range(30, 60), **kwargs)[0] == prompts[30:] # Rows depend on (seed, index) only
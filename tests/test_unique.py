@@ -0,0 +1,44 @@
+# tests/test_unique.py
+import pytest
+
+import flux_prompt_generator as fpg
+from sampling import FeistelPermutation
+
+# Every other category off, so the space is small enough to walk in full
+INPUTS = dict({category: "disabled" for category in fpg.vocabulary.CATEGORIES}, age_group="random", eye_colors="random")
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 17, 1000, 4097])
+def test_feistel_permutation_is_a_bijection(size):
+    permutation = FeistelPermutation(size, seed=42)
+    assert sorted(permutation[index] for index in range(size)) == list(range(size))
+
+
+def test_feistel_permutation_depends_on_seed_and_tweak():
+    orders = {tuple(FeistelPermutation(100, seed, tweak)[index] for index in range(100))
+              for seed, tweak in ((1, 0), (2, 0), (1, 1))}
+    assert len(orders) == 3
+
+
+def test_count_combinations():
+    generator = fpg.PromptGenerator(0, rng_mode="unique")
+    size = len(fpg.VOCABULARY["age_group"]) * len(fpg.VOCABULARY["eye_colors"])
+    assert generator.count_combinations(**INPUTS) == size
+    assert generator.count_combinations(**dict(INPUTS, eye_colors="violet")) == len(fpg.VOCABULARY["age_group"])
+
+
+def test_every_combination_once_per_pass():
+    generator = fpg.PromptGenerator(0, rng_mode="unique")
+    size = generator.count_combinations(**INPUTS)
+    prompts = generator.generate_batch(range(2 * size), **INPUTS)[0]
+    first_pass, second_pass = prompts[:size], prompts[size:]
+    assert len(set(first_pass)) == size
+    assert set(second_pass) == set(first_pass) and second_pass != first_pass # Another order
+    # Any position gives the same prompt on its own
+    assert fpg.PromptGenerator(0, rng_mode="unique").generate_batch([size - 1], **INPUTS)[0] == [first_pass[-1]]
+
+
+def test_walk_order_depends_on_the_generator_seed():
+    first = fpg.PromptGenerator(1, rng_mode="unique").generate_batch(range(50), **INPUTS)[0]
+    second = fpg.PromptGenerator(2, rng_mode="unique").generate_batch(range(50), **INPUTS)[0]
+    assert first != second
@@ -0,0 +1,48 @@
+# tests/test_vectorized.py
+import pytest
+
+import flux_prompt_generator as fpg
+import vectorized_sampler
+
+pytest.importorskip("numpy") # vectorized_sampler imports without it, but cannot generate
+
+INPUTS = {"artform": "random", "photo_type": "random", "artist": "random", "lighting": "random",
+          "clothing": "random", "eye_colors": "random", "place": "random"}
+
+
+def test_rows_depend_on_the_prompt_index_only():
+    generator = vectorized_sampler.VectorizedPromptGenerator(11)
+    start, end = 20, 60
+    batch = generator.generate_batch(range(start, end), **INPUTS)
+    for index in (start, 37, end - 1):
+        single = generator.generate_batch([index], **INPUTS)
+        assert [column[0] for column in single[:4]] == [column[index - start] for column in batch[:4]]
+    # Several runs, out of order: each run is its own advanced matrix
+    seeds = [45, 21, 22, 23, 59, 30]
+    scattered = generator.generate_batch(seeds, **INPUTS)
+    assert scattered[0] == [batch[0][seed - start] for seed in seeds]
+    assert scattered[4] == seeds
+
+
+def test_changing_one_input_keeps_the_other_columns():
+    generator = vectorized_sampler.VectorizedPromptGenerator(5)
+    draws = generator.draw_matrix(0, 200)
+    base = generator.resolve_columns(draws, fpg.PromptSpec.compile(INPUTS))
+    for name, value in (("artist", "Alan Lee"), ("clothing", "disabled"), ("place", "disabled"), ("age_group", "disabled")):
+        changed = generator.resolve_columns(draws, fpg.PromptSpec.compile(dict(INPUTS, **{name: value})))
+        assert {category for category in base if changed[category] != base[category]} == {name}
+
+
+def test_lighting_picks_are_distinct():
+    generator = vectorized_sampler.VectorizedPromptGenerator(3)
+    spec = fpg.PromptSpec.compile({"lighting": "random"})
+    lighting = spec.categories["lighting"]
+    assert lighting.alias_table is None and lighting.mode == "multiple"
+    low, high = lighting.count_range
+    column = generator.resolve_columns(generator.draw_matrix(0, 2000), spec)["lighting"]
+    counts = set()
+    for value in column:
+        picks = value.split(", ")
+        assert len(set(picks)) == len(picks) and set(picks) <= set(lighting.options)
+        counts.add(len(picks))
+    assert counts == set(range(low, high + 1))
@@ -0,0 +1,53 @@
+# tests/test_weights.py
+import json
+import random
+from collections import Counter
+
+import pytest
+
+import flux_prompt_generator as fpg
+from sampling import AliasTable
+from vocabulary import split_weights
+
+INPUTS = dict({category: "disabled" for category in fpg.vocabulary.CATEGORIES}, eye_colors="random")
+
+
+def test_alias_table_frequencies():
+    table = AliasTable([1, 0, 3])
+    rng = random.Random(0)
+    counts = Counter(table.draw(rng) for _ in range(40000))
+    assert counts[1] == 0
+    assert counts[2] / counts[0] == pytest.approx(3, rel=0.05)
+
+
+def test_alias_table_sample_is_distinct_and_skips_zero_weights():
+    table = AliasTable([1, 0, 3, 2])
+    rng = random.Random(1)
+    for _ in range(500):
+        picks = table.sample(rng, 4)
+        assert sorted(picks) == [0, 2, 3]
+    assert sorted(table.sample_with_uniforms([0.99, 0.0, 0.5, 0.5])) == [0, 2, 3]
+
+
+def test_alias_table_rejects_bad_weights():
+    for weights in ([], [0, 0], [1, -1]):
+        with pytest.raises(ValueError):
+            AliasTable(weights)
+
+
+def test_split_weights():
+    assert split_weights(["a", "b"]) == (["a", "b"], None)
+    assert split_weights(["a", {"value": "b", "weight": 3}, "a"]) == (["a", "b"], (1.0, 3.0))
+    assert split_weights(["a", "b"], {"b": 0, "c": 5}) == (["a", "b"], (1.0, 0.0))
+
+
+@pytest.mark.parametrize("rng_mode", ["legacy", "counter"])
+def test_weights_file_sets_draw_frequencies(data_dir, rng_mode):
+    (data_dir / "weights.json").write_text(json.dumps({"eye_colors": {"blue": 30, "amber": 0}}), encoding="utf-8")
+    entries = fpg.VOCABULARY["eye_colors"]
+    prompts = fpg.PromptGenerator(rng_mode=rng_mode).generate_batch(range(4000), **INPUTS)[0]
+    counts = Counter(prompts)
+    assert counts[". They have amber eyes"] == 0
+    # blue weighs 30, every other entry but amber 1
+    share = counts[". They have blue eyes"] / len(prompts)
+    assert share == pytest.approx(30 / (30 + len(entries) - 2), rel=0.1)
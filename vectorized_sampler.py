@@ -0,0 +1,211 @@
+# vectorized_sampler.py
+"""Vectorized NumPy sampling engine for large prompt batches.
+
+Instead of one ``random.Random`` call per category per prompt, all draws for
+a batch are taken at once as a float matrix (one row per prompt, one column
+per category slot), turned into integer index columns, and only then are the
+strings assembled with the regular ``PromptGenerator`` code.
+
+Seeding scheme
+--------------
+The stream is ``numpy.random.PCG64(numpy.random.SeedSequence(seed))``.
+Every prompt index ``i`` owns exactly ``SLOT_COUNT`` consecutive doubles of
+that stream, ``[i * SLOT_COUNT, (i + 1) * SLOT_COUNT)``, one per entry of
+``SLOTS``. Because each double consumes one 64-bit PCG64 output, any row can
+be reached with ``PCG64.advance`` without drawing the rows before it, so:
+
+* prompt ``i`` only depends on ``(seed, i)`` and the config, never on the
+  batch size or on which other rows were requested;
+* the slot layout is fixed, so changing one category's input never shifts the
+  draws used by the others.
+
+An index into a list of ``n`` entries is ``floor(u * n)``; weighted categories
+use the same ``u`` on their alias table. This engine is not
+stream-compatible with the ``random.Random`` path: the same seed yields
+different (but equally distributed) prompts.
+
+With rules (data/rules.json, opt-in), each row is checked in the order
+``PromptGenerator`` draws its categories; a value the earlier ones ban is drawn
+again among the allowed entries from the row's ``sampling.CounterRNG`` stream,
+keyed by the seed sequence's entropy and the prompt index. Rows without a
+banned value keep their draws.
+
+Templates in custom and subject are expanded per row from the same
+``sampling.CounterRNG`` streams (one per input), after the rules, so they do not
+change the category draws either.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from . import flux_prompt_generator as fpg
+    from . import rules, sampling
+except ImportError:  # Loaded as a top-level module (scripts, benchmarks)
+    import flux_prompt_generator as fpg
+    import rules
+    import sampling
+
+
+# Fixed column layout of the draw matrix. Do not reorder: it is part of the seeding scheme.
+SLOTS = (
+    "artform", "photo_type", "photography_styles", "default_tags", "body_types",
+    "roles", "hairstyles", "additional_details", "clothing", "composition", "pose",
+    "background", "place", "lighting", "face_features", "eye_colors", "skin_tone",
+    "age_group", "ethnicity", "accessories", "expression", "tattoos_scars",
+    "hair_color", "body_markings", "facial_hair", "makeup_styles", "device",
+    "digital_artform", "photographer", "artist",
+    # Extra slots for the random 2-4 lighting pick and the CLIP_L photo_type weight
+    "lighting_count", "lighting_pick_1", "lighting_pick_2", "lighting_pick_3", "lighting_pick_4",
+    "photo_weight",
+)
+SLOT_COUNT = len(SLOTS)
+_COLUMN = {name: index for index, name in enumerate(SLOTS)}
+
+LIGHTING_MAX = 4 # Number of lighting_pick slots
+
+
+class VectorizedPromptGenerator(fpg.PromptGenerator):
+    """PromptGenerator whose batch path draws all category indices with NumPy."""
+
+    def __init__(self, seed=None):
+        if np is None:
+            raise ImportError("VectorizedPromptGenerator requires numpy (pip install numpy)")
+        super().__init__(seed)
+        self.seed_sequence = np.random.SeedSequence(seed)
+
+    def draw_matrix(self, start, count):
+        """Returns the (count, SLOT_COUNT) uniform draws for prompt indices start..start+count-1."""
+        bit_generator = np.random.PCG64(self.seed_sequence)
+        bit_generator.advance(start * SLOT_COUNT)
+        return np.random.Generator(bit_generator).random((count, SLOT_COUNT))
+
+    def sample_indices(self, draws, category, size):
+        """Maps one slot column of the draw matrix to integer indices in [0, size)."""
+        return (draws[:, _COLUMN[category]] * size).astype(np.int64)
+
+    def alias_indices(self, draws, category, alias_table):
+        """Vectorized AliasTable.draw: one slot column to weighted indices."""
+        position = draws[:, _COLUMN[category]] * alias_table.size
+        index = np.minimum(position.astype(np.int64), alias_table.size - 1)
+        keep = (position - index) < np.asarray(alias_table.probability)[index]
+        return np.where(keep, index, np.asarray(alias_table.alias)[index])
+
+    def _choice_column(self, draws, category):
+        """Vectorized equivalent of drawing one CategorySpec for a whole column."""
+        count = draws.shape[0]
+        if category.sampler is None:
+            return [category.value] * count
+        options = category.options
+        if category.alias_table is not None:
+            return [options[i] for i in self.alias_indices(draws, category.name, category.alias_table).tolist()]
+        return [options[i] for i in self.sample_indices(draws, category.name, len(options)).tolist()]
+
+    def _lighting_column(self, draws, lighting):
+        """Random 2-4 lighting terms without replacement, or a regular choice column."""
+        if lighting.mode != "multiple":
+            return self._choice_column(draws, lighting)
+
+        options = lighting.options
+        population = len(options)
+        min_count, max_count = lighting.count_range
+        counts = min_count + self.sample_indices(draws, "lighting_count", max_count - min_count + 1)
+        counts = np.minimum(counts, population)
+
+        if lighting.alias_table is not None:
+            # Weighted: per row, each pick slot is one inverse-CDF draw over the entries left
+            pick_columns = [_COLUMN[f"lighting_pick_{k + 1}"] for k in range(LIGHTING_MAX)]
+            pick_rows = draws[:, pick_columns].tolist()
+            return [", ".join(options[i] for i in lighting.alias_table.sample_with_uniforms(row[:n]))
+                    for row, n in zip(pick_rows, counts.tolist())]
+
+        # Sequential sampling without replacement: pick k draws from the n - k
+        # remaining entries, then shift it past every earlier pick (in ascending order).
+        picks = []
+        for k in range(min(LIGHTING_MAX, population)):
+            index = self.sample_indices(draws, f"lighting_pick_{k + 1}", population - k)
+            if picks:
+                for previous in np.sort(np.stack(picks, axis=1), axis=1).T:
+                    index += index >= previous
+            picks.append(index)
+
+        pick_rows = np.stack(picks, axis=1).tolist()
+        return [", ".join(options[i] for i in row[:n]) for row, n in zip(pick_rows, counts.tolist())]
+
+    def resolve_columns(self, draws, spec):
+        """Resolves every category of a PromptSpec for the whole batch at once. Returns {category: list of values}."""
+        columns = {}
+        for category in SLOTS[:_COLUMN["lighting_count"]]:
+            if category == "lighting":
+                columns[category] = self._lighting_column(draws, spec.categories[category])
+            else:
+                columns[category] = self._choice_column(draws, spec.categories[category])
+        weights = (1.1 + 0.4 * draws[:, _COLUMN["photo_weight"]]).tolist()
+        columns["photo_weight"] = [round(weight, 1) for weight in weights]
+        return columns
+
+    def apply_rules(self, columns, spec, start):
+        """Replaces the values spec.rules bans in resolved columns, for prompt indices start, start + 1, ..."""
+        categories = spec.categories
+        for row in range(len(columns["artform"])):
+            streams = sampling.CounterRNG(self.seed_sequence.entropy, start + row)
+            draw = rules.ConstrainedDraw(spec.rules, streams.stream, spec.rule_bans)
+            for name in _drawn_categories(columns, row, spec.has_subject):
+                columns[name][row] = draw.accept(categories[name], columns[name][row])
+
+    def expand_templates(self, columns, spec, start):
+        """Adds custom and subject columns for spec.templates, for prompt indices start, start + 1, ..."""
+        rows = range(start, start + len(columns["artform"]))
+        for name, template in spec.templates.items():
+            columns[name] = [template.expand(sampling.CounterRNG(self.seed_sequence.entropy, index).stream(name), spec.template_lists)
+                             for index in rows]
+
+    def generate_batch(self, seeds, **kwargs):
+        """Generates one prompt per prompt index in ``seeds`` (see the module seeding scheme).
+
+        Returns (prompts, t5xxl, clip_l, clip_g, seeds) as parallel lists, like
+        PromptGenerator.generate_batch.
+        """
+        seeds = list(seeds)
+        spec = fpg.PromptSpec.compile(kwargs)
+        prompts, t5xxl_column, clip_l_column, clip_g_column = [], [], [], []
+
+        # Draw each run of consecutive indices as one matrix
+        run_start = 0
+        while run_start < len(seeds):
+            run_end = run_start + 1
+            while run_end < len(seeds) and seeds[run_end] == seeds[run_end - 1] + 1:
+                run_end += 1
+
+            columns = self.resolve_columns(self.draw_matrix(seeds[run_start], run_end - run_start), spec)
+            if spec.rules is not None:
+                self.apply_rules(columns, spec, seeds[run_start])
+            if spec.templates:
+                self.expand_templates(columns, spec, seeds[run_start])
+            keys = list(columns)
+            for values in zip(*columns.values()):
+                prompt, t5xxl_clean, clip_l_clean, clip_g_clean = self._render_row(dict(zip(keys, values)), spec)
+                prompts.append(prompt)
+                t5xxl_column.append(t5xxl_clean)
+                clip_l_column.append(clip_l_clean)
+                clip_g_column.append(clip_g_clean)
+            run_start = run_end
+
+        return prompts, t5xxl_column, clip_l_column, clip_g_column, seeds
+
+
+def _drawn_categories(columns, row, has_subject):
+    """Categories of one row in the order PromptGenerator._resolve_choices draws them; reads the row as it is updated."""
+    yield "artform"
+    yield "photo_type"
+    if columns["artform"][row].lower() == "photography":
+        yield "photography_styles"
+    if not has_subject:
+        yield "default_tags"
+    if has_subject or columns["default_tags"][row]:
+        yield "body_types"
+    yield from fpg._DRAW_ORDER
+    yield "digital_artform"
+    yield "photographer"
+    yield "artist"
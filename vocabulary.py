@@ -0,0 +1,543 @@
+# vocabulary.py
+"""Lazily loaded vocabulary lists for the prompt generator.
+
+Each category list lives in ``data/<category>.json``. Nothing is read at import
+time: a category is loaded the first time it is accessed. Once every category
+has been loaded, the lists are written to a marshal snapshot keyed by checksums of
+the ``data/`` contents, so the next process can skip JSON parsing entirely as
+long as the files have not changed.
+
+For multi-process deployments, ``build_bundle`` packs every category into one
+binary file (a UTF-8 blob plus per-category offset tables). When a current
+bundle exists it is memory-mapped instead: worker processes share its pages,
+and an entry is only decoded into a ``str`` when it is indexed. Build it with
+``python vocabulary.py build``. The JSON files stay the source of truth; a
+stale or missing bundle falls back to the snapshot/JSON path.
+
+The files can be edited while the generator runs. ``reload()`` compares the
+mtime and size of every file read so far with what was read, re-parses only the
+categories that changed (all of them outside the registry lock) and then swaps
+them in at once. Lists are never mutated in place, so a generation that already
+holds the old list finishes with it. Listeners registered with
+``add_listener`` are called with the changed categories, to drop whatever was
+derived from them.
+
+Entries are drawn uniformly unless they have weights. A weight is set either
+in the category file, by writing the entry as ``{"value": "...", "weight": 3}``,
+or in ``data/weights.json`` as ``{"<category>": {"<entry>": <weight>}}``; the
+sidecar wins, and unlisted entries weigh 1. Weighted categories get a
+``sampling.AliasTable`` when they load.
+
+``index(category)`` returns a ``lookup.CategoryIndex`` of a list, for
+validating, completing and canonicalizing input values.
+
+``data/rules.json``, when present, holds exclusion and implication rules
+between entries (see ``rules.py``; ``data/rules.example.json`` is a starting
+point); ``rules()`` compiles them against the loaded lists.
+"""
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections.abc import Sequence
+
+try:
+    from . import lookup
+    from . import rules as rules_module
+    from . import sampling
+except ImportError:  # Loaded as a top-level module (scripts, benchmarks)
+    import lookup
+    import rules as rules_module
+    import sampling
+
+# Every category list used by the generator; each one is loaded from data/<name>.json
+CATEGORIES = (
+    "artform", "accessories", "additional_details", "age_group", "artist",
+    "background", "body_markings", "body_types", "clothing", "composition",
+    "default_tags", "device", "digital_artform", "ethnicity", "expression",
+    "eye_colors", "face_features", "facial_hair", "hair_color", "hairstyles",
+    "lighting", "makeup_styles", "photo_type", "photographer", "photography_styles",
+    "place", "pose", "roles", "skin_tone", "tattoos_scars",
+)
+
+SNAPSHOT_FILE_NAME = ".vocabulary.snapshot"
+BUNDLE_FILE_NAME = "vocabulary.bundle"
+WEIGHTS_FILE_NAME = "weights.json"
+
+# Bundle layout (little endian):
+#   magic, u32 format, u32 key length, key (marshal of the data fingerprint), u32 category count
+#   per category: u16 name length, name, u32 entry count, u64 offset-table position, u64 weight-table position (0: unweighted)
+#   per category offset table: (entry count + 1) u64 absolute positions into the blob
+#   per weighted category: entry count f64 weights
+#   blob: every entry, UTF-8 encoded, back to back
+_BUNDLE_MAGIC = b"FPGVOCAB"
+_BUNDLE_FORMAT = 2
+
+# Bump when the snapshot payload layout changes
+_SNAPSHOT_FORMAT = 2
+
+
+def category_file_name(category):
+    return f"{category}.json"
+
+
+def split_weights(values, overrides=None):
+    """Splits loaded entries into (list of str, weights tuple or None).
+
+    Entries are strings or ``{"value": str, "weight": number}`` objects;
+    ``overrides`` maps entry text to a weight and takes precedence. Weights are
+    None when no entry has one, so unweighted categories keep uniform draws.
+    """
+    weights = {}
+    for entry in values:
+        if isinstance(entry, dict):
+            try:
+                value, weight = str(entry["value"]), float(entry.get("weight", 1))
+            except (KeyError, TypeError, ValueError):
+                print(f"Warning: Skipping malformed vocabulary entry {entry!r}")
+                continue
+        else:
+            value, weight = entry, None
+        if value not in weights or weight is not None:
+            weights[value] = weight
+    for value, weight in (overrides or {}).items():
+        if value in weights:
+            weights[value] = float(weight)
+    if all(weight is None for weight in weights.values()):
+        return list(weights), None
+    return list(weights), tuple(1.0 if weight is None else max(weight, 0.0) for weight in weights.values())
+
+
+class MappedCategory(Sequence):
+    """Read-only view of one category inside a memory-mapped bundle.
+
+    Entries are decoded on access, so only the strings that are actually
+    sampled become Python objects.
+    """
+
+    __slots__ = ("name", "_buffer", "_table", "_count")
+
+    def __init__(self, name, buffer, table, count):
+        self.name = name
+        self._buffer = buffer
+        self._table = table
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("vocabulary index out of range")
+        start, end = struct.unpack_from("<2Q", self._buffer, self._table + 8 * index)
+        return self._buffer[start:end].decode("utf-8")
+
+    def __repr__(self):
+        return f"<MappedCategory {self.name!r} ({self._count} entries)>"
+
+
+def build_bundle(categories, key, bundle_path, weights=None):
+    """Writes ``{category: list of str}`` (and ``{category: weights}``) to a bundle file tagged with ``key``."""
+    weights = weights or {}
+    key_bytes = marshal.dumps(key)
+    names = [name.encode("utf-8") for name in categories]
+    encoded = [[entry.encode("utf-8") for entry in entries] for entries in categories.values()]
+    category_weights = [weights.get(category) for category in categories]
+
+    header_size = len(_BUNDLE_MAGIC) + 4 + 4 + len(key_bytes) + 4
+    header_size += sum(2 + len(name) + 4 + 8 + 8 for name in names)
+    table_positions = []
+    position = header_size
+    for entries in encoded:
+        table_positions.append(position)
+        position += 8 * (len(entries) + 1)
+    weight_positions = []
+    for values in category_weights:
+        weight_positions.append(position if values else 0)
+        position += 8 * len(values) if values else 0
+
+    header = [_BUNDLE_MAGIC, struct.pack("<II", _BUNDLE_FORMAT, len(key_bytes)), key_bytes, struct.pack("<I", len(names))]
+    for name, entries, table_position, weight_position in zip(names, encoded, table_positions, weight_positions):
+        header.append(struct.pack("<H", len(name)) + name + struct.pack("<IQQ", len(entries), table_position, weight_position))
+
+    tables = []
+    blob_position = position
+    for entries in encoded:
+        offsets = [blob_position]
+        for entry in entries:
+            blob_position += len(entry)
+            offsets.append(blob_position)
+        tables.append(struct.pack(f"<{len(offsets)}Q", *offsets))
+
+    temp_path = f"{bundle_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(b"".join(header))
+        file.write(b"".join(tables))
+        file.write(b"".join(struct.pack(f"<{len(values)}d", *values) for values in category_weights if values))
+        for entries in encoded:
+            file.write(b"".join(entries))
+    os.replace(temp_path, bundle_path)
+
+
+def open_bundle(bundle_path, key):
+    """Memory-maps a bundle. Returns (mmap, {category: MappedCategory}, {category: weights}), or None if missing or stale."""
+    try:
+        with open(bundle_path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic_size = len(_BUNDLE_MAGIC)
+        if buffer[:magic_size] != _BUNDLE_MAGIC:
+            raise ValueError("not a vocabulary bundle")
+        bundle_format, key_size = struct.unpack_from("<II", buffer, magic_size)
+        position = magic_size + 8
+        if bundle_format != _BUNDLE_FORMAT or buffer[position:position + key_size] != marshal.dumps(key):
+            raise ValueError("stale vocabulary bundle")
+        position += key_size
+
+        (category_count,) = struct.unpack_from("<I", buffer, position)
+        position += 4
+        categories = {}
+        weights = {}
+        for _ in range(category_count):
+            (name_size,) = struct.unpack_from("<H", buffer, position)
+            name = buffer[position + 2:position + 2 + name_size].decode("utf-8")
+            position += 2 + name_size
+            count, table_position, weight_position = struct.unpack_from("<IQQ", buffer, position)
+            position += 20
+            categories[name] = MappedCategory(name, buffer, table_position, count)
+            if weight_position:
+                weights[name] = struct.unpack_from(f"<{count}d", buffer, weight_position)
+    except (ValueError, struct.error):
+        buffer.close()
+        return None
+    return buffer, categories, weights
+
+
+class VocabularyRegistry:
+    """Loads category lists on first access, backed by an on-disk snapshot or bundle.
+
+    ``loader`` parses one file name (relative to ``data_dir``) into a list and
+    stays the source of truth; the bundle and the snapshot only cache its results.
+    """
+
+    def __init__(self, data_dir, loader, snapshot_path=None, bundle_path=None, reload_interval=None):
+        self.data_dir = data_dir
+        self.loader = loader
+        self.snapshot_path = snapshot_path or os.path.join(data_dir, SNAPSHOT_FILE_NAME)
+        self.bundle_path = bundle_path or os.path.join(data_dir, BUNDLE_FILE_NAME)
+        self.weights_path = os.path.join(data_dir, WEIGHTS_FILE_NAME)
+        self.rules_path = os.path.join(data_dir, rules_module.RULES_FILE_NAME)
+        self._rules = None # Compiled rules_module.RuleSet, or False when there are none
+        self._lists = {}
+        self._weights = {} # Weighted categories only
+        self._alias_tables = {}
+        self._indexes = {} # lookup.CategoryIndex per category, built on first use
+        self._weight_overrides = None # Parsed weights.json
+        self._lock = threading.Lock()
+        self._snapshot_checked = False
+        self._fingerprint = None
+        self._bundle = None # mmap backing MappedCategory lists, kept open for the registry's lifetime
+        # Hot reload: (mtime_ns, size) of every file as it was read, taken before reading it
+        self._stats = {}
+        self.generation = 0 # Bumped by every reload that changed something
+        self._sequence = 0 # Odd while a reload is swapping lists in (see category())
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self.reload_interval = reload_interval # Seconds between check_for_changes() checks; None disables them
+        self._next_check = 0.0
+
+    def __getitem__(self, category):
+        try:
+            return self._lists[category]
+        except KeyError:
+            return self._load(category)
+
+    def __contains__(self, category):
+        return category in CATEGORIES
+
+    def is_loaded(self, category):
+        return category in self._lists
+
+    def weights(self, category):
+        """Per-entry weights of a category, or None when it is drawn uniformly."""
+        self[category]
+        return self._weights.get(category)
+
+    def alias_table(self, category):
+        """sampling.AliasTable of a loaded category, or None when it is drawn uniformly."""
+        return self._alias_tables.get(category)
+
+    def index(self, category):
+        """lookup.CategoryIndex of a category's current list."""
+        values = self[category]
+        index = self._indexes.get(category)
+        if index is None or index.values is not values: # Built for a list a reload has replaced
+            index = self._indexes[category] = lookup.CategoryIndex(values)
+        return index
+
+    def rules(self):
+        """rules_module.RuleSet compiled against the current lists, or None without a rules file."""
+        rules = self._rules
+        if rules is None:
+            with self._lock:
+                self._stats[rules_module.RULES_FILE_NAME] = self._stat(rules_module.RULES_FILE_NAME)
+            data = rules_module.load_rules(self.rules_path) if self.rules_path else None
+            rules = False
+            if data is not None:
+                # Every category a rule names, loaded before taking the lock
+                lists = {category: self[category] for category in CATEGORIES}
+                rules = rules_module.RuleSet(data, lists)
+            self._rules = rules
+        return rules or None
+
+    def use_rules(self, path):
+        """Reads the rules from path from now on; None turns them off (prompts as without a rules file)."""
+        with self._reload_lock:
+            with self._lock:
+                self.rules_path = path
+                self._rules = None
+                self.generation += 1
+            for callback in self._listeners:
+                callback(set())
+
+    def category(self, category):
+        """(list, alias table or None) of a category, both from the same reload."""
+        while True:
+            sequence = self._sequence
+            values = self[category]
+            alias_table = self._alias_tables.get(category)
+            if sequence == self._sequence and not sequence & 1:
+                return values, alias_table
+            time.sleep(0) # A reload is swapping lists in; let it finish
+
+    def load_all(self):
+        """Loads every category (from the snapshot when it is current) and returns them as a dict."""
+        for category in CATEGORIES:
+            self[category]
+        return dict(self._lists)
+
+    def fingerprint(self):
+        """Key of the current data/ contents: (file name, size, CRC32) per category file and weights.json.
+
+        CRC32 is used rather than hashlib because importing OpenSSL costs more
+        than the JSON parsing the snapshot saves.
+        """
+        if self._fingerprint is None:
+            entries = [(_SNAPSHOT_FORMAT, marshal.version, tuple(sys.version_info[:2]))]
+            for file_name in [category_file_name(category) for category in CATEGORIES] + [WEIGHTS_FILE_NAME]:
+                self._stats.setdefault(file_name, self._stat(file_name)) # Keep the stat of a file already parsed
+                try:
+                    with open(os.path.join(self.data_dir, file_name), "rb") as file:
+                        content = file.read()
+                    entries.append((file_name, len(content), zlib.crc32(content)))
+                except OSError:
+                    entries.append((file_name, -1, 0))
+            self._fingerprint = tuple(entries)
+        return self._fingerprint
+
+    def _load(self, category):
+        if category not in CATEGORIES:
+            raise KeyError(f"Unknown vocabulary category: {category}")
+        with self._lock:
+            if category in self._lists: # Loaded by another thread meanwhile
+                return self._lists[category]
+            if not self._snapshot_checked:
+                self._snapshot_checked = True
+                if not self._map_bundle():
+                    self._read_snapshot()
+                if category in self._lists:
+                    return self._lists[category]
+
+            values = self._parse(category)
+            if len(self._lists) == len(CATEGORIES) and self._bundle is None:
+                self._write_snapshot()
+            return values
+
+    def _parse(self, category):
+        """Loads one category from JSON, splitting off its weights."""
+        values, weights = self._read(category)
+        self._lists[category] = values
+        self._set_weights(category, weights)
+        return values
+
+    def _read(self, category):
+        """(list, weights) of one category, parsed from its file; records the file's stat first."""
+        file_name = category_file_name(category)
+        self._stats[file_name] = self._stat(file_name)
+        return split_weights(self.loader(file_name), self._overrides().get(category))
+
+    def _stat(self, file_name):
+        try:
+            stat = os.stat(os.path.join(self.data_dir, file_name))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def add_listener(self, callback):
+        """Calls callback(set of categories) after every reload that changed a category or the rules."""
+        self._listeners.append(callback)
+
+    def changed_files(self):
+        """Files read so far whose mtime or size differs from when they were read."""
+        return [file_name for file_name, stat in list(self._stats.items()) if self._stat(file_name) != stat]
+
+    def check_for_changes(self):
+        """reload(), but at most once per reload_interval seconds (never when it is None)."""
+        if self.reload_interval is None:
+            return set()
+        now = time.monotonic()
+        if now < self._next_check:
+            return set()
+        self._next_check = now + self.reload_interval
+        return self.reload()
+
+    def reload(self):
+        """Re-parses the loaded categories whose file (or weights.json entry) changed and swaps them in.
+
+        Returns the set of changed categories. Categories that were never
+        loaded are not parsed; they load the current file when first accessed.
+        """
+        with self._reload_lock:
+            changed_files = self.changed_files()
+            if not changed_files:
+                return set()
+            categories = {category for category in CATEGORIES
+                          if category in self._lists and category_file_name(category) in changed_files}
+            rules_changed = rules_module.RULES_FILE_NAME in changed_files
+            if WEIGHTS_FILE_NAME in changed_files:
+                old_overrides = self._overrides()
+                self._weight_overrides = None
+                new_overrides = self._overrides()
+                categories.update(category for category in self._lists if old_overrides.get(category) != new_overrides.get(category))
+            for file_name in changed_files: # Files of unloaded categories: nothing to re-parse
+                self._stats[file_name] = self._stat(file_name)
+
+            parsed = {category: self._read(category) for category in categories}
+            with self._lock:
+                self._sequence += 1
+                for category, (values, weights) in parsed.items():
+                    self._lists[category] = values
+                    self._set_weights(category, weights)
+                self._fingerprint = None
+                if categories or rules_changed: # Rule bitsets index into the lists
+                    self._rules = None
+                self._sequence += 1
+                if categories or rules_changed:
+                    self.generation += 1
+                if len(self._lists) == len(CATEGORIES) and self._bundle is None:
+                    self._write_snapshot()
+
+        if categories or rules_changed:
+            for callback in self._listeners:
+                callback(categories)
+        return categories
+
+    def _overrides(self):
+        if self._weight_overrides is None:
+            self._weight_overrides = {}
+            self._stats[WEIGHTS_FILE_NAME] = self._stat(WEIGHTS_FILE_NAME)
+            try:
+                with open(self.weights_path, "r", encoding="utf-8") as file:
+                    overrides = json.load(file)
+            except FileNotFoundError:
+                return self._weight_overrides
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read vocabulary weights from {self.weights_path}: {e}")
+                return self._weight_overrides
+            if isinstance(overrides, dict):
+                self._weight_overrides = {category: entries for category, entries in overrides.items() if isinstance(entries, dict)}
+            else:
+                print(f"Warning: Expected an object in {self.weights_path}, ignoring it.")
+        return self._weight_overrides
+
+    def _set_weights(self, category, weights):
+        if weights is not None:
+            try:
+                self._alias_tables[category] = sampling.AliasTable(weights)
+            except ValueError:
+                print(f"Warning: Every weight of vocabulary category {category} is 0, drawing it uniformly.")
+                weights = None
+        if weights is None:
+            self._weights.pop(category, None)
+            self._alias_tables.pop(category, None)
+        else:
+            self._weights[category] = weights
+
+    def build_bundle(self):
+        """Packs every category, parsed fresh from JSON, into the bundle file."""
+        lists, weights = {}, {}
+        for category in CATEGORIES:
+            lists[category], weights[category] = split_weights(self.loader(category_file_name(category)), self._overrides().get(category))
+        build_bundle(lists, self.fingerprint(), self.bundle_path, weights)
+
+    def _map_bundle(self):
+        opened = open_bundle(self.bundle_path, self.fingerprint())
+        if opened is None:
+            return False
+        self._bundle, categories, weights = opened
+        for name, values in categories.items():
+            if name in CATEGORIES:
+                self._lists[name] = values
+                self._set_weights(name, weights.get(name))
+        return True
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_path, "rb") as file:
+                key, lists, weights = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        if key == self.fingerprint() and isinstance(lists, dict) and set(lists) == set(CATEGORIES):
+            self._lists.update(lists)
+            for category, values in weights.items():
+                self._set_weights(category, values)
+
+    def _write_snapshot(self):
+        # Write to a temporary file and rename, so readers never see a partial snapshot
+        temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                marshal.dump((self.fingerprint(), self._lists, self._weights), file)
+            os.replace(temp_path, self.snapshot_path)
+        except (OSError, ValueError) as e:
+            # A read-only install simply runs without a snapshot
+            print(f"Warning: Could not write vocabulary snapshot to {self.snapshot_path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vocabulary bundle tools")
+    parser.add_argument("command", choices=["build"], help="build: pack data/*.json into data/" + BUNDLE_FILE_NAME)
+    parser.parse_args()
+
+    try:
+        import flux_prompt_generator
+    except ImportError:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import flux_prompt_generator
+
+    registry = flux_prompt_generator.VOCABULARY
+    registry.build_bundle()
+    size = os.path.getsize(registry.bundle_path)
+    print(f"Wrote {registry.bundle_path} ({len(CATEGORIES)} categories, {size} bytes)")
+
+
+if __name__ == "__main__":
+    main()